@@ -51,6 +51,11 @@ def create_app(config_name=None):
                 static_folder='../static')
     app.config.from_object(config_by_name[config_name]) # Load chosen config
 
+    # Bounded, instrumented connection pools (see app/pools.py); explicit SQLALCHEMY_ENGINE_OPTIONS win
+    from . import pools
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**pools.engine_options(app.config),
+                                               **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
     # Initialize extensions with the created app instance
     db.init_app(app)
     migrate.init_app(app, db) # Migrate needs both app and db
@@ -60,10 +65,31 @@ def create_app(config_name=None):
     # Initialize SocketIO, getting Redis URL from app config
     # Pass manage_session=False because Flask-Login handles user sessions
     socketio_redis_url = app.config.get('REDIS_URL')
+    # Websocket-only: no long-polling requests that would need to stick to one worker/pod
+    transports = ['websocket'] if app.config.get('SOCKETIO_WEBSOCKET_ONLY') else ['polling', 'websocket']
+    # Wire format (see app/wire.py): 'msgpack' switches packets to binary MessagePack
+    from . import wire
+    socketio_options = {'serializer': wire.serializer(app.config)}
+    if socketio_redis_url:
+        # Same Redis queue, but counts how many sockets each frame fans out to (see app/metrics.py)
+        from .metrics import client_manager
+        socketio_options['client_manager'] = client_manager(socketio_redis_url,
+                                                            redis_options=pools.queue_redis_options(app.config))
     socketio.init_app(app,
                       async_mode='eventlet',
                       message_queue=socketio_redis_url,
-                      manage_session=False)
+                      manage_session=False,
+                      transports=transports,
+                      **socketio_options)
+
+    # Fingerprinted static assets (see app/assets.py): loads the manifest, adds asset_url() to templates
+    from . import assets
+    assets.init_app(app)
+
+    @app.context_processor
+    def inject_socketio_client():
+        # Pages load the Socket.IO client build that matches the server's serializer
+        return {'socketio_client_url': wire.client_script(app.config)}
 
     # --- Initialize App Redis Client (using different DB index) ---
     # Initialize inside factory to ensure config is loaded
@@ -85,9 +111,13 @@ def create_app(config_name=None):
                  redis_app_url_db1 = redis_app_url + '/1'
 
 
-             redis_client = redis.Redis.from_url(redis_app_url_db1, decode_responses=True)
-             redis_client.ping() # Check connection
-             logging.info(f"Connected to App Redis DB ({redis_app_url_db1}) successfully!")
+             # Blocking pool shared by green threads. No PING here: connections open on first use,
+             # so a slow or restarting Redis doesn't hold up boot (app/health.py warms up and reports readiness).
+             # While it is unreachable the circuit breaker keeps calls fast (app/resilience.py)
+             from . import resilience
+             resilience.init_app(app)
+             redis_client = pools.app_redis(redis_app_url_db1, app.config)
+             logging.info(f"App Redis client set up for {redis_app_url_db1} (connects on first use)")
         else:
              logging.error("REDIS_URL or REDIS_APP_DB_URL not found in config.")
              redis_client = None
@@ -108,10 +138,34 @@ def create_app(config_name=None):
     from .main import main as main_blueprint # Import the main blueprint instance HERE
     app.register_blueprint(main_blueprint, url_prefix='/') # Main routes at root
 
+    from .api import api as api_blueprint # JSON endpoints used by the chat page (history pages)
+    app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    from .health import health as health_blueprint # /healthz and /readyz probes
+    app.register_blueprint(health_blueprint)
+
+    from .ops import ops as ops_blueprint # Internal stats/health endpoints
+    app.register_blueprint(ops_blueprint, url_prefix='/ops')
+
+    from .assets import assets as assets_blueprint # Fingerprinted, immutable static assets
+    app.register_blueprint(assets_blueprint, url_prefix='/assets')
+
+    from .metrics import metrics as metrics_blueprint # Prometheus scrape endpoint at /metrics
+    app.register_blueprint(metrics_blueprint)
+
+
+    # --- Register CLI commands (flask chat ...) ---
+    from .commands import chat_cli
+    app.cli.add_command(chat_cli)
 
     # --- Import SocketIO event handlers ---
     # This ensures the @socketio.on decorators are registered. Import AFTER blueprints.
     from . import events 
+    from . import user_cache # Registers its cluster invalidation handler and stats
+
+    # Connect to Redis and the database in the background, retrying until /readyz passes
+    from . import health
+    health.start_warmup(app)
 
     # Return the configured app instance
     return app
@@ -122,10 +176,14 @@ from .models import User # Import User model defined in models.py
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Loads user object from ID stored in session cookie."""
+    """Loads user object from ID stored in session cookie.
+
+    Returns a cached, read-only profile (see app/user_cache.py); this runs on
+    every request and socket event, so it must not hit the database each time.
+    """
+    from . import user_cache # Imported here: needs the Redis client set up by create_app
     try:
-        # Use SQLAlchemy's recommended get method for primary key lookup
-        return db.session.get(User, int(user_id))
+        return user_cache.load(int(user_id))
     except Exception as e:
         logging.error(f"Error loading user {user_id}: {e}")
         return None # Return None if user not found or error occurs
\ No newline at end of file
@@ -0,0 +1,66 @@
+# app/api.py
+"""JSON API for the chat page: older room history, fetched on demand.
+
+Connecting only pushes the newest HISTORY_TAIL_SIZE messages of a room (the
+history_batch frame). The chat page loads anything older as the user scrolls
+up, one page at a time:
+
+    GET /api/rooms/<room>/messages?before=<cursor>&limit=N
+    -> {"room": ..., "messages": [oldest first], "next_cursor": ... or null}
+
+Stream IDs only grow and messages are never edited, so a full page before a
+given cursor can never change. Such pages are sent with
+`Cache-Control: max-age=HISTORY_PAGE_MAX_AGE, immutable`: once the browser
+or an ingress has a page, it never asks again. The newest page (no `before`)
+and the short last page at the start of history may still change; they get
+`no-cache` and are revalidated with their strong ETag (an empty 304 if
+nothing changed). Pages are `private` unless HISTORY_PAGES_PUBLIC is set for
+deployments whose ingress checks the login itself, since every logged-in
+user may read every room but anonymous visitors may not.
+"""
+import hashlib
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import login_required
+
+from . import redis_client
+from . import message_store, rooms, metrics
+from .events import get_message_page, HISTORY_PAGE_MAX
+
+api = Blueprint('api', __name__)
+
+
+@api.route('/rooms/<room>/messages')
+@login_required
+def room_messages(room):
+    """One page of a room's messages older than ?before= (the newest page without it)."""
+    if not rooms.is_valid_room_name(room):
+        return jsonify(error="Invalid room name."), 400
+    if redis_client and not rooms.room_exists(room):
+        return jsonify(error="No such room."), 404
+    cursor = request.args.get('before') or None
+    if cursor is not None and not message_store.is_valid_cursor(cursor):
+        return jsonify(error="Invalid history cursor."), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', current_app.config.get('HISTORY_PAGE_SIZE', 50))),
+                           HISTORY_PAGE_MAX))
+    except ValueError:
+        return jsonify(error="Invalid limit."), 400
+
+    messages, next_cursor = get_message_page(room, cursor, limit)
+    response = jsonify(room=room, messages=messages, next_cursor=next_cursor)
+    response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32])
+    if current_app.config.get('HISTORY_PAGES_PUBLIC', False):
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    if cursor is not None and next_cursor is not None:
+        # A full page before a fixed cursor: nothing can ever be added to it
+        response.cache_control.max_age = current_app.config.get('HISTORY_PAGE_MAX_AGE', 31536000)
+        response.cache_control.immutable = True
+        outcome = 'immutable'
+    else:
+        response.cache_control.no_cache = True
+        outcome = 'revalidate'
+    response = response.make_conditional(request)
+    metrics.HISTORY_PAGE_REQUESTS.labels(outcome if response.status_code == 200 else 'not_modified').inc()
+    return response
@@ -0,0 +1,264 @@
+# app/archive.py
+"""Durable message archive: batched drains from the Redis room streams into Postgres.
+
+Room streams keep only the newest MESSAGE_STREAM_MAXLEN messages, and only
+as long as Redis keeps its data. The archiver copies every message into the
+`messages` table (app/models.py) so history survives both.
+
+Each write to a room stream also adds the room to `archive:pending_rooms`
+(message_store.mark_unarchived). One worker in the cluster holds the
+`archive:leader` lease. Every ARCHIVE_INTERVAL seconds that worker:
+
+    1. reads every pending room's stream after its cursor (the hash
+       `archive:cursors`, room -> last archived stream ID), with all rooms
+       in one pipelined round trip, up to ARCHIVE_BATCH_SIZE messages
+    2. writes them with one multi-row INSERT ... ON CONFLICT DO NOTHING and
+       a single commit
+    3. advances the cursors. In the same Lua call it removes from the
+       pending set every room whose stream ends at its new cursor, so a
+       message added meanwhile keeps its room pending
+
+A full batch is followed straight away by the next one until the backlog is
+gone. A crash between commit and cursor update re-reads some messages next
+time, and the conflict clause drops the duplicates. The first leader marks
+every registered room pending once, which backfills the existing history.
+
+On Postgres the table is partitioned by month. The leader keeps
+ARCHIVE_PARTITION_MONTHS_AHEAD future partitions created; rows outside
+every partition (e.g. migrated legacy messages dated 1970) land in
+messages_default.
+"""
+import datetime
+import logging
+import time
+from sqlalchemy import insert, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import socketio, redis_client, db
+from . import message_store, rooms, presence, metrics
+from .models import Message, EPOCH
+from .ops import register_stats_provider
+
+LEASE_KEY = "archive:leader" # Node ID of the worker that runs the archiver
+CURSORS_KEY = "archive:cursors" # Hash: room -> last archived stream ID
+BACKFILL_KEY = "archive:backfilled" # Set once the existing history has been queued for archiving
+PARTITION_CHECK_INTERVAL = 3600 # Seconds between checks that future partitions exist
+
+_archiver = {'started': False, 'leader': False, 'partitions_checked': 0.0}
+_counters = {'batches': 0, 'rows': 0, 'duplicates': 0, 'errors': 0, 'leases_acquired': 0}
+
+# Takes or renews the lease. KEYS: lease. ARGV: node ID, TTL ms. Returns 1 if this node holds it.
+_LEASE_LUA = """
+local holder = redis.call('GET', KEYS[1])
+if holder == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if not holder then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Advances cursors and clears rooms whose stream has nothing newer.
+# KEYS: cursors hash, pending set. ARGV: room, cursor pairs. Returns rooms still pending.
+_ADVANCE_LUA = """
+local still_pending = 0
+for i = 1, #ARGV, 2 do
+    local room, cursor = ARGV[i], ARGV[i + 1]
+    redis.call('HSET', KEYS[1], room, cursor)
+    local last = redis.call('XREVRANGE', 'room:' .. room .. ':stream', '+', '-', 'COUNT', 1)
+    if #last == 0 or last[1][1] == cursor then
+        redis.call('SREM', KEYS[2], room)
+    else
+        still_pending = still_pending + 1
+    end
+end
+return still_pending
+"""
+_lease_script = redis_client.register_script(_LEASE_LUA) if redis_client else None
+_advance_script = redis_client.register_script(_ADVANCE_LUA) if redis_client else None
+
+
+# === Rows ===
+
+def parse_stream_id(stream_id):
+    """'1718000000123-4' -> (created_at datetime in UTC, 4)"""
+    millis, _, seq = stream_id.partition('-')
+    return EPOCH + datetime.timedelta(milliseconds=int(millis)), int(seq or 0)
+
+def to_row(room, message):
+    """Turns a decoded stream message into a `messages` row."""
+    created_at, seq = parse_stream_id(message['id'])
+    return {
+        'room': room,
+        'created_at': created_at,
+        'seq': seq,
+        'nickname': message['nickname'],
+        'color': message['color'],
+        'body': message['msg'],
+    }
+
+def _insert_statement():
+    """Multi-row INSERT that skips messages already archived (the primary key is the stream ID)."""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(Message.__table__).on_conflict_do_nothing(index_elements=['room', 'created_at', 'seq'])
+    if dialect == 'sqlite':
+        return sqlite.insert(Message.__table__).on_conflict_do_nothing()
+    return insert(Message.__table__)
+
+def write_rows(rows):
+    """Inserts rows in one statement (executemany becomes multi-row VALUES) and commits once.
+
+    Returns the number of rows actually inserted.
+    """
+    if not rows:
+        return 0
+    try:
+        # Core executemany on the session's connection, which also reports the inserted rowcount
+        result = db.session.connection().execute(_insert_statement(), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    inserted = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+    return inserted
+
+
+# === Draining ===
+
+def _queue_backfill():
+    """Marks every registered room pending, once per cluster, so existing history gets archived."""
+    if not redis_client.set(BACKFILL_KEY, int(time.time()), nx=True):
+        return
+    names = {rooms.DEFAULT_ROOM} | set(redis_client.hkeys(rooms.ROOMS_KEY))
+    redis_client.sadd(message_store.UNARCHIVED_ROOMS_KEY, *names)
+    logging.info(f"Queued {len(names)} rooms for archive backfill")
+
+def drain_once(batch_size, rooms_per_batch):
+    """Archives up to batch_size messages from pending rooms. Returns rows read."""
+    pending = redis_client.srandmember(message_store.UNARCHIVED_ROOMS_KEY, rooms_per_batch)
+    if not pending:
+        metrics.ARCHIVE_LAG_SECONDS.set(0)
+        return 0
+    cursors = redis_client.hmget(CURSORS_KEY, pending)
+    pipe = redis_client.pipeline(transaction=False)
+    for room, cursor in zip(pending, cursors):
+        pipe.xrange(message_store.stream_key(room), min=f"({cursor}" if cursor else '-', count=batch_size)
+    rows, advanced = [], []
+    for room, cursor, entries in zip(pending, cursors, pipe.execute()):
+        entries = entries[:batch_size - len(rows)]
+        rows.extend(to_row(room, message_store.decode_entry(entry_id, fields)) for entry_id, fields in entries)
+        advanced.extend([room, entries[-1][0] if entries else (cursor or '0-0')])
+        if len(rows) >= batch_size:
+            break
+
+    started = time.perf_counter()
+    inserted = write_rows(rows)
+    metrics.ARCHIVE_BATCH_SECONDS.observe(time.perf_counter() - started)
+    _advance_script(keys=[CURSORS_KEY, message_store.UNARCHIVED_ROOMS_KEY], args=advanced)
+
+    if rows:
+        _counters['batches'] += 1
+        _counters['rows'] += inserted
+        _counters['duplicates'] += len(rows) - inserted
+        metrics.ARCHIVE_ROWS.inc(inserted)
+        oldest = min(row['created_at'] for row in rows)
+        metrics.ARCHIVE_LAG_SECONDS.set(max(0.0, (datetime.datetime.now(datetime.timezone.utc) - oldest).total_seconds()))
+    else:
+        metrics.ARCHIVE_LAG_SECONDS.set(0)
+    return len(rows)
+
+
+# === Partitions (Postgres) ===
+
+def _month_start(day, months_ahead=0):
+    month = day.month - 1 + months_ahead
+    return datetime.date(day.year + month // 12, month % 12 + 1, 1)
+
+def ensure_partitions(months_ahead):
+    """Creates the default partition and monthly partitions from this month to `months_ahead` ahead."""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    today = datetime.date.today()
+    statements = ["CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT"]
+    for offset in range(months_ahead + 1):
+        start, end = _month_start(today, offset), _month_start(today, offset + 1)
+        statements.append(f"CREATE TABLE IF NOT EXISTS messages_p{start:%Y_%m} PARTITION OF messages "
+                          f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+    try:
+        for statement in statements:
+            db.session.execute(text(statement))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Could not create message archive partitions: {e}")
+
+
+# === Background task ===
+
+def _hold_lease(ttl):
+    held = bool(_lease_script(keys=[LEASE_KEY], args=[presence.node_id(), int(ttl * 1000)]))
+    if held and not _archiver['leader']:
+        _counters['leases_acquired'] += 1
+        logging.info(f"Node {presence.node_id()} is now the message archiver")
+    elif not held and _archiver['leader']:
+        metrics.ARCHIVE_LAG_SECONDS.set(0) # Another worker reports lag now
+    _archiver['leader'] = held
+    return held
+
+def _archiver_loop(app):
+    """Background task: while this worker holds the lease, drains pending rooms into Postgres."""
+    config = app.config
+    interval = config.get('ARCHIVE_INTERVAL', 1.0)
+    batch_size = config.get('ARCHIVE_BATCH_SIZE', 2000)
+    rooms_per_batch = config.get('ARCHIVE_ROOMS_PER_BATCH', 200)
+    while True:
+        try:
+            with app.app_context():
+                if _hold_lease(config.get('ARCHIVE_LEASE_TTL', 30)):
+                    if time.monotonic() - _archiver['partitions_checked'] > PARTITION_CHECK_INTERVAL:
+                        ensure_partitions(config.get('ARCHIVE_PARTITION_MONTHS_AHEAD', 3))
+                        _archiver['partitions_checked'] = time.monotonic()
+                    _queue_backfill()
+                    if drain_once(batch_size, rooms_per_batch) >= batch_size:
+                        socketio.sleep(0) # Backlog: go again straight away, but let other green threads run
+                        continue
+        except Exception as e:
+            _counters['errors'] += 1
+            logging.error(f"Error archiving messages, backing off: {e}")
+        socketio.sleep(interval)
+
+def start_archiver(app):
+    """Starts this worker's archiver task (it only drains while holding the lease), once per process."""
+    if _archiver['started'] or not redis_client or not app.config.get('ARCHIVE_ENABLED', True):
+        return
+    _archiver['started'] = True
+    socketio.start_background_task(_archiver_loop, app)
+    logging.info("Message archiver task started")
+
+
+# === Scrollback ===
+
+def messages_before(room, cursor, limit):
+    """One page of archived messages strictly older than `cursor` (a stream ID), like message_store.messages_before."""
+    query = db.select(Message).where(Message.room == room)
+    if cursor:
+        created_at, seq = parse_stream_id(cursor)
+        query = query.where(tuple_(Message.created_at, Message.seq) < tuple_(created_at, seq))
+    query = query.order_by(Message.created_at.desc(), Message.seq.desc()).limit(limit)
+    messages = [message.to_payload() for message in reversed(db.session.scalars(query).all())]
+    next_cursor = messages[0]['id'] if len(messages) == limit else None
+    return messages, next_cursor
+
+
+def stats():
+    """Archiver counters of this worker, plus the shared backlog."""
+    report = dict(_counters, leader=_archiver['leader'])
+    if redis_client:
+        report['pending_rooms'] = redis_client.scard(message_store.UNARCHIVED_ROOMS_KEY)
+    return report
+
+register_stats_provider('archive', stats)
@@ -0,0 +1,221 @@
+# app/assets.py
+"""Fingerprinted, precompressed static assets.
+
+`flask chat build-assets` (run by the Docker build):
+
+1. downloads the pinned third-party files in VENDOR_ASSETS into
+   static/vendor/ if they are missing (the Socket.IO client, so pages no
+   longer load it from cdn.socket.io) and checks every vendored file
+   against its pinned SHA-256. A mismatch fails the build: these files are
+   served first-party and cached as immutable, so a changed CDN response
+   must never ship silently. An entry without a pin is neither downloaded
+   nor served, and pages keep loading it from its CDN URL
+2. copies every file under static/ to static/dist/ with a content hash in
+   its name (css/style.css -> css/style.1a2b3c4d5e6f.css)
+3. writes .gz (and, when the `brotli` package is installed, .br) siblings
+   of text assets
+4. writes static/dist/manifest.json mapping each original name to its
+   hashed name
+
+Templates link assets with `asset_url('css/style.css')`. When the name is
+in the manifest, the helper returns the hashed /assets/... URL. That URL is
+served with `Cache-Control: immutable` for ASSET_CACHE_MAX_AGE and with the
+best precompressed variant the browser accepts. A changed file gets a new
+name, so browsers never need to revalidate. Without a manifest (a fresh
+checkout that was never built) asset_url falls back to Flask's static
+handler.
+"""
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import urllib.request
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli # Optional: .br variants are only built when it is installed
+except ImportError:
+    brotli = None
+
+DIST_DIR = 'dist' # Build output, inside the static folder
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html')
+# Preferred first: browsers that accept both get brotli
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+SOCKETIO_CLIENT_VERSION = '4.7.5'
+# Third-party files served from static/ instead of a CDN: local name -> pinned download URL and SHA-256.
+# An entry whose sha256 is None is not vendored: pages load it from the CDN until a digest, checked against
+# the upstream release, is pinned here.
+VENDOR_ASSETS = {
+    'vendor/socket.io.min.js': {
+        'url': f"https://cdn.socket.io/{SOCKETIO_CLIENT_VERSION}/socket.io.min.js",
+        'sha256': None,
+    },
+    'vendor/socket.io.msgpack.min.js': {
+        'url': f"https://cdn.socket.io/{SOCKETIO_CLIENT_VERSION}/socket.io.msgpack.min.js",
+        'sha256': None,
+    },
+}
+
+# Original name -> hashed name, loaded from the manifest by init_app
+_manifest = {}
+_fingerprint = 'unbuilt' # Short hash of the manifest: changes whenever any asset does
+
+assets = Blueprint('assets', __name__)
+
+
+class VendorIntegrityError(ValueError):
+    """A vendored file whose SHA-256 is not pinned or does not match the pin."""
+
+
+def pinned(name):
+    """False for a VENDOR_ASSETS entry without a SHA-256 (never vendored or served locally)."""
+    return name not in VENDOR_ASSETS or VENDOR_ASSETS[name]['sha256'] is not None
+
+
+# === Build ===
+
+def verify_vendored(name, content):
+    """Raises VendorIntegrityError unless `content` matches the SHA-256 pinned for `name`."""
+    digest = hashlib.sha256(content).hexdigest()
+    expected = VENDOR_ASSETS[name]['sha256']
+    if expected is None:
+        raise VendorIntegrityError(f"No SHA-256 pinned for {name} (this copy hashes to {digest}); "
+                                   f"check it against the upstream release and pin it in VENDOR_ASSETS.")
+    if not hmac.compare_digest(digest, expected):
+        raise VendorIntegrityError(f"{name} hashes to {digest}, expected {expected}; refusing to serve it.")
+
+def vendor(static_dir, force=False):
+    """Downloads missing VENDOR_ASSETS into the static folder and verifies every one. Returns the names fetched.
+
+    A download that fails verification is not written. Unpinned entries are skipped.
+    """
+    fetched = []
+    for name, entry in VENDOR_ASSETS.items():
+        if not pinned(name):
+            continue
+        path = os.path.join(static_dir, name)
+        if os.path.exists(path) and not force:
+            with open(path, 'rb') as f:
+                verify_vendored(name, f.read())
+            continue
+        with urllib.request.urlopen(entry['url'], timeout=30) as response:
+            body = response.read()
+        verify_vendored(name, body)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(body)
+        fetched.append(name)
+    return fetched
+
+def hashed_name(name, content):
+    """css/style.css + content -> css/style.<first HASH_LENGTH hex digits of sha256>.css"""
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+
+def _precompress(path, content):
+    """Writes .gz/.br siblings when they are smaller than the original. Returns the suffixes written."""
+    written = []
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))] # mtime=0: reproducible output
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(content):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(suffix)
+    return written
+
+def build(static_dir):
+    """Rebuilds static/dist/ and its manifest from everything else under static_dir. Returns the manifest."""
+    dist = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        for filename in files:
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            if not pinned(name):
+                continue # A stray copy of an unpinned vendor file: never serve it first-party
+            with open(source, 'rb') as f:
+                content = f.read()
+            target_name = hashed_name(name, content)
+            target = os.path.join(dist, target_name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(content)
+            if name.endswith(COMPRESSIBLE):
+                _precompress(target, content)
+            manifest[name] = target_name
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        logging.warning("brotli is not installed; built gzip variants only.")
+    return manifest
+
+
+# === Runtime ===
+
+def init_app(app):
+    """Loads the asset manifest, if one was built, and exposes asset_url to templates."""
+    global _manifest, _fingerprint
+    path = os.path.join(app.static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            _manifest = json.load(f)
+        logging.info(f"Loaded asset manifest with {len(_manifest)} entries from {path}")
+    except FileNotFoundError:
+        _manifest = {}
+        logging.info("No asset manifest found; serving static files unversioned (run `flask chat build-assets`).")
+    except (OSError, ValueError) as e:
+        _manifest = {}
+        logging.error(f"Could not read asset manifest {path}: {e}")
+    _fingerprint = hashlib.sha256(json.dumps(_manifest, sort_keys=True).encode()).hexdigest()[:HASH_LENGTH] \
+        if _manifest else 'unbuilt'
+    app.add_template_global(asset_url)
+
+def fingerprint():
+    """Identifies the current asset build (for caches of pages that link to the assets)."""
+    return _fingerprint
+
+def has_asset(name):
+    """True if `name` (e.g. 'vendor/socket.io.min.js') is available to serve locally."""
+    if not pinned(name):
+        return False
+    return name in _manifest or os.path.exists(os.path.join(current_app.static_folder, name))
+
+def asset_url(name):
+    """Manifest-aware url_for('static', ...): the fingerprinted, immutable URL of a built asset."""
+    hashed = _manifest.get(name)
+    if hashed is None:
+        return url_for('static', filename=name)
+    return url_for('assets.serve', filename=hashed)
+
+
+@assets.route('/<path:filename>')
+def serve(filename):
+    """Serves a fingerprinted asset, precompressed if the client accepts it. Never revalidated."""
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    max_age = current_app.config.get('ASSET_CACHE_MAX_AGE', 31536000)
+    encoding = None
+    for candidate, suffix in ENCODINGS:
+        if request.accept_encodings[candidate] and os.path.isfile(os.path.join(dist, filename + suffix)):
+            encoding = candidate
+            response = send_from_directory(dist, filename + suffix, mimetype=mimetype, max_age=max_age)
+            break
+    else:
+        response = send_from_directory(dist, filename, mimetype=mimetype, max_age=max_age)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f"public, max-age={max_age}, immutable"
+    return response
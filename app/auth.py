@@ -5,7 +5,9 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from itsdangerous import URLSafeTimedSerializer
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
-from . import db, mail
+from . import db
+from . import user_cache, mail_queue
+from .hashing import HashingBusy
 from .models import User
 # Import ALL needed forms, including the new ResendConfirmationForm
 from .forms import (LoginForm, RegistrationForm, 
@@ -77,13 +79,17 @@ def register():
                 subject = "Please confirm your email address"
                 msg = Message(subject, sender=current_app.config.get('MAIL_DEFAULT_SENDER'),
                               recipients=[user.email], body=text_body, html=html_body)
-                mail.send(msg)
+                mail_queue.enqueue(msg) # Sent in the background; never waits on SMTP
                 flash('A confirmation email has been sent. Please check your inbox.', 'success')
             except Exception as e:
                 logging.error(f"Error sending confirmation email to {user.email}: {e}")
                 flash('Registration successful, but could not send confirmation email.', 'warning')
 
             return redirect(url_for('auth.login'))
+        except HashingBusy:
+            db.session.rollback()
+            logging.warning(f"Password hashing queue full, registration of {form.username.data} refused")
+            flash('The server is busy right now. Please try again in a moment.', 'warning')
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error during registration for {form.username.data}: {e}")
@@ -100,7 +106,13 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = db.session.scalar(db.select(User).where(User.username == form.username.data))
-        if user and user.check_password(form.password.data):
+        try:
+            password_ok = user is not None and user.check_password(form.password.data)
+        except HashingBusy:
+            logging.warning(f"Password hashing queue full, login for {form.username.data} refused")
+            flash('The server is busy right now. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html', title='Login', form=form), 503
+        if password_ok:
             if user.email_confirmed:
                 login_user(user, remember=form.remember_me.data)
                 flash('Login successful!', 'success')
@@ -152,6 +164,7 @@ def confirm_email(token):
             user.email_confirmed = True
             user.email_confirmed_on = datetime.datetime.now()
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash('You have confirmed your account. Thanks!', 'success')
 
     except Exception as e:
@@ -183,7 +196,7 @@ def forgot_password():
                 subject = "Password Reset Request"
                 msg = Message(subject, sender=current_app.config.get('MAIL_DEFAULT_SENDER'),
                               recipients=[user.email], body=text_body, html=html_body)
-                mail.send(msg)
+                mail_queue.enqueue(msg) # Sent in the background; never waits on SMTP
 
             flash('If an account with that email exists, a password reset link has been sent.', 'info')
             return redirect(url_for('auth.login'))
@@ -222,8 +235,14 @@ def reset_password(token):
             # Decide if password reset should affect confirmation status (currently doesn't)
             # user.email_confirmed = False # Uncomment if re-confirmation is desired
             db.session.commit()
+            user_cache.invalidate(user.id) # Drop cached profiles in case confirmation status changes
             flash('Your password has been successfully reset. Please log in.', 'success')
             return redirect(url_for('auth.login'))
+        except HashingBusy:
+            db.session.rollback()
+            logging.warning(f"Password hashing queue full, password reset for {email} refused")
+            flash('The server is busy right now. Please try again in a moment.', 'warning')
+            return render_template('auth/reset_password.html', title='Reset Password', form=form, token=token)
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error resetting password for {email}: {e}")
@@ -257,7 +276,7 @@ def resend_confirmation_request():
                 subject = "Please confirm your email address (Resent)"
                 msg = Message(subject, sender=current_app.config.get('MAIL_DEFAULT_SENDER'),
                               recipients=[user.email], body=text_body, html=html_body)
-                mail.send(msg)
+                mail_queue.enqueue(msg) # Sent in the background; never waits on SMTP
                 flash('A new confirmation email has been sent. Please check your inbox.', 'success')
             except Exception as e:
                 logging.error(f"Error resending confirmation email to {user.email}: {e}")
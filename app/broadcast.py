@@ -0,0 +1,124 @@
+# app/broadcast.py
+"""Micro-batching of room broadcasts (BROADCAST_BATCH_ENABLED).
+
+Each emit to a room is one message on the Redis queue, which every worker
+decodes and then writes to each of its sockets in the room. In a burst,
+that per-emit overhead costs more than the messages themselves. With
+batching on, chat messages go through a per-room coalescer:
+
+    - a message to a room that has had no broadcast in the last
+      BROADCAST_BATCH_WINDOW_MS goes out at once, as a normal `chat_message`
+      (light traffic is never delayed)
+    - messages arriving within the window after that are held back. They
+      go out together when the window ends, or as soon as
+      BROADCAST_BATCH_MAX are waiting, as one `chat_batch` frame
+      {room, messages: [...]} in arrival order (a lone held message is still
+      sent as a plain `chat_message`)
+
+In a busy room, N messages per window cost one queue message and one
+socket write per recipient instead of N. Emits happen under a single lock,
+so a room's frames leave in the order their messages arrived.
+"""
+import atexit
+import threading # Green locks once eventlet.monkey_patch() has run
+import time
+
+from . import socketio
+from . import wire, metrics
+
+
+class BroadcastCoalescer:
+    """Sends the first message of a quiet room at once and batches the ones that follow within a window."""
+
+    def __init__(self, config, window=0.03, max_batch=50):
+        self.config = config # For the wire format; flushes run outside any app context
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {} # room -> [message, ...], oldest first
+        self._last_sent = {} # room -> monotonic time of the last frame sent
+        self._lock = threading.Lock() # Guards the maps and serializes emits
+        # Frame counters for /ops/stats
+        self.messages = 0
+        self.single = 0
+        self.batches = 0
+        self.batched_messages = 0
+        self.max_batch_seen = 0
+
+    def submit(self, room, message):
+        """Broadcasts a chat message to a room now, or queues it for the room's next batch."""
+        with self._lock:
+            self.messages += 1
+            pending = self._pending.get(room)
+            now = time.monotonic()
+            if pending is None and now - self._last_sent.get(room, 0.0) >= self.window:
+                self._send(room, [message], now) # Quiet room: no reason to wait
+                return
+            if pending is None:
+                pending = self._pending[room] = []
+                socketio.start_background_task(self._flush_later, room,
+                                               self._last_sent.get(room, now) + self.window - now)
+            pending.append(message)
+            if len(pending) >= self.max_batch:
+                self._send(room, self._pending.pop(room), now)
+
+    def _flush_later(self, room, delay):
+        socketio.sleep(max(0.0, delay))
+        self.flush(room)
+
+    def flush(self, room=None):
+        """Sends what is queued for one room (all rooms without `room`). Returns the messages sent."""
+        with self._lock:
+            rooms = [room] if room is not None else list(self._pending)
+            sent = 0
+            now = time.monotonic()
+            for name in rooms:
+                pending = self._pending.pop(name, None)
+                if pending:
+                    self._send(name, pending, now)
+                    sent += len(pending)
+            self._prune(now)
+            return sent
+
+    def _send(self, room, messages, now):
+        """Emits one frame for `messages` (caller holds the lock)."""
+        self._last_sent[room] = now
+        if len(messages) == 1:
+            self.single += 1
+            metrics.BROADCAST_FRAMES.labels('chat_message').inc()
+            socketio.emit('chat_message', wire.encode(messages[0], self.config), to=room)
+            return
+        self.batches += 1
+        self.batched_messages += len(messages)
+        self.max_batch_seen = max(self.max_batch_seen, len(messages))
+        metrics.BROADCAST_FRAMES.labels('chat_batch').inc()
+        metrics.BROADCAST_BATCH_SIZE.observe(len(messages))
+        socketio.emit('chat_batch', wire.encode({'room': room, 'messages': messages}, self.config), to=room)
+
+    def _prune(self, now):
+        """Forgets rooms that have been quiet for a while, so the map stays small."""
+        if len(self._last_sent) > 1000:
+            for name in [name for name, at in self._last_sent.items() if now - at > 60 and name not in self._pending]:
+                del self._last_sent[name]
+
+    def stats(self):
+        """Frame counters for /ops/stats."""
+        frames = self.single + self.batches
+        return {
+            'messages': self.messages,
+            'frames': frames,
+            'single_frames': self.single,
+            'batch_frames': self.batches,
+            'max_batch_size': self.max_batch_seen,
+            'avg_batch_size': round(self.batched_messages / self.batches, 2) if self.batches else 0.0,
+            'messages_per_frame': round(self.messages / frames, 2) if frames else 0.0,
+            'pending': sum(len(pending) for pending in self._pending.values()),
+        }
+
+
+def create_coalescer(config):
+    """Builds a BroadcastCoalescer from app config and makes sure it drains on shutdown."""
+    coalescer = BroadcastCoalescer(config,
+                                   window=config.get('BROADCAST_BATCH_WINDOW_MS', 30) / 1000.0,
+                                   max_batch=config.get('BROADCAST_BATCH_MAX', 50))
+    atexit.register(coalescer.flush)
+    return coalescer
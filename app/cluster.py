@@ -0,0 +1,73 @@
+# app/cluster.py
+"""Cross-worker notifications over Redis pub/sub.
+
+Per-process caches (history snapshots, and anything else a worker keeps in
+memory) stay correct with several workers and pods by publishing a small
+notification on `cluster:<topic>` whenever shared state changes. Every worker
+runs one listener task subscribed to `cluster:*` that dispatches messages to
+the handlers registered for their topic.
+"""
+import json
+import logging
+
+from . import socketio, redis_client
+from . import presence
+
+CHANNEL_PREFIX = "cluster:"
+
+_handlers = {} # topic -> list of callables taking the decoded payload
+_listener = {'started': False}
+
+
+def channel(topic):
+    """Redis pub/sub channel name for a topic."""
+    return f"{CHANNEL_PREFIX}{topic}"
+
+def on(topic, handler):
+    """Registers `handler(payload)` for notifications published on `topic` by other workers."""
+    _handlers.setdefault(topic, []).append(handler)
+
+def publish(topic, payload, pipe=None):
+    """Publishes a JSON notification. Pass a pipeline to piggyback on an existing round trip."""
+    message = json.dumps(dict(payload, origin=presence.node_id()), separators=(',', ':'))
+    (pipe or redis_client).publish(channel(topic), message)
+
+def _dispatch(app, message):
+    topic = message['channel'][len(CHANNEL_PREFIX):]
+    payload = json.loads(message['data'])
+    if payload.get('origin') == presence.node_id():
+        return # This worker already applied its own change
+    with app.app_context():
+        for handler in _handlers.get(topic, ()):
+            try:
+                handler(payload)
+            except Exception as e:
+                logging.error(f"Error handling cluster notification on {topic}: {e}")
+
+def _listen(app):
+    """Background task: dispatches cluster notifications, resubscribing after Redis errors."""
+    while True:
+        pubsub = None
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+            for message in pubsub.listen():
+                if message['type'] == 'pmessage':
+                    _dispatch(app, message)
+        except Exception as e:
+            logging.error(f"Redis error in cluster listener, resubscribing: {e}")
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+        socketio.sleep(1) # Back off before resubscribing
+
+def start_listener(app):
+    """Starts this worker's cluster listener task, once per process."""
+    if _listener['started'] or not redis_client:
+        return
+    _listener['started'] = True
+    socketio.start_background_task(_listen, app)
+    logging.info("Cluster notification listener started")
@@ -0,0 +1,107 @@
+# app/commands.py
+"""Operational `flask chat ...` commands (run with FLASK_APP=run.py)."""
+import os
+import click
+from flask.cli import AppGroup
+
+chat_cli = AppGroup('chat', help='Chat maintenance commands.')
+
+
+@chat_cli.command('migrate-history')
+@click.option('--room', default='general_chat', show_default=True,
+              help='Room whose legacy "|||" message list should be converted.')
+def migrate_history(room):
+    """One-shot conversion of a legacy Redis history list into the message stream."""
+    from . import message_store # Imported lazily: needs the Redis client from create_app
+    if message_store.redis_client is None:
+        raise click.ClickException('App Redis client is not available.')
+    migrated = message_store.migrate_legacy_history(room)
+    click.echo(f"Migrated {migrated} messages from {message_store.legacy_list_key(room)} "
+               f"to {message_store.stream_key(room)}.")
+
+
+@chat_cli.command('seed-users')
+@click.option('--count', default=100, show_default=True, help='Number of users to create.')
+@click.option('--prefix', default='bench', show_default=True, help='Username prefix (users are <prefix>0001, ...).')
+@click.option('--password', default='benchpass', show_default=True, help='Password shared by every seeded user.')
+@click.option('--create-tables', is_flag=True, help='Create missing tables first (SQLite benchmark databases).')
+def seed_users(count, prefix, password, create_tables):
+    """Creates confirmed users for load tests and benchmarks; existing ones are skipped."""
+    import datetime
+    from werkzeug.security import generate_password_hash
+    from . import db
+    from .models import User
+    if create_tables:
+        db.create_all()
+    # One hash for everyone: PBKDF2 per user would dominate seeding time
+    password_hash = generate_password_hash(password, method='pbkdf2:sha256', salt_length=16)
+    existing = set(db.session.scalars(db.select(User.username).where(User.username.like(f"{prefix}%"))))
+    created = 0
+    for i in range(1, count + 1):
+        username = f"{prefix}{i:04d}"
+        if username in existing:
+            continue
+        db.session.add(User(username=username, email=f"{username}@bench.invalid", password_hash=password_hash,
+                            email_confirmed=True, email_confirmed_on=datetime.datetime.now()))
+        created += 1
+    db.session.commit()
+    click.echo(f"Created {created} users ({count - created} already existed).")
+
+
+@chat_cli.command('smtp-stub')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=1025, show_default=True)
+@click.option('--fail-rate', default=0.0, show_default=True,
+              help='Share of messages answered with a temporary 451 failure (0.0-1.0).')
+@click.option('--reject-domain', multiple=True, help='Refuse recipients at this domain with a permanent 550.')
+def smtp_stub(host, port, fail_rate, reject_domain):
+    """Runs a local SMTP server that prints every email it receives (for offline testing)."""
+    from .smtp_stub import StubSMTPServer
+
+    def show(mail_from, recipients, data):
+        click.echo(f"--- Mail from {mail_from} to {', '.join(recipients)} ---\n{data}")
+
+    server = StubSMTPServer((host, port), fail_rate=fail_rate, reject_domains=reject_domain, on_message=show)
+    click.echo(f"SMTP stub listening on {host}:{port} (set MAIL_SERVER={host} MAIL_PORT={port} MAIL_USE_TLS=false)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@chat_cli.command('mail-requeue-dead')
+@click.option('--limit', type=int, default=None, help='Requeue at most this many (default: all).')
+def mail_requeue_dead(limit):
+    """Puts dead-lettered emails back on the outbound queue with a fresh attempt count."""
+    from . import mail_queue # Imported lazily: needs the Redis client from create_app
+    if mail_queue.redis_client is None:
+        raise click.ClickException('App Redis client is not available.')
+    moved = mail_queue.requeue_dead(limit)
+    click.echo(f"Requeued {moved} emails from {mail_queue.DEAD_KEY}.")
+
+
+@chat_cli.command('build-assets')
+@click.option('--vendor/--no-vendor', default=True, show_default=True,
+              help='Download missing vendored files (Socket.IO client) and verify their pinned SHA-256.')
+@click.option('--refresh-vendor', is_flag=True, help='Re-download vendored files even if present.')
+def build_assets(vendor, refresh_vendor):
+    """Fingerprints and precompresses everything under static/ into static/dist/ (with a manifest)."""
+    from flask import current_app
+    from . import assets
+    static_dir = current_app.static_folder
+    if vendor or refresh_vendor:
+        try:
+            fetched = assets.vendor(static_dir, force=refresh_vendor)
+        except OSError as e:
+            raise click.ClickException(f"Could not download vendored assets: {e}")
+        except assets.VendorIntegrityError as e:
+            raise click.ClickException(str(e))
+        for name in fetched:
+            click.echo(f"Vendored {name}")
+        for name in (name for name in assets.VENDOR_ASSETS if not assets.pinned(name)):
+            click.echo(f"Not vendoring {name}: no SHA-256 pinned (pages load {assets.VENDOR_ASSETS[name]['url']})")
+    manifest = assets.build(static_dir)
+    click.echo(f"Built {len(manifest)} assets into {os.path.join(os.path.normpath(static_dir), assets.DIST_DIR)} "
+               f"({'gzip + brotli' if assets.brotli else 'gzip only'}).")
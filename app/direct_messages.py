@@ -0,0 +1,58 @@
+# app/direct_messages.py
+"""Private one-to-one messages.
+
+A direct message goes to every socket the recipient has open (and to the
+sender's other tabs), on whichever worker holds them. Both users' SIDs come
+from the presence reverse index (``presence:user:<nickname>:sids``) in one
+pipelined round trip, so the cost of a delivery depends on how many tabs the
+two users have open, not on how many people are online. The emit addresses
+that list of SIDs directly; no room is involved. Only when the recipient has
+no open socket is the database asked whether the user exists at all.
+
+Each pair of users has its own stream, capped at DM_HISTORY_MAXLEN entries
+(approximate, like the room streams) and paged with the same stream-ID
+cursors. DM streams are never queued for the Postgres archiver, so private
+messages stay out of /search.
+"""
+from . import redis_client
+from . import message_store, presence
+
+
+def conversation_key(a, b):
+    """Redis stream of the messages between two users (the same for either order).
+
+    The first nickname is length-prefixed: usernames may contain ':'.
+    """
+    first, second = sorted((a, b))
+    return f"dm:{len(first)}:{first}:{second}:stream"
+
+def recipients(sender, recipient):
+    """Returns (recipient's SIDs, sender's SIDs) in one round trip."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.smembers(presence.user_sids_key(recipient))
+    pipe.smembers(presence.user_sids_key(sender))
+    recipient_sids, sender_sids = pipe.execute()
+    return recipient_sids, sender_sids
+
+def append(sender, recipient, msg, color, maxlen):
+    """Stores a direct message and returns its payload (with from/to) for delivery."""
+    fields = message_store.encode_message(sender, msg, color)
+    entry_id = redis_client.xadd(conversation_key(sender, recipient), fields, maxlen=maxlen, approximate=True)
+    message = message_store.decode_entry(entry_id, fields)
+    message.update({'from': sender, 'to': recipient})
+    return message
+
+def messages_before(user, other, cursor, limit):
+    """One page of the conversation between two users older than `cursor` (newest page without it).
+
+    Returns (messages oldest first, next_cursor), like message_store.messages_before.
+    """
+    upper = f"({cursor}" if cursor else '+'
+    entries = redis_client.xrevrange(conversation_key(user, other), max=upper, count=limit)
+    messages = []
+    for entry_id, fields in reversed(entries):
+        message = message_store.decode_entry(entry_id, fields)
+        message.update({'from': message['nickname'], 'to': other if message['nickname'] == user else user})
+        messages.append(message)
+    next_cursor = messages[0]['id'] if len(messages) == limit else None
+    return messages, next_cursor
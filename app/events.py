@@ -1,97 +1,497 @@
 # app/events.py
+import atexit
+import json
 import logging
-from flask import request
+import threading
+import time
+from collections import OrderedDict
+from flask import request, current_app
 from flask_login import current_user
 from flask_socketio import emit, join_room, leave_room
 # Import necessary components from the app package (__init__)
 from . import socketio, redis_client, db
+from . import message_store, write_behind, presence, rooms, cluster, user_cache, mail_queue, metrics
+from . import rate_limit, wire, archive, typing_status, direct_messages, broadcast, resilience
+from .ops import register_stats_provider
 # Needs the User model for database operations
 from .models import User
 
 # === Constants ===
-GENERAL_ROOM = "general_chat"
-MESSAGE_HISTORY_KEY = f"room:{GENERAL_ROOM}:messages" # Redis list key
-SID_NICKNAME_MAP_KEY = "sid_nickname_map" # Redis Hash mapping session ID to nickname
-MAX_MESSAGES = 50
+GENERAL_ROOM = rooms.DEFAULT_ROOM # Every client joins this room on connect
+HISTORY_PAGE_MAX = 100 # Upper bound on one history page (GET /api/rooms/<room>/messages or 'load_history')
+MAX_ROOMS_PER_SOCKET = 20 # Upper bound on rooms one socket may be in at once
+HISTORY_TOPIC = "history" # Cluster topic: {'rooms': [...]} whose streams just changed
+
+# In-process snapshots of decoded room history, shared by every client joining the room.
+# room -> {'messages': oldest-first list, 'payload': pre-serialized history_batch, 'built_at'}
+# Kept as an LRU so only recently opened rooms stay in memory (HISTORY_SNAPSHOT_ROOMS).
+_history_snapshots = OrderedDict()
+_history_snapshot_lock = threading.Lock() # Only one green thread rebuilds at a time
+
+# Rooms each local socket has joined: sid -> set of room names (O(1) membership checks)
+_sid_rooms = {}
+
+# Nickname of each local socket, for presence while Redis is unavailable
+_sid_nicknames = {}
+
+# Local sockets that disconnected while their Redis presence could not be removed: sid -> nickname.
+# Removed once Redis is back; every still-open socket is re-registered then too (see _reconcile_presence)
+_presence_gone = {}
+
+# Write-behind batcher for message persistence, created on first use (see _get_writer)
+_writer = None
+
+# Broadcast micro-batcher (BROADCAST_BATCH_ENABLED), created on first use (see _get_broadcaster)
+_broadcaster = None
+
+# Per-process background tasks, started by the first connection (see _ensure_background_tasks)
+_background_tasks = {'started': False}
+
 
 # === Helper Functions ===
 # (Includes basic error handling for Redis operations)
 
-def add_message(nickname, msg, color): # Added color parameter
-    """Adds message WITH color to Redis history list."""
+def _get_writer():
+    """Returns the process-wide write-behind writer, creating it inside the app context."""
+    global _writer
+    if _writer is None:
+        app = current_app._get_current_object()
+
+        def on_flush(stored):
+            # Runs in the writer's background task, so it needs its own app context
+            with app.app_context():
+                for room, message in stored:
+                    _append_to_history_snapshot(room, message)
+
+        def on_failure(batch):
+            # Redis is down: keep the messages for replay instead of losing them, and show them to joiners
+            ts = int(time.time() * 1000)
+            with app.app_context():
+                for room, fields in batch:
+                    resilience.buffer_message(room, fields, ts)
+                    _append_to_history_snapshot(room, dict(message_store.decode_entry(f"{ts}-0", fields), id=None))
+
+        _writer = write_behind.create_writer(app.config, on_flush=on_flush, on_failure=on_failure,
+                                             notify_topic=HISTORY_TOPIC)
+    return _writer
+
+def _get_broadcaster():
+    """Returns the process-wide broadcast coalescer, creating it from the app config."""
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = broadcast.create_coalescer(current_app.config)
+    return _broadcaster
+
+def broadcast_message(room, message):
+    """Sends a chat message to a room, batched with its neighbours when BROADCAST_BATCH_ENABLED."""
+    if current_app.config.get('BROADCAST_BATCH_ENABLED'):
+        _get_broadcaster().submit(room, message)
+    else:
+        # Encoded once here (per CHAT_WIRE_FORMAT), however many workers and sockets it reaches
+        socketio.emit('chat_message', wire.encode(message), to=room)
+
+@metrics.timed('add_message')
+def add_message(nickname, msg, color, room=GENERAL_ROOM): # Added color parameter
+    """Appends a message WITH color to the room's Redis stream.
+
+    With WRITE_BEHIND_ENABLED the write is queued and batched; the returned
+    payload then carries a local 'ts' but no stream 'id' yet. Otherwise the
+    write is synchronous and the payload has the server 'id' and 'ts'.
+    Returns None if the message could not be stored.
+    """
     if redis_client:
         try:
-            separator = "|||" # Define separator
-            # Store data as "nickname|||#RRGGBB|||message content"
-            message_data = f"{nickname}{separator}{color}{separator}{msg}"
-            redis_client.lpush(MESSAGE_HISTORY_KEY, message_data)
-            redis_client.ltrim(MESSAGE_HISTORY_KEY, 0, MAX_MESSAGES - 1)
+            if current_app.config.get('WRITE_BEHIND_ENABLED'):
+                _get_writer().submit(room, nickname, msg, color)
+                return {'ts': int(time.time() * 1000), 'nickname': nickname, 'msg': msg, 'color': color}
+            message = message_store.append_message(
+                room, nickname, msg, color,
+                maxlen=current_app.config.get('MESSAGE_STREAM_MAXLEN', message_store.DEFAULT_STREAM_MAXLEN),
+                notify_topic=HISTORY_TOPIC)
+            # Keep the join-time snapshot in step without another Redis read
+            _append_to_history_snapshot(room, message)
+            return message
         except Exception as e:
-            logging.error(f"Redis error adding message: {e}")
+            logging.error(f"Redis error adding message to {room}, buffering it: {e}")
+            # Degraded mode: keep it in memory, show it to joiners, write it back once Redis returns
+            ts = int(time.time() * 1000)
+            resilience.buffer_message(room, message_store.encode_message(nickname, msg, color), ts)
+            message = {'ts': ts, 'nickname': nickname, 'msg': msg, 'color': color}
+            _append_to_history_snapshot(room, message) # No stream ID yet: replaced on the next rebuild
+            return message
     else:
         logging.warning("Redis client not available, message not stored.")
+    return None
 
-def get_message_history():
-    """Retrieves message history strings from Redis."""
+def history_tail_size():
+    """Messages pushed to a client joining a room; older ones are fetched over HTTP (see app/api.py)."""
+    return current_app.config.get('HISTORY_TAIL_SIZE', 20)
+
+@metrics.timed('get_message_history')
+def get_message_history(room=GENERAL_ROOM):
+    """Retrieves the newest HISTORY_TAIL_SIZE decoded messages of a room from Redis, oldest first."""
     if redis_client:
         try:
-            return redis_client.lrange(MESSAGE_HISTORY_KEY, 0, MAX_MESSAGES - 1)
+            return message_store.latest_messages(room, history_tail_size())
         except Exception as e:
-            logging.error(f"Redis error getting message history: {e}")
+            logging.error(f"Redis error getting message history for {room}: {e}")
+            return _degraded_history(room)
     return [] # Return empty list if no Redis or error
 
+def _degraded_history(room):
+    """History while Redis is down: the last snapshot (however old) plus messages buffered since."""
+    snapshot = _history_snapshots.get(room)
+    # Only stored messages (with a stream ID): buffered ones in an earlier degraded snapshot are added below
+    messages = [message for message in snapshot['messages'] if message.get('id')] if snapshot else []
+    for fields, ts in resilience.buffered_messages(room):
+        messages.append(dict(message_store.decode_entry(f"{ts}-0", fields), id=None)) # No stream ID yet
+    return messages[-history_tail_size():]
+
+@metrics.timed('get_message_page')
+def get_message_page(room, cursor, limit):
+    """Retrieves one page of a room's messages older than `cursor`. Returns (messages, next_cursor).
+
+    Pages come from the Redis stream and, past its start, from the Postgres archive.
+    """
+    messages, next_cursor = [], None
+    if redis_client:
+        try:
+            messages, next_cursor = message_store.messages_before(room, cursor, limit)
+        except Exception as e:
+            logging.error(f"Redis error getting message page of {room} before {cursor}: {e}")
+            return [], None
+    if next_cursor is None and len(messages) < limit and current_app.config.get('ARCHIVE_ENABLED', True):
+        # Reached the start of the Redis stream: continue with older messages from the Postgres archive
+        try:
+            older, next_cursor = archive.messages_before(room, messages[0]['id'] if messages else cursor,
+                                                         limit - len(messages))
+            messages = older + messages
+        except Exception as e:
+            logging.error(f"Database error getting archived messages of {room} before {cursor}: {e}")
+    return messages, next_cursor
+
+def _store_history_snapshot(room, messages, built_at=None):
+    """Replaces a room's cached snapshot with an oldest-first list of message dicts."""
+    _history_snapshots[room] = {
+        'messages': messages,
+        'payload': json.dumps({'room': room, 'messages': messages}, separators=(',', ':')),
+        'built_at': time.monotonic() if built_at is None else built_at,
+    }
+    _history_snapshots.move_to_end(room)
+    while len(_history_snapshots) > current_app.config.get('HISTORY_SNAPSHOT_ROOMS', 256):
+        _history_snapshots.popitem(last=False) # Evict the least recently used room
+
+def _fresh_snapshot(room):
+    """Returns the room's snapshot if it is younger than HISTORY_SNAPSHOT_MAX_AGE, else None."""
+    snapshot = _history_snapshots.get(room)
+    max_age = current_app.config.get('HISTORY_SNAPSHOT_MAX_AGE', 30.0)
+    if snapshot is not None and time.monotonic() - snapshot['built_at'] < max_age:
+        return snapshot
+    return None
+
+def _append_to_history_snapshot(room, message):
+    """Incrementally applies a locally added message to a fresh snapshot."""
+    with _history_snapshot_lock:
+        snapshot = _fresh_snapshot(room)
+        if snapshot is None:
+            return # Next reader rebuilds from Redis anyway
+        messages = (snapshot['messages'] + [message])[-history_tail_size():]
+        # Keep the original build time: other workers' messages are no fresher than before
+        _store_history_snapshot(room, messages, built_at=snapshot['built_at'])
+
+def invalidate_history_snapshot(room):
+    """Forces the next client joining the room to rebuild its snapshot from Redis."""
+    with _history_snapshot_lock: # Waits out an in-flight rebuild that may predate the change
+        _history_snapshots.pop(room, None)
+
+def _on_remote_history_change(payload):
+    """Cluster handler: another worker stored messages, so drop our snapshots of those rooms."""
+    for room in payload.get('rooms', ()):
+        invalidate_history_snapshot(room)
+
+cluster.on(HISTORY_TOPIC, _on_remote_history_change)
+
+def get_history_snapshot(room=GENERAL_ROOM):
+    """Returns a room's history_batch payload, pre-serialized as JSON (messages oldest first).
+
+    Redis is read at most once per HISTORY_SNAPSHOT_MAX_AGE (or after an
+    invalidation), no matter how many clients join the room in that window.
+    """
+    with _history_snapshot_lock:
+        snapshot = _fresh_snapshot(room)
+        if snapshot is None:
+            _store_history_snapshot(room, get_message_history(room))
+            snapshot = _history_snapshots[room]
+        else:
+            _history_snapshots.move_to_end(room)
+        return snapshot['payload']
+
+@metrics.timed('add_online_user')
 def add_online_user(sid, nickname):
-    """Maps a SocketIO SID to a nickname in Redis."""
+    """Maps a SID to a nickname in the presence store, filed under this worker's node."""
     if redis_client and nickname and sid:
         try:
-            redis_client.hset(SID_NICKNAME_MAP_KEY, sid, nickname)
+            presence.connect(sid, nickname)
             logging.info(f"Mapped SID {sid} to nickname {nickname}")
         except Exception as e:
             logging.error(f"Redis error adding online user {nickname}: {e}")
     # Silently ignore if no redis or missing data
 
+@metrics.timed('remove_online_user')
 def remove_online_user(sid):
-    """Removes SID mapping from Redis and returns the associated nickname."""
+    """Unregisters a SID from the presence store and every room it was in.
+
+    Returns (nickname, [(room, version), ...]) listing the rooms where this
+    was the user's last socket. nickname is None if the SID wasn't mapped.
+    """
     if redis_client and sid:
         try:
-            nickname = redis_client.hget(SID_NICKNAME_MAP_KEY, sid)
+            nickname, left_rooms = presence.disconnect(sid)
             if nickname:
-                redis_client.hdel(SID_NICKNAME_MAP_KEY, sid)
                 logging.info(f"Removed SID {sid} (nickname {nickname}) from map")
-                return nickname # Return nickname that left
-            # else: SID wasn't in map
+            return nickname, left_rooms
         except Exception as e:
             logging.error(f"Redis error removing online user (SID: {sid}): {e}")
-    return None # Return None if not found or error or no redis
+            nickname = _sid_nicknames.get(sid)
+            if nickname:
+                _presence_gone[sid] = nickname # Removed from Redis once it is back
+            return nickname, [] # Rooms are told when presence is reconciled
+    return None, [] # Not found or error or no redis
 
-def get_online_users():
-    """Gets a unique, sorted list of online nicknames from Redis."""
+@metrics.timed('add_room_member')
+def add_room_member(sid, nickname, room):
+    """Counts a SID into a room's presence. Returns (joined, version)."""
     if redis_client:
         try:
-            # Get unique nicknames from the values in the SID map
-            users = redis_client.hvals(SID_NICKNAME_MAP_KEY)
-            unique_users = sorted(list(set(users)))
-            # logging.info(f"Current online users (from SID map): {unique_users}") # Verbose
-            return unique_users
+            return presence.join(sid, nickname, room)
         except Exception as e:
-            logging.error(f"Redis error getting online users: {e}")
-    return [] # Return empty list if no Redis or error
+            logging.error(f"Redis error joining {nickname} to {room}: {e}")
+    return False, None
+
+@metrics.timed('remove_room_member')
+def remove_room_member(sid, nickname, room):
+    """Counts a SID out of a room's presence. Returns (left, version)."""
+    if redis_client:
+        try:
+            return presence.leave(sid, nickname, room)
+        except Exception as e:
+            logging.error(f"Redis error removing {nickname} from {room}: {e}")
+    return False, None
+
+@metrics.timed('get_online_users')
+def get_online_users(room=GENERAL_ROOM):
+    """Gets the sorted list of nicknames in a room and its presence version from Redis."""
+    if redis_client:
+        try:
+            return presence.snapshot(room)
+        except Exception as e:
+            logging.error(f"Redis error getting online users for {room}: {e}")
+            # Degraded mode: this worker's own sockets; version None until presence is reconciled
+            return sorted({_sid_nicknames[sid] for sid, joined in _sid_rooms.items()
+                           if room in joined and sid in _sid_nicknames}), None
+    return [], None # Return empty list if no Redis or error
 
 # get_nickname_from_sid not currently used by handlers, but keep for potential future use
+@metrics.timed('get_nickname_from_sid')
 def get_nickname_from_sid(sid):
     """Gets nickname associated with a specific SID from Redis."""
     if redis_client and sid:
         try:
-            return redis_client.hget(SID_NICKNAME_MAP_KEY, sid)
+            return presence.nickname_for_sid(sid)
         except Exception as e:
             logging.error(f"Redis error getting nickname from SID {sid}: {e}")
     return None
 
+def _presence_maintenance_loop(heartbeat_interval, reaper_interval, ttl):
+    """Background task: keeps this node's heartbeat alive and reaps dead nodes' SIDs."""
+    next_reap = time.monotonic() + reaper_interval
+    while True:
+        socketio.sleep(heartbeat_interval)
+        try:
+            presence.heartbeat(ttl)
+            if time.monotonic() >= next_reap:
+                next_reap = time.monotonic() + reaper_interval
+                for nickname, room, version in presence.reap_dead_nodes():
+                    logging.info(f"Reaped stale presence for {nickname} in {room}")
+                    socketio.emit('status', {'room': room, 'msg': f'{nickname} has left the chat.'}, to=room)
+                    socketio.emit('user_left', {'room': room, 'nickname': nickname, 'version': version}, to=room)
+        except Exception as e:
+            logging.error(f"Redis error in presence heartbeat/reaper: {e}")
+
+# === Recovery after a Redis outage (see app/resilience.py) ===
+
+REPLAY_BATCH = 500 # Buffered messages written back per pipelined round trip
+
+def _replay_buffered_messages():
+    """Writes the messages buffered during the outage back to their room streams, in bulk and in order.
+
+    Each keeps its original time as its stream ID ("<ms>-*"). If another worker has written newer
+    entries to the stream in the meantime, Redis assigns a fresh ID instead.
+    """
+    maxlen = current_app.config.get('MESSAGE_STREAM_MAXLEN', message_store.DEFAULT_STREAM_MAXLEN)
+    while True:
+        batch = resilience.take_buffered(REPLAY_BATCH)
+        if not batch:
+            return
+        rooms = sorted({room for room, _, _ in batch})
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for room, fields, ts in batch:
+                pipe.xadd(message_store.stream_key(room), fields, id=f"{ts}-*", maxlen=maxlen, approximate=True)
+            results = pipe.execute(raise_on_error=False)
+            pipe = redis_client.pipeline(transaction=False)
+            for (room, fields, _), result in zip(batch, results):
+                if isinstance(result, Exception): # ID not above the stream's last one
+                    pipe.xadd(message_store.stream_key(room), fields, maxlen=maxlen, approximate=True)
+            message_store.mark_unarchived(pipe, rooms)
+            cluster.publish(HISTORY_TOPIC, {'rooms': rooms}, pipe=pipe)
+            pipe.execute()
+        except Exception as e:
+            resilience.return_buffered(batch)
+            logging.error(f"Redis error replaying {len(batch)} buffered messages, will retry on recovery: {e}")
+            return
+        resilience.count_replayed(len(batch))
+        for room in rooms:
+            invalidate_history_snapshot(room)
+        logging.info(f"Replayed {len(batch)} messages buffered while Redis was unavailable")
+
+def _reconcile_presence():
+    """Re-registers every local socket in Redis presence and drops the ones that left during the outage.
+
+    All of this worker's sockets are written back, not only those that changed: a Redis restart
+    (no persistence) loses the presence keys of sockets that stayed connected throughout.
+    connect() and join() are idempotent, so sockets Redis still knows are left as they are.
+    Every open room then gets a fresh member list, replacing the local-only ones sent meanwhile.
+    """
+    gone = dict(_presence_gone)
+    _presence_gone.clear()
+    local = {sid: (_sid_nicknames[sid], set(joined)) for sid, joined in list(_sid_rooms.items())
+             if sid in _sid_nicknames}
+    try:
+        presence.heartbeat(current_app.config.get('PRESENCE_NODE_TTL', 30)) # Node keys may be gone too
+        for sid in gone:
+            presence.disconnect(sid)
+        pipe = redis_client.pipeline(transaction=False)
+        for sid in local:
+            pipe.smembers(presence.sid_rooms_key(sid))
+        stored_rooms = pipe.execute() if local else []
+        for (sid, (nickname, joined)), stored in zip(local.items(), stored_rooms):
+            presence.connect(sid, nickname)
+            for room in stored - joined:
+                presence.leave(sid, nickname, room)
+            for room in joined - stored:
+                presence.join(sid, nickname, room)
+        for room in set().union(*(joined for _, joined in local.values())):
+            users, version = presence.snapshot(room)
+            socketio.emit('user_list_update', {'room': room, 'users': users, 'version': version}, to=room)
+    except Exception as e:
+        # Keep the departures for the next recovery; live sockets are all re-registered then anyway
+        for sid, nickname in gone.items():
+            _presence_gone.setdefault(sid, nickname)
+        logging.error(f"Redis error reconciling presence after an outage: {e}")
+        return
+    logging.info(f"Re-registered {len(local)} local sockets and dropped {len(gone)} departed ones after an outage")
+
+def _on_redis_recovered():
+    _replay_buffered_messages()
+    _reconcile_presence()
+
+resilience.on_recovery(_on_redis_recovered)
+
+def _ensure_background_tasks():
+    """Registers this node and starts its heartbeat/reaper, cluster listener, email sender, archiver and typing tasks, once per process."""
+    if _background_tasks['started'] or not redis_client:
+        return
+    config = current_app.config
+    ttl = config.get('PRESENCE_NODE_TTL', 30)
+    try:
+        presence.heartbeat(ttl) # Alive before the first SID is filed under this node
+    except Exception as e:
+        logging.error(f"Redis error registering presence node: {e}")
+        return # Retried on the next connection
+    _background_tasks['started'] = True
+    atexit.register(presence.retire_node)
+    cluster.start_listener(current_app._get_current_object())
+    mail_queue.start_sender(current_app._get_current_object()) # Also drains retries queued by other workers
+    archive.start_archiver(current_app._get_current_object()) # Drains only on the worker holding the lease
+    typing_status.start_ticker(current_app._get_current_object()) # Coalesced typing_update emits
+    socketio.start_background_task(_presence_maintenance_loop,
+                                   config.get('PRESENCE_HEARTBEAT_INTERVAL', 10),
+                                   config.get('PRESENCE_REAPER_INTERVAL', 30),
+                                   ttl)
+    logging.info(f"Presence node {presence.node_id()} registered")
+
+def send_user_list(sid, room):
+    """Sends a room's full member list (with its presence version) to one client."""
+    users, version = get_online_users(room)
+    emit('user_list_update', {'room': room, 'users': users, 'version': version}, room=sid)
+
+def enter_room(sid, nickname, room):
+    """Joins a socket to a room: presence, member list and history for that room only."""
+    join_room(room)
+    _sid_rooms.setdefault(sid, set()).add(room)
+    joined, version = add_room_member(sid, nickname, room)
+    if joined: # First open socket for this user in the room; extra tabs stay quiet
+        # Notify room members of the new user
+        emit('status', {'room': room, 'msg': f'{nickname} has joined the chat.'}, to=room)
+        # Send only the change to the room; clients apply it to their own list
+        emit('user_joined', {'room': room, 'nickname': nickname, 'version': version}, to=room)
+    # The joining client gets the full list and the history once, as single frames
+    send_user_list(sid, room)
+    emit('history_batch', get_history_snapshot(room), room=sid)
+
+def exit_room(sid, nickname, room):
+    """Removes a socket from a room and tells the room if the user is gone."""
+    leave_room(room)
+    _sid_rooms.get(sid, set()).discard(room)
+    left, version = remove_room_member(sid, nickname, room)
+    if left:
+        typing_status.stop_typing(room, nickname)
+        emit('status', {'room': room, 'msg': f'{nickname} has left the chat.'}, to=room)
+        emit('user_left', {'room': room, 'nickname': nickname, 'version': version}, to=room)
+
+def in_room(sid, room):
+    """O(1) check that a local socket has joined a room."""
+    return room in _sid_rooms.get(sid, ())
+
+def allow(action, room=None):
+    """Applies the rate limits for `action`; tells the client to slow down and returns False if over."""
+    allowed, retry_after_ms, scope = rate_limit.check(action, current_user.username, room)
+    if not allowed:
+        logging.info(f"Rate limited {action} by {current_user.username} ({scope} limit, retry in {retry_after_ms}ms)")
+        emit('slow_down', {'action': action, 'room': room, 'scope': scope, 'retry_after_ms': retry_after_ms,
+                           'msg': 'You are sending too fast. Please wait a moment.'}, room=request.sid)
+    return allowed
+
+def _room_from(data):
+    """Extracts the target room from an event payload (defaults to the general room)."""
+    room = data.get('room', GENERAL_ROOM) if isinstance(data, dict) else GENERAL_ROOM
+    return room if rooms.is_valid_room_name(room) else None
+
+
+def message_writer_stats():
+    """Write-behind batch statistics for this worker."""
+    return _writer.stats() if _writer else {'batches': 0, 'messages': 0}
+
+def presence_stats():
+    """Presence node identity and stale-entry reaping counters for this worker."""
+    return dict(presence.reaper_stats, node=presence.node_id())
+
+def broadcast_stats():
+    """Broadcast coalescing (messages per frame) for this worker."""
+    return _broadcaster.stats() if _broadcaster else {'messages': 0, 'frames': 0}
+
+register_stats_provider('message_writer', message_writer_stats)
+register_stats_provider('presence', presence_stats)
+register_stats_provider('broadcast', broadcast_stats)
+register_stats_provider('redis_breaker', resilience.stats)
+
 
 # === SocketIO Event Handlers ===
 
 @socketio.on('connect')
-def handle_connect():
+@metrics.handler('connect')
+def handle_connect(auth=None):
     """Handles new client connections after user is authenticated."""
     if not current_user.is_authenticated:
         logging.warning(f"Unauthenticated SocketIO connection attempt denied: {request.sid}")
@@ -100,61 +500,41 @@ def handle_connect():
     nickname = current_user.username
     sid = request.sid
     logging.info(f'Authenticated client connected: {nickname} ({sid})')
+    metrics.LIVE_CONNECTIONS.inc()
+    _sid_nicknames[sid] = nickname
 
-    # Add user to room and Redis map
-    join_room(GENERAL_ROOM)
+    # Add user to the Redis map (filed under this worker's presence node)
+    _ensure_background_tasks()
     add_online_user(sid, nickname)
 
-    # Notify room members of the new user
-    emit('status', {'msg': f'{nickname} has joined the chat.'}, to=GENERAL_ROOM)
-    # Broadcast updated user list to everyone
-    emit('user_list_update', get_online_users(), broadcast=True)
-
-    # Send message history only to the newly connected client
-    history = get_message_history()
-    history.reverse() # Show oldest messages first
-    for msg_data in history:
-        try:
-            separator = "|||"
-            parts = msg_data.split(separator, 2)
-            hist_nick = "Error"
-            hist_color = '#888888' # Default error color
-            hist_msg = "(message format error)"
-
-            if len(parts) == 3:
-                hist_nick, hist_color, hist_msg = parts
-                if not hist_color.startswith('#') or len(hist_color) != 7:
-                    hist_color = '#000000' # Default color if format invalid
-            elif len(parts) == 1: # Handle potential old format "nickname: msg"
-                legacy_parts = msg_data.split(":", 1)
-                hist_nick = legacy_parts[0]
-                hist_msg = legacy_parts[1].strip() if len(legacy_parts) > 1 else ""
-                hist_color = '#000000' # Default color for old format
-
-            # Emit historical message with color to the connecting client only
-            emit('chat_message', {'nickname': hist_nick, 'msg': hist_msg, 'color': hist_color}, room=sid)
-        except Exception as e:
-            logging.error(f"Error processing history message '{msg_data}': {e}")
+    # Everyone starts in the general room; other rooms are opened with 'join_room'
+    enter_room(sid, nickname, GENERAL_ROOM)
 
 
 @socketio.on('disconnect')
-def handle_disconnect():
+@metrics.handler('disconnect')
+def handle_disconnect(reason=None):
     """Handles client disconnections."""
     sid = request.sid
-    # Remove user from Redis map, get their nickname if found
-    nickname = remove_online_user(sid)
+    if _sid_rooms.pop(sid, None) is not None: # Only sockets that completed connect were counted
+        metrics.LIVE_CONNECTIONS.dec()
+    # Remove user from Redis map and all their rooms, get their nickname if found
+    nickname, left_rooms = remove_online_user(sid)
+    _sid_nicknames.pop(sid, None)
     if nickname:
-        # If user was mapped, leave room and notify others
-        leave_room(GENERAL_ROOM)
+        # Socket.IO drops the SID from its rooms itself; just notify the rooms the user left
         logging.info(f'Client disconnected: {nickname} ({sid})')
-        emit('status', {'msg': f'{nickname} has left the chat.'}, to=GENERAL_ROOM)
-        emit('user_list_update', get_online_users(), broadcast=True) # Update user list for all
+        for room, version in left_rooms: # Rooms where this was the user's last socket
+            typing_status.stop_typing(room, nickname)
+            emit('status', {'room': room, 'msg': f'{nickname} has left the chat.'}, to=room)
+            emit('user_left', {'room': room, 'nickname': nickname, 'version': version}, to=room)
     else:
         # Might be unauthenticated user or already cleaned up
         logging.info(f'Unmapped client disconnected: {sid}')
 
 
 @socketio.on('set_color')
+@metrics.handler('set_color')
 def handle_set_color(data):
     """Handles client sending a new nickname color preference."""
     if not current_user.is_authenticated:
@@ -168,6 +548,8 @@ def handle_set_color(data):
         logging.warning(f"Invalid color format '{new_color}' from {current_user.username}")
         emit('error', {'msg': 'Invalid color format (#RRGGBB required).'}, room=request.sid)
         return
+    if not allow('set_color'):
+        return
 
     try:
         # Use db.session.get for safe primary key lookup
@@ -175,6 +557,7 @@ def handle_set_color(data):
         if user:
             user.nickname_color = new_color
             db.session.commit() # Save change to Postgres
+            user_cache.invalidate(user.id) # Every worker picks up the new color on its next lookup
             logging.info(f"User {user.username} updated nickname color to {new_color}")
             # emit('status', {'msg': f'Color updated to {new_color}'}, room=request.sid) # Optional confirmation
         else:
@@ -186,6 +569,7 @@ def handle_set_color(data):
 
 
 @socketio.on('new_message')
+@metrics.handler('new_message')
 def handle_new_message(data):
     """Handles receiving and broadcasting new chat messages."""
     if not current_user.is_authenticated:
@@ -197,16 +581,197 @@ def handle_new_message(data):
     user_color = current_user.nickname_color or '#000000' # Default to black
     sid = request.sid
     msg = data.get('msg', '')
+    room = _room_from(data)
+    if not room or not in_room(sid, room):
+        emit('error', {'msg': 'Join the room before sending messages to it.'}, room=sid)
+        return
 
     if msg.strip() and nickname: # Process only if message not empty/whitespace
+        if not allow('new_message', room): # Per-user and per-room token buckets
+            return
         msg = msg.strip() # Trim whitespace
-        logging.info(f'Message from {nickname} ({sid}) color {user_color}: {msg}')
-        # Add message with color to Redis history
-        add_message(nickname, msg, user_color)
-        # Broadcast message, including sender's color, to the general room
-        emit('chat_message',
-             {'nickname': nickname, 'msg': msg, 'color': user_color},
-             to=GENERAL_ROOM) # Use to=GENERAL_ROOM to send to everyone
+        logging.info(f'Message from {nickname} ({sid}) in {room} color {user_color}: {msg}')
+        # Add message with color to Redis history (assigns its id and timestamp)
+        message = add_message(nickname, msg, user_color, room)
+        if message is None: # Not stored, still deliver it live
+            message = {'nickname': nickname, 'msg': msg, 'color': user_color}
+        message['room'] = room
+        # Broadcast message, including sender's color, to that room's members only
+        broadcast_message(room, message)
+        typing_status.stop_typing(room, nickname) # Sending ends the typing indicator
     elif nickname: # Message was empty or just whitespace
          logging.warning(f"Empty message received from {nickname} ({sid})")
-    # No need for else, shouldn't happen if authenticated
\ No newline at end of file
+    # No need for else, shouldn't happen if authenticated
+
+
+@socketio.on('typing')
+@metrics.handler('typing')
+def handle_typing(data):
+    """Records that the user started/stopped typing; rooms hear about it in the next typing_update tick."""
+    if not current_user.is_authenticated:
+        return
+    room = _room_from(data)
+    if not room or not in_room(request.sid, room):
+        return # Silently ignored: typing events are best-effort
+    typing_status.set_typing(room, current_user.username, bool(data.get('typing')))
+
+
+@socketio.on('direct_message')
+@metrics.handler('direct_message')
+def handle_direct_message(data):
+    """Sends a private message to every open tab of another user (and the sender's own tabs)."""
+    if not current_user.is_authenticated:
+        return
+
+    nickname = current_user.username
+    sid = request.sid
+    data = data if isinstance(data, dict) else {}
+    recipient = data.get('to')
+    msg = data.get('msg', '')
+    if not isinstance(recipient, str) or not recipient or recipient == nickname:
+        emit('error', {'msg': 'Choose another user to message.'}, room=sid)
+        return
+    if not isinstance(msg, str) or not msg.strip():
+        return
+    if not redis_client:
+        emit('error', {'msg': 'Direct messages are unavailable right now.'}, room=sid)
+        return
+    if not allow('direct_message'):
+        return
+
+    try:
+        # Every socket of both users, whatever worker it is on: two SMEMBERS, one round trip
+        recipient_sids, sender_sids = direct_messages.recipients(nickname, recipient)
+        if not recipient_sids and db.session.scalar(db.select(User.id).filter_by(username=recipient)) is None:
+            emit('error', {'msg': f'No user named {recipient}.'}, room=sid)
+            return
+        message = direct_messages.append(nickname, recipient, msg.strip(),
+                                         current_user.nickname_color or '#000000',
+                                         current_app.config.get('DM_HISTORY_MAXLEN', 1000))
+    except Exception as e:
+        logging.error(f"Redis error sending direct message from {nickname} to {recipient}: {e}")
+        emit('error', {'msg': 'Server error sending message.'}, room=sid)
+        return
+    metrics.DM_DELIVERIES.labels('online' if recipient_sids else 'offline').inc()
+    # One emit addressed to the SIDs; the message queue carries it to the workers holding them
+    socketio.emit('direct_message', message, to=sorted(recipient_sids | sender_sids | {sid}))
+    if not recipient_sids:
+        emit('status', {'msg': f'{recipient} is offline; they will see your message next time they open it.'},
+             room=sid)
+
+
+@socketio.on('load_dm_history')
+@metrics.handler('load_dm_history')
+def handle_load_dm_history(data):
+    """Sends the requesting client one page of its conversation with another user."""
+    if not current_user.is_authenticated or not redis_client:
+        return
+
+    data = data if isinstance(data, dict) else {}
+    other = data.get('with')
+    cursor = data.get('before')
+    if not isinstance(other, str) or not other or (cursor is not None and not message_store.is_valid_cursor(cursor)):
+        emit('error', {'msg': 'Invalid direct message history request.'}, room=request.sid)
+        return
+    try:
+        limit = max(1, min(int(data.get('limit', current_app.config.get('HISTORY_PAGE_SIZE', 50))), HISTORY_PAGE_MAX))
+    except (TypeError, ValueError):
+        limit = current_app.config.get('HISTORY_PAGE_SIZE', 50)
+
+    try:
+        messages, next_cursor = direct_messages.messages_before(current_user.username, other, cursor, limit)
+    except Exception as e:
+        logging.error(f"Redis error loading direct messages of {current_user.username} with {other}: {e}")
+        emit('error', {'msg': 'Server error loading messages.'}, room=request.sid)
+        return
+    emit('dm_history', {'with': other, 'messages': messages, 'next_cursor': next_cursor}, room=request.sid)
+
+
+@socketio.on('request_user_list')
+@metrics.handler('request_user_list')
+def handle_request_user_list(data=None):
+    """Sends a full presence snapshot to a client that detected a version gap."""
+    if not current_user.is_authenticated:
+        return
+    room = _room_from(data)
+    if room and in_room(request.sid, room):
+        send_user_list(request.sid, room)
+
+
+@socketio.on('load_history')
+@metrics.handler('load_history')
+def handle_load_history(data):
+    """Sends the requesting client one page of messages older than its cursor.
+
+    Kept for older clients; the chat page now fetches pages from GET /api/rooms/<room>/messages.
+    """
+    if not current_user.is_authenticated:
+        return
+
+    data = data if isinstance(data, dict) else {}
+    room = _room_from(data)
+    if not room or not in_room(request.sid, room):
+        emit('error', {'msg': 'Join the room before loading its history.'}, room=request.sid)
+        return
+    cursor = data.get('before')
+    if cursor is not None and not isinstance(cursor, str):
+        emit('error', {'msg': 'Invalid history cursor.'}, room=request.sid)
+        return
+    try:
+        limit = max(1, min(int(data.get('limit', current_app.config.get('HISTORY_PAGE_SIZE', 50))), HISTORY_PAGE_MAX))
+    except (TypeError, ValueError):
+        limit = current_app.config.get('HISTORY_PAGE_SIZE', 50)
+
+    messages, next_cursor = get_message_page(room, cursor, limit)
+    emit('history_page', {'room': room, 'messages': messages, 'next_cursor': next_cursor}, room=request.sid)
+
+
+@socketio.on('join_room')
+@metrics.handler('join_room')
+def handle_join_room(data):
+    """Opens a room for this socket, creating it if needed, and sends its members and history."""
+    if not current_user.is_authenticated:
+        return
+    sid = request.sid
+    room = data.get('room') if isinstance(data, dict) else None
+    if not rooms.is_valid_room_name(room):
+        emit('error', {'msg': 'Room names are 1-32 lowercase letters, digits, "_" or "-".'}, room=sid)
+        return
+    if in_room(sid, room):
+        return # Already open
+    if len(_sid_rooms.get(sid, ())) >= MAX_ROOMS_PER_SOCKET:
+        emit('error', {'msg': f'You can have at most {MAX_ROOMS_PER_SOCKET} rooms open.'}, room=sid)
+        return
+    try:
+        if not rooms.room_exists(room) and rooms.create_room(room):
+            logging.info(f"Room {room} created by {current_user.username}")
+    except Exception as e:
+        logging.error(f"Redis error registering room {room}: {e}")
+        emit('error', {'msg': 'Server error opening room.'}, room=sid)
+        return
+    enter_room(sid, current_user.username, room)
+
+
+@socketio.on('leave_room')
+@metrics.handler('leave_room')
+def handle_leave_room(data):
+    """Closes a room for this socket."""
+    if not current_user.is_authenticated:
+        return
+    room = _room_from(data)
+    if room and in_room(request.sid, room):
+        exit_room(request.sid, current_user.username, room)
+
+
+@socketio.on('list_rooms')
+@metrics.handler('list_rooms')
+def handle_list_rooms():
+    """Sends the registered room names to the requesting client."""
+    if not current_user.is_authenticated:
+        return
+    try:
+        room_names = rooms.list_rooms()
+    except Exception as e:
+        logging.error(f"Redis error listing rooms: {e}")
+        room_names = [GENERAL_ROOM]
+    emit('room_list', {'rooms': room_names}, room=request.sid)
@@ -0,0 +1,123 @@
+# app/hashing.py
+"""Password hashing off the eventlet hub.
+
+PBKDF2 is a deliberate CPU burst (hundreds of milliseconds). Run inline on an
+eventlet worker it blocks the hub, so every socket on the worker stalls while
+someone logs in. Hashing and verification run in eventlet's pool of native
+threads instead (hashlib releases the GIL while it works), so only the green
+thread making the request waits.
+
+The pool is bounded: PASSWORD_HASH_THREADS native threads and at most
+PASSWORD_HASH_QUEUE_LIMIT requests waiting for one. Beyond that, requests are
+refused with HashingBusy instead of queueing without limit.
+"""
+import logging
+import threading
+import time
+from eventlet import tpool
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from .ops import register_stats_provider
+
+HASH_METHOD = 'pbkdf2:sha256'
+SALT_LENGTH = 16
+
+
+class HashingBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
+
+class PasswordHasher:
+    """Runs hash functions in native threads, with a queue limit and timing counters."""
+
+    def __init__(self, threads=2, queue_limit=32, offload=True):
+        self.threads = threads
+        self.queue_limit = queue_limit
+        self.offload = offload
+        self._lock = threading.Lock() # Guards the counters below
+        self.in_flight = 0 # Running or waiting for a thread
+        self.calls = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+        if offload:
+            tpool.set_num_threads(threads) # Only takes effect before tpool's first use in this process
+
+    def run(self, fn, *args):
+        """Calls fn(*args) in the pool and returns its result. Raises HashingBusy if the queue is full."""
+        with self._lock:
+            if self.in_flight >= self.threads + self.queue_limit:
+                self.rejected += 1
+                raise HashingBusy()
+            self.in_flight += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            result = fn(*args)
+            return result, started, time.perf_counter()
+
+        try:
+            result, started, finished = tpool.execute(timed) if self.offload else timed()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        self._record(started - submitted, finished - started)
+        return result
+
+    def _record(self, queue_wait, hash_time):
+        with self._lock:
+            self.calls += 1
+            self.queue_wait_total += queue_wait
+            self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+            self.hash_time_total += hash_time
+            self.hash_time_max = max(self.hash_time_max, hash_time)
+
+    def stats(self):
+        """Pool counters for /ops/stats (times in milliseconds)."""
+        calls = self.calls or 1
+        return {
+            'offload': self.offload,
+            'threads': self.threads,
+            'queue_limit': self.queue_limit,
+            'in_flight': self.in_flight,
+            'calls': self.calls,
+            'rejected': self.rejected,
+            'avg_queue_wait_ms': round(self.queue_wait_total / calls * 1000, 2),
+            'max_queue_wait_ms': round(self.queue_wait_max * 1000, 2),
+            'avg_hash_ms': round(self.hash_time_total / calls * 1000, 2),
+            'max_hash_ms': round(self.hash_time_max * 1000, 2),
+        }
+
+
+# Process-wide hasher, created from app config on first use (see _get_hasher)
+_hasher = None
+
+def _get_hasher():
+    global _hasher
+    if _hasher is None:
+        config = current_app.config
+        _hasher = PasswordHasher(threads=config.get('PASSWORD_HASH_THREADS', 2),
+                                 queue_limit=config.get('PASSWORD_HASH_QUEUE_LIMIT', 32),
+                                 offload=config.get('PASSWORD_HASH_OFFLOAD', True))
+        logging.info(f"Password hashing pool ready ({_hasher.threads} threads, offload={_hasher.offload})")
+    return _hasher
+
+
+def hash_password(password):
+    """Returns a PBKDF2 hash of `password`, computed off the hub."""
+    return _get_hasher().run(generate_password_hash, password, HASH_METHOD, SALT_LENGTH)
+
+def verify_password(password_hash, password):
+    """Checks `password` against a stored hash, off the hub."""
+    return _get_hasher().run(check_password_hash, password_hash, password)
+
+
+def hashing_stats():
+    """Password hashing pool counters for this worker."""
+    return _hasher.stats() if _hasher else {'calls': 0}
+
+register_stats_provider('password_hashing', hashing_stats)
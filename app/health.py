@@ -0,0 +1,165 @@
+# app/health.py
+"""Liveness and readiness probes, and the non-blocking start-up warm-up.
+
+    GET /healthz   the worker is up and serving requests. Checks nothing
+                   else, so a slow Redis or database never gets a pod
+                   restarted (the liveness probe)
+    GET /readyz    Redis answers PING and the database answers SELECT 1,
+                   each within HEALTH_CHECK_TIMEOUT. 200 when both pass, 503
+                   with the failing check otherwise (the readiness and
+                   startup probes)
+
+A worker that has been ready once stays ready through a Redis outage while
+the circuit breaker is open (app/resilience.py): /readyz answers 200 with
+status "degraded" and the Redis check marked "degraded", so the Service
+keeps its endpoints and degraded mode can actually serve users. The
+database stays required, and a worker that has never been ready still waits
+for Redis, so new pods do not join during an outage.
+
+create_app no longer waits for Redis or the database. Connections open on
+first use, and start_warmup runs the readiness checks in the background,
+retrying with backoff until both pass. The pools are then warm before the
+first real request arrives, and the log says when the worker became ready.
+
+Probe results are reused for READINESS_CACHE_SECONDS, so frequent probes from
+several kubelets and load balancers cost at most one check per interval per
+worker.
+"""
+import logging
+import time
+from eventlet.timeout import Timeout
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+
+from . import socketio, redis_client, db
+from . import resilience
+from .ops import register_stats_provider
+
+WARMUP_MAX_DELAY = 10.0 # Seconds between warm-up attempts, at most
+
+health = Blueprint('health', __name__)
+
+# Checks that may fail while the worker stays ready, if it was ready before: name -> "degraded mode is on"
+DEGRADABLE = {'redis': resilience.degraded}
+
+# name -> {'ok', 'status', 'latency_ms', 'error'} from the last check
+_checks = {}
+_state = {'checked_at': 0.0, 'ready': False, 'degraded': False, 'ready_since': None,
+          'started_at': time.monotonic()}
+
+
+# === Checks ===
+
+def _ping_redis():
+    if redis_client is None:
+        raise RuntimeError("no Redis URL configured")
+    redis_client.ping()
+
+def _ping_database():
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+CHECKS = {'redis': _ping_redis, 'database': _ping_database}
+
+
+def _run_check(check, timeout):
+    started = time.perf_counter()
+    result = {'ok': False, 'error': None}
+    try:
+        with Timeout(timeout):
+            check()
+        result['ok'] = True
+    except Timeout:
+        result['error'] = f"timed out after {timeout}s"
+    except Exception as e:
+        result['error'] = str(e)
+    result['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    result['status'] = 'ok' if result['ok'] else 'failing'
+    return result
+
+def refresh(timeout=None):
+    """Runs every check now. Returns (ready, {name: result})."""
+    timeout = timeout or current_app.config.get('HEALTH_CHECK_TIMEOUT', 2.0)
+    for name, check in CHECKS.items():
+        _checks[name] = _run_check(check, timeout)
+        # Once ready, an outage the app rides out in degraded mode doesn't take the worker out of service
+        if not _checks[name]['ok'] and _state['ready_since'] is not None \
+                and name in DEGRADABLE and DEGRADABLE[name]():
+            _checks[name]['status'] = 'degraded'
+    ready = all(result['status'] != 'failing' for result in _checks.values())
+    degraded = ready and any(result['status'] == 'degraded' for result in _checks.values())
+    now = time.monotonic()
+    if ready and _state['ready_since'] is None:
+        _state['ready_since'] = now
+        logging.info(f"Ready {now - _state['started_at']:.2f}s after start-up (Redis and database reachable)")
+    elif ready and not _state['ready']:
+        logging.info("Ready again")
+    elif not ready and _state['ready']:
+        failing = {name: result['error'] for name, result in _checks.items() if result['status'] == 'failing'}
+        logging.warning(f"No longer ready: {failing}")
+    if degraded != _state['degraded'] and ready:
+        logging.warning("Ready in degraded mode (Redis unavailable)" if degraded else "Left degraded mode")
+    _state.update(checked_at=now, ready=ready, degraded=degraded)
+    return ready, dict(_checks)
+
+def readiness():
+    """The cached readiness result, refreshed when older than READINESS_CACHE_SECONDS."""
+    max_age = current_app.config.get('READINESS_CACHE_SECONDS', 2.0)
+    if time.monotonic() - _state['checked_at'] > max_age:
+        return refresh()
+    return _state['ready'], dict(_checks)
+
+
+# === Warm-up ===
+
+def _warmup_loop(app):
+    """Background task: retries the checks with backoff until Redis and the database both answer."""
+    delay = 0.5
+    while True:
+        with app.app_context():
+            ready, checks = refresh()
+        if ready:
+            return
+        failing = ', '.join(f"{name} ({result['error']})" for name, result in checks.items() if not result['ok'])
+        logging.warning(f"Waiting for {failing}; retrying in {delay:.1f}s")
+        socketio.sleep(delay)
+        delay = min(delay * 2, WARMUP_MAX_DELAY)
+
+def start_warmup(app):
+    """Starts the warm-up task unless STARTUP_WARMUP is off (e.g. for CLI commands)."""
+    _state['started_at'] = time.monotonic()
+    if app.config.get('STARTUP_WARMUP', True):
+        socketio.start_background_task(_warmup_loop, app)
+
+
+# === Endpoints ===
+
+@health.route('/healthz')
+def healthz():
+    """Liveness: answering at all is the check."""
+    response = jsonify(status='ok')
+    response.cache_control.no_store = True
+    return response
+
+@health.route('/readyz')
+def readyz():
+    """Readiness: 200 when Redis and the database are reachable (or Redis is degraded), else 503."""
+    ready, checks = readiness()
+    status = ('degraded' if _state['degraded'] else 'ready') if ready else 'not ready'
+    response = jsonify(status=status, checks=checks)
+    response.status_code = 200 if ready else 503
+    response.cache_control.no_store = True
+    return response
+
+
+def stats():
+    """Readiness of this worker and how long it took to get there."""
+    ready_since = _state['ready_since']
+    return {
+        'ready': _state['ready'],
+        'degraded': _state['degraded'],
+        'seconds_to_ready': round(ready_since - _state['started_at'], 3) if ready_since else None,
+        'checks': dict(_checks),
+    }
+
+register_stats_provider('health', stats)
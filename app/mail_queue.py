@@ -0,0 +1,205 @@
+# app/mail_queue.py
+"""Redis-backed outbound email queue.
+
+Views call `enqueue(msg)` instead of `mail.send(msg)`: the message is
+serialized onto the `mail:queue` list and the request returns without
+touching SMTP. A background sender task per worker pops up to
+MAIL_QUEUE_BATCH_SIZE messages at a time and sends them over one SMTP
+connection. Failures are retried with exponential backoff (the
+`mail:retry` sorted set, scored by due time) until MAIL_MAX_ATTEMPTS, and
+permanent SMTP rejections (5xx) or exhausted messages go to the `mail:dead`
+list for inspection (`flask chat mail-requeue-dead` puts them back).
+
+Popping is not acknowledged, so a worker killed mid-batch loses that batch;
+for confirmation and reset emails the user can always ask for another one.
+"""
+import json
+import logging
+import smtplib
+import time
+import uuid
+from flask import current_app
+from flask_mail import Message
+
+from . import socketio, redis_client, mail
+from .ops import register_stats_provider
+
+QUEUE_KEY = "mail:queue" # List of JSON messages, LPUSH in / RPOP out
+RETRY_KEY = "mail:retry" # Sorted set of JSON messages scored by when to retry them
+DEAD_KEY = "mail:dead" # List of messages that will not be retried
+MESSAGE_FIELDS = ('subject', 'sender', 'recipients', 'body', 'html', 'cc', 'bcc', 'reply_to')
+
+_sender = {'started': False}
+_counters = {'enqueued': 0, 'sent': 0, 'batches': 0, 'retried': 0, 'dead_lettered': 0, 'sent_inline': 0}
+
+# Moves due retries back onto the queue in one step, so two workers never both take one.
+# KEYS: retry zset, queue. ARGV: now, max to move.
+_PROMOTE_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, entry in ipairs(due) do
+    redis.call('ZREM', KEYS[1], entry)
+    redis.call('LPUSH', KEYS[2], entry)
+end
+return #due
+"""
+_promote_script = redis_client.register_script(_PROMOTE_LUA) if redis_client else None
+
+
+# === Serialization ===
+
+def encode(msg, attempts=0, entry_id=None):
+    """Serializes a flask_mail.Message (plus retry bookkeeping) to JSON."""
+    fields = {field: getattr(msg, field, None) for field in MESSAGE_FIELDS}
+    fields.update(id=entry_id or uuid.uuid4().hex, attempts=attempts)
+    return json.dumps(fields, separators=(',', ':'))
+
+def decode(entry):
+    """Returns (Message, attempts, id) from an encoded queue entry."""
+    fields = json.loads(entry)
+    msg = Message(**{field: fields.get(field) for field in MESSAGE_FIELDS})
+    return msg, fields.get('attempts', 0), fields.get('id')
+
+
+# === Producer ===
+
+def enqueue(msg):
+    """Queues a message for the background sender. Sends inline if the queue is off or Redis is down."""
+    if redis_client and current_app.config.get('MAIL_QUEUE_ENABLED', True):
+        try:
+            redis_client.lpush(QUEUE_KEY, encode(msg))
+            _counters['enqueued'] += 1
+            start_sender(current_app._get_current_object())
+            return
+        except Exception as e:
+            logging.error(f"Redis error queueing email to {msg.recipients}, sending inline: {e}")
+    mail.send(msg)
+    _counters['sent_inline'] += 1
+
+
+# === Sender ===
+
+def is_permanent(error):
+    """True for SMTP errors that retrying will not fix (5xx replies, every recipient refused)."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+def _send_over_one_connection(messages):
+    """Sends messages in order over a single SMTP connection.
+
+    Returns (number sent, error of the message that failed or None). Errors
+    opening the connection are raised.
+    """
+    conn = mail.connect()
+    conn.__enter__() # Connects (and logs in); not a `with` so a failing QUIT can't undo the count
+    sent, error = 0, None
+    for msg in messages:
+        try:
+            conn.send(msg)
+        except Exception as e:
+            error = e
+            break
+        sent += 1
+    try:
+        conn.__exit__(None, None, None) # QUIT
+    except Exception:
+        pass # Everything counted as sent was already accepted by the server
+    return sent, error
+
+def _fail(entry, error):
+    """Schedules a failed entry for retry, or dead-letters it."""
+    msg, attempts, entry_id = decode(entry)
+    attempts += 1
+    max_attempts = current_app.config.get('MAIL_MAX_ATTEMPTS', 5)
+    if is_permanent(error) or attempts >= max_attempts:
+        redis_client.lpush(DEAD_KEY, json.dumps(dict(json.loads(entry), attempts=attempts, error=str(error)),
+                                                separators=(',', ':')))
+        _counters['dead_lettered'] += 1
+        logging.error(f"Email {entry_id} to {msg.recipients} dead-lettered after {attempts} attempts: {error}")
+        return
+    delay = current_app.config.get('MAIL_RETRY_BASE_DELAY', 30) * 2 ** (attempts - 1)
+    redis_client.zadd(RETRY_KEY, {encode(msg, attempts, entry_id): time.time() + delay})
+    _counters['retried'] += 1
+    logging.warning(f"Email {entry_id} to {msg.recipients} failed (attempt {attempts}), retrying in {delay}s: {error}")
+
+def send_batch(entries):
+    """Sends encoded entries, reusing one SMTP connection until a message fails."""
+    remaining = list(entries)
+    while remaining:
+        messages = [decode(entry)[0] for entry in remaining]
+        try:
+            sent, error = _send_over_one_connection(messages)
+        except Exception as e: # Could not connect: nothing in this batch can go out now
+            logging.error(f"SMTP connection error, retrying {len(remaining)} queued emails later: {e}")
+            for entry in remaining:
+                _fail(entry, e)
+            return
+        _counters['sent'] += sent
+        if error is None:
+            return
+        _fail(remaining[sent], error)
+        remaining = remaining[sent + 1:] # Carry on over a fresh connection
+
+def _pop_batch(batch_size, timeout):
+    """Blocks up to `timeout` seconds for one entry, then takes up to batch_size - 1 more without waiting."""
+    item = redis_client.brpop(QUEUE_KEY, timeout=timeout)
+    if item is None:
+        return []
+    pipe = redis_client.pipeline(transaction=False)
+    for _ in range(batch_size - 1):
+        pipe.rpop(QUEUE_KEY)
+    return [item[1]] + [entry for entry in pipe.execute() if entry is not None]
+
+def _sender_loop(app):
+    """Background task: promotes due retries and sends queued emails in batches."""
+    config = app.config
+    batch_size = config.get('MAIL_QUEUE_BATCH_SIZE', 20)
+    poll_interval = config.get('MAIL_QUEUE_POLL_INTERVAL', 5)
+    while True:
+        try:
+            _promote_script(keys=[RETRY_KEY, QUEUE_KEY], args=[time.time(), batch_size])
+            batch = _pop_batch(batch_size, poll_interval)
+            if batch:
+                with app.app_context():
+                    send_batch(batch)
+                _counters['batches'] += 1
+        except Exception as e:
+            logging.error(f"Error in email sender, backing off: {e}")
+            socketio.sleep(poll_interval)
+
+def start_sender(app):
+    """Starts this worker's email sender task, once per process."""
+    if _sender['started'] or not redis_client or not app.config.get('MAIL_QUEUE_ENABLED', True):
+        return
+    _sender['started'] = True
+    socketio.start_background_task(_sender_loop, app)
+    logging.info("Email sender task started")
+
+
+# === Dead letters ===
+
+def requeue_dead(limit=None):
+    """Moves dead-lettered messages back onto the queue with a fresh attempt count. Returns how many."""
+    moved = 0
+    while limit is None or moved < limit:
+        entry = redis_client.rpop(DEAD_KEY)
+        if entry is None:
+            break
+        msg, _, entry_id = decode(entry)
+        redis_client.lpush(QUEUE_KEY, encode(msg, 0, entry_id))
+        moved += 1
+    return moved
+
+
+def queue_stats():
+    """Queue depths (shared) and this worker's sender counters."""
+    stats = dict(_counters)
+    if redis_client:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.llen(QUEUE_KEY)
+        pipe.zcard(RETRY_KEY)
+        pipe.llen(DEAD_KEY)
+        stats['queued'], stats['retrying'], stats['dead'] = pipe.execute()
+    return stats
+
+register_stats_provider('mail_queue', queue_stats)
@@ -1,15 +1,18 @@
 # app/main.py
 import logging # Added logging import just in case
 import os
-from flask import Blueprint, render_template, redirect, url_for, flash, session
+from flask import Blueprint, render_template, redirect, url_for, flash, session, request, jsonify, current_app
 # Import login utilities required for protecting routes and getting user info
 from flask_login import login_required, current_user
+from .page_cache import cached # Rendered-page cache with ETag/304 (see app/page_cache.py)
+from . import search as message_search, rate_limit, rooms
 
 # Create Blueprint instance named 'main'
 main = Blueprint('main', __name__)
 
 @main.route('/')
 @main.route('/index') # Allow access via / or /index
+@cached
 def index():
     """Serves landing page. Content depends on login status (handled in template)."""
     # Renders templates/index.html
@@ -40,8 +43,9 @@ def settings():
                            title='User Settings',
                            current_color=current_color)
 @main.route('/about')
+@cached
 def about():
-    """Displays application information."""
+    """Displays application information (rendered once per build and login state, see page_cache)."""
     # Read version info passed during build as env var
     app_version = os.environ.get('APP_VERSION', 'N/A')
     # Construct links (replace with your actual username/repo)
@@ -58,5 +62,34 @@ def about():
                            issues_url=issues_url,
                            new_issue_url=new_issue_url)
 
+@main.route('/search')
+@login_required
+def search():
+    """JSON search over archived messages (see app/search.py).
+
+    Query parameters: q (required), room, author, since, until (epoch ms or
+    ISO 8601), cursor (next_cursor of the previous page) and limit.
+    """
+    allowed, retry_after_ms, _ = rate_limit.check('search', current_user.id)
+    if not allowed:
+        return jsonify(error="Searching too fast, try again shortly.", retry_after_ms=retry_after_ms), 429
+    args = request.args
+    room = args.get('room') or None
+    if room is not None and not rooms.is_valid_room_name(room):
+        return jsonify(error="Invalid room name."), 400
+    try:
+        limit = min(max(1, int(args.get('limit', current_app.config.get('SEARCH_PAGE_SIZE', 20)))),
+                    current_app.config.get('SEARCH_PAGE_MAX', 50))
+        messages, next_cursor = message_search.search(
+            args.get('q'), room=room, author=args.get('author') or None,
+            since=message_search.parse_time(args.get('since')), until=message_search.parse_time(args.get('until')),
+            cursor=args.get('cursor') or None, limit=limit)
+    except ValueError as e: # SearchError, or a non-numeric limit
+        return jsonify(error=str(e) if isinstance(e, message_search.SearchError) else "Invalid limit."), 400
+    except Exception as e:
+        logging.error(f"Error searching messages for {current_user.username}: {e}")
+        return jsonify(error="Search is unavailable right now."), 503
+    return jsonify(results=messages, next_cursor=next_cursor)
+
 # Note: The previous POST route for '/chat' (which handled the old nickname form)
 # is no longer needed because login/authentication now handles user identity.
\ No newline at end of file
@@ -0,0 +1,148 @@
+# app/message_store.py
+"""Chat message log stored in Redis Streams.
+
+Each room has one stream, ``room:<room>:stream``. Entries get their ID (and so
+their millisecond timestamp) from Redis on XADD, which makes the stream ID the
+pagination cursor. Fields are kept short to keep memory per message low:
+
+    v = encoding version, n = nickname, c = #RRGGBB color, m = message text
+"""
+import logging
+import re
+
+# Import the app Redis client created in the factory
+from . import redis_client
+from . import cluster
+
+STORE_VERSION = "1"
+DEFAULT_COLOR = '#000000'
+DEFAULT_STREAM_MAXLEN = 10000 # Approximate cap (XADD MAXLEN ~)
+LEGACY_SEPARATOR = "|||"
+STREAM_ID_RE = re.compile(r'^\d{1,20}-\d{1,20}$') # A history cursor: <ms>-<seq>
+UNARCHIVED_ROOMS_KEY = "archive:pending_rooms" # Set of rooms with messages the archiver hasn't copied yet
+
+
+def stream_key(room):
+    """Redis key of the message stream for a room."""
+    return f"room:{room}:stream"
+
+def legacy_list_key(room):
+    """Redis key of the pre-stream "|||"-encoded history list for a room."""
+    return f"room:{room}:messages"
+
+def mark_unarchived(pipe, rooms):
+    """Queues rooms for the Postgres archiver (app/archive.py) on a pipeline that just wrote to them."""
+    pipe.sadd(UNARCHIVED_ROOMS_KEY, *rooms)
+
+
+# === Encoding ===
+
+def is_valid_cursor(cursor):
+    """True if `cursor` looks like a stream ID ('1718000000123-0')."""
+    return isinstance(cursor, str) and bool(STREAM_ID_RE.match(cursor))
+
+def encode_message(nickname, msg, color):
+    """Builds the compact stream fields for one message."""
+    return {'v': STORE_VERSION, 'n': nickname, 'c': color or DEFAULT_COLOR, 'm': msg}
+
+def decode_entry(entry_id, fields):
+    """Turns a (stream ID, fields) pair into a chat_message payload dict."""
+    color = fields.get('c') or DEFAULT_COLOR
+    if not color.startswith('#') or len(color) != 7:
+        color = DEFAULT_COLOR # Default color if format invalid
+    return {
+        'id': entry_id,
+        'ts': int(entry_id.split('-', 1)[0]), # Milliseconds since epoch, assigned by Redis
+        'nickname': fields.get('n', 'Error'),
+        'msg': fields.get('m', ''),
+        'color': color,
+    }
+
+def decode_legacy_entry(msg_data):
+    """Parses one "nickname|||#color|||text" (or older "nickname: text") list entry."""
+    parts = msg_data.split(LEGACY_SEPARATOR, 2)
+    if len(parts) == 3:
+        nickname, color, msg = parts
+        if not color.startswith('#') or len(color) != 7:
+            color = DEFAULT_COLOR
+        return nickname, msg, color
+    if len(parts) == 1: # Handle old format "nickname: msg"
+        legacy_parts = msg_data.split(":", 1)
+        msg = legacy_parts[1].strip() if len(legacy_parts) > 1 else ""
+        return legacy_parts[0], msg, DEFAULT_COLOR
+    return "Error", "(message format error)", '#888888'
+
+
+# === Reads and writes ===
+
+def append_message(room, nickname, msg, color, maxlen=DEFAULT_STREAM_MAXLEN, notify_topic=None):
+    """Appends a message to the room stream and returns its decoded payload.
+
+    With `notify_topic`, other workers are told the room changed in the same round trip.
+    """
+    fields = encode_message(nickname, msg, color)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xadd(stream_key(room), fields, maxlen=maxlen, approximate=True)
+    mark_unarchived(pipe, [room])
+    if notify_topic:
+        cluster.publish(notify_topic, {'rooms': [room]}, pipe=pipe)
+    entry_id = pipe.execute()[0]
+    return decode_entry(entry_id, fields)
+
+def latest_messages(room, limit):
+    """Returns up to `limit` of the newest messages in a room, oldest first."""
+    entries = redis_client.xrevrange(stream_key(room), count=limit)
+    return [decode_entry(entry_id, fields) for entry_id, fields in reversed(entries)]
+
+def messages_before(room, cursor, limit):
+    """Returns one page of messages strictly older than `cursor` (a stream ID).
+
+    Returns (messages oldest first, next_cursor). next_cursor is the ID to pass
+    for the following page, or None once the start of the log is reached.
+    """
+    upper = f"({cursor}" if cursor else '+' # '(' makes the bound exclusive
+    entries = redis_client.xrevrange(stream_key(room), max=upper, count=limit)
+    messages = [decode_entry(entry_id, fields) for entry_id, fields in reversed(entries)]
+    next_cursor = messages[0]['id'] if len(messages) == limit else None
+    return messages, next_cursor
+
+
+# === One-shot migration from the legacy list ===
+
+# Rebuilds the stream atomically: legacy entries first (IDs 0-1, 0-2, ... since they
+# carry no timestamp), then every entry already in the stream with its original ID.
+# KEYS: legacy list, stream, scratch key. ARGV: version, then n/c/m triples oldest first.
+_MIGRATE_LUA = """
+local tmp = KEYS[3]
+redis.call('DEL', tmp)
+local seq = 0
+for i = 2, #ARGV, 3 do
+    seq = seq + 1
+    redis.call('XADD', tmp, '0-' .. seq, 'v', ARGV[1], 'n', ARGV[i], 'c', ARGV[i + 1], 'm', ARGV[i + 2])
+end
+local existing = redis.call('XRANGE', KEYS[2], '-', '+')
+for _, entry in ipairs(existing) do
+    redis.call('XADD', tmp, entry[1], unpack(entry[2]))
+end
+if seq + #existing > 0 then
+    redis.call('RENAME', tmp, KEYS[2])
+end
+redis.call('DEL', KEYS[1])
+return seq
+"""
+
+def migrate_legacy_history(room):
+    """Moves a room's legacy "|||" list into its stream. Returns entries migrated."""
+    legacy_key = legacy_list_key(room)
+    legacy = redis_client.lrange(legacy_key, 0, -1)
+    if not legacy:
+        return 0
+    args = [STORE_VERSION]
+    for msg_data in reversed(legacy): # List is newest first
+        nickname, msg, color = decode_legacy_entry(msg_data)
+        args.extend([nickname, color, msg])
+    migrated = redis_client.eval(_MIGRATE_LUA, 3,
+                                 legacy_key, stream_key(room), f"{stream_key(room)}:migrating",
+                                 *args)
+    logging.info(f"Migrated {migrated} legacy messages into {stream_key(room)}")
+    return migrated
@@ -0,0 +1,182 @@
+# app/metrics.py
+"""Prometheus metrics, served on /metrics.
+
+Socket.IO handlers and Redis helpers are timed with the `handler` and `timed`
+decorators, SQL statements through SQLAlchemy engine events, and every chat
+frame a worker delivers is counted (recipients and payload bytes) by the
+instrumented Socket.IO client manager.
+
+With several gunicorn workers in one pod, each worker has its own counters.
+Set PROMETHEUS_MULTIPROC_DIR (the Docker image does) and prometheus_client
+keeps them in shared files there; /metrics then reports the sum over all live
+workers, whichever worker answers the scrape. gunicorn.conf.py cleans up after
+workers that exit.
+"""
+import functools
+import json
+import os
+import time
+import socketio as socketio_pkg
+from flask import Blueprint, Response
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+                               generate_latest, CONTENT_TYPE_LATEST, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .ops import check_ops_token
+from . import resilience
+
+# Latency buckets from 0.5 ms to 10 s: Redis and SQL calls sit at the low end, handlers higher
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HANDLER_SECONDS = Histogram('chat_socketio_handler_seconds', 'Socket.IO event handler latency',
+                            ['event'], buckets=LATENCY_BUCKETS)
+HANDLER_ERRORS = Counter('chat_socketio_handler_errors_total', 'Socket.IO handlers that raised', ['event'])
+REDIS_SECONDS = Histogram('chat_redis_op_seconds', 'Latency of Redis-backed helpers', ['op'],
+                          buckets=LATENCY_BUCKETS)
+DB_SECONDS = Histogram('chat_db_query_seconds', 'SQL statement latency', ['statement'], buckets=LATENCY_BUCKETS)
+FANOUT_RECIPIENTS = Histogram('chat_fanout_recipients', 'Local sockets one emitted frame is delivered to',
+                              ['event'], buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+FANOUT_DELIVERIES = Counter('chat_fanout_deliveries_total', 'Frames delivered to sockets', ['event'])
+FANOUT_BYTES = Counter('chat_fanout_payload_bytes_total', 'Payload bytes delivered to sockets (JSON size)',
+                       ['event'])
+RATE_LIMIT_DECISIONS = Counter('chat_rate_limit_decisions_total', 'Rate limiter outcomes',
+                               ['action', 'result']) # result: allowed, limited_user, limited_room, error
+POOL_WAIT_SECONDS = Histogram('chat_pool_wait_seconds', 'Time spent checking a connection out of a pool',
+                              ['pool'], buckets=LATENCY_BUCKETS) # pool: database, redis
+POOL_TIMEOUTS = Counter('chat_pool_timeouts_total', 'Checkouts that gave up waiting for a free connection',
+                        ['pool'])
+ARCHIVE_ROWS = Counter('chat_archive_rows_total', 'Messages copied from Redis streams into Postgres')
+ARCHIVE_BATCH_SECONDS = Histogram('chat_archive_batch_seconds', 'Time to insert and commit one archive batch',
+                                  buckets=LATENCY_BUCKETS)
+ARCHIVE_LAG_SECONDS = Gauge('chat_archive_lag_seconds', 'Age of the oldest message in the last archive batch',
+                            multiprocess_mode='livemax')
+SEARCH_SECONDS = Histogram('chat_search_seconds', 'Message search query latency', buckets=LATENCY_BUCKETS)
+HISTORY_PAGE_REQUESTS = Counter('chat_history_page_requests_total', 'HTTP history page responses',
+                                ['outcome']) # immutable, revalidate or not_modified
+PAGE_CACHE_REQUESTS = Counter('chat_page_cache_requests_total', 'Cached page lookups',
+                              ['endpoint', 'result']) # result: local_hit, redis_hit, miss, bypassed
+BROADCAST_FRAMES = Counter('chat_broadcast_frames_total', 'Room broadcast frames sent by the coalescer',
+                           ['event']) # chat_message (single) or chat_batch
+BROADCAST_BATCH_SIZE = Histogram('chat_broadcast_batch_size', 'Messages per chat_batch frame',
+                                 buckets=(2, 3, 5, 10, 20, 50, 100))
+DM_DELIVERIES = Counter('chat_direct_messages_total', 'Direct messages sent',
+                        ['recipient']) # online (delivered live) or offline (stored only)
+TYPING_EVENTS = Counter('chat_typing_events_total', 'Typing start/stop events from clients',
+                        ['outcome']) # changed, refreshed or duplicate (dropped before Redis)
+TYPING_UPDATES = Counter('chat_typing_updates_total', 'Aggregated typing_update emits (one per changed room per tick)')
+LIVE_CONNECTIONS = Gauge('chat_live_connections', 'Connected authenticated sockets',
+                         multiprocess_mode='livesum')
+
+metrics = Blueprint('metrics', __name__)
+metrics.before_request(check_ops_token)
+
+
+# === Instrumentation ===
+
+def handler(event_name):
+    """Decorator timing a Socket.IO event handler (put it below @socketio.on)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.labels(event_name).inc()
+                raise
+            finally:
+                HANDLER_SECONDS.labels(event_name).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def timed(op):
+    """Decorator timing a Redis-backed helper."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                REDIS_SECONDS.labels(op).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    DB_SECONDS.labels(kind if kind in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER').observe(
+        time.perf_counter() - started)
+
+
+def _payload_size(data):
+    if isinstance(data, str):
+        return len(data)
+    try:
+        return len(json.dumps(data, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return 0
+
+def count_delivery(event_name, recipients, data):
+    FANOUT_RECIPIENTS.labels(event_name).observe(recipients)
+    if recipients:
+        FANOUT_DELIVERIES.labels(event_name).inc(recipients)
+        FANOUT_BYTES.labels(event_name).inc(recipients * _payload_size(data))
+
+
+class InstrumentedRedisManager(socketio_pkg.RedisManager):
+    """Socket.IO Redis manager that counts each frame's local recipients as this worker delivers it.
+
+    Every worker receives every emit from the Redis queue and delivers it to
+    its own sockets in the target room, so per-worker counts add up to the
+    real fan-out.
+    """
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        # While the app Redis circuit is open the queue is almost certainly down too: deliver to this
+        # worker's sockets only, instead of blocking on publish retries and then dropping the frame
+        if resilience.degraded():
+            kwargs['ignore_queue'] = True
+        return super().emit(event, data, namespace=namespace, room=room, skip_sid=skip_sid, callback=callback,
+                            to=to, **kwargs)
+
+    def _handle_emit(self, message):
+        namespace = message.get('namespace') or '/'
+        room = message.get('room')
+        rooms = self.rooms.get(namespace, {})
+        if isinstance(room, list): # Addressed to several SIDs/rooms at once (e.g. a direct message)
+            recipients = sum(len(rooms.get(name, ())) for name in room)
+        else:
+            recipients = len(rooms.get(room, ()))
+        if message.get('skip_sid'):
+            recipients = max(0, recipients - 1)
+        data = message.get('data')
+        count_delivery(message.get('event'), recipients,
+                       data[0] if isinstance(data, list) and len(data) == 1 else data)
+        return super()._handle_emit(message)
+
+
+def client_manager(url, channel='flask-socketio', redis_options=None):
+    """The Socket.IO client manager to pass to socketio.init_app for a Redis message queue."""
+    return InstrumentedRedisManager(url, channel=channel, redis_options=redis_options)
+
+
+# === Endpoint ===
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry) # Sums the files of every worker in this pod
+        return registry
+    return REGISTRY
+
+@metrics.route('/metrics')
+def scrape():
+    """Prometheus text exposition of every chat metric."""
+    return Response(generate_latest(_registry()), mimetype=CONTENT_TYPE_LATEST)
@@ -1,9 +1,10 @@
 # app/models.py
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 # Import the db instance created in app/__init__.py
 # The '.' means import from the current package ('app')
 from . import db
+# PBKDF2 runs in a bounded native-thread pool so it doesn't block the eventlet hub
+from . import hashing
 import datetime
 
 class User(UserMixin, db.Model):
@@ -24,19 +25,61 @@ class User(UserMixin, db.Model):
 
     # Method to store hashed password
     def set_password(self, password):
-        # Use a robust hashing method with sufficient salt length
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256', salt_length=16)
+        # Use a robust hashing method with sufficient salt length (pbkdf2:sha256, see app/hashing.py)
+        self.password_hash = hashing.hash_password(password)
 
     # Method to verify password
     def check_password(self, password):
         if not self.password_hash:
              return False # Should not happen if password is required on registration
-        return check_password_hash(self.password_hash, password)
+        return hashing.verify_password(self.password_hash, password)
 
     # How the object prints out (useful for debugging)
     def __repr__(self):
         return f'<User {self.username}>'
 
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+class Message(db.Model):
+    """A chat message archived from its room's Redis stream (see app/archive.py).
+
+    The primary key (room, created_at, seq) is also the scrollback index, and
+    `created_at` and `seq` are the two halves of the stream ID (ms-seq). On
+    Postgres the table is range-partitioned by month on created_at, and a
+    generated `search_vector` column with a GIN index (added by migration,
+    not mapped here) backs full-text search (see app/search.py).
+    """
+    __tablename__ = 'messages'
+    __table_args__ = (
+        db.Index('ix_messages_nickname_created_at', 'nickname', 'created_at'), # Search by author
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+    room = db.Column(db.String(32), primary_key=True)
+    created_at = db.Column(db.DateTime(timezone=True), primary_key=True) # Redis-assigned stream timestamp
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False) # Sequence part of the stream ID
+    nickname = db.Column(db.String(80), nullable=False)
+    color = db.Column(db.String(7), nullable=False, default='#000000')
+    body = db.Column(db.Text, nullable=False)
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+
+    @property
+    def stream_id(self):
+        """The Redis stream ID this message had, which is also its history cursor."""
+        created_at = self.created_at if self.created_at.tzinfo else self.created_at.replace(tzinfo=datetime.timezone.utc)
+        millis = (created_at - EPOCH) // datetime.timedelta(milliseconds=1) # Exact; float timestamps can round
+        return f"{millis}-{self.seq}"
+
+    def to_payload(self):
+        """The same dict shape as a chat_message / history entry decoded from the stream."""
+        stream_id = self.stream_id
+        return {'id': stream_id, 'ts': int(stream_id.split('-', 1)[0]), 'nickname': self.nickname,
+                'msg': self.body, 'color': self.color}
+
+    def __repr__(self):
+        return f'<Message {self.room} {self.stream_id}>'
+
 # NOTE: The @login_manager.user_loader function should stay in app/__init__.py
 #       (or eventually move to an auth blueprint) because it needs the
 #       login_manager instance. We just need to make sure IT imports the User model.
\ No newline at end of file
@@ -0,0 +1,62 @@
+# app/ops.py
+import hmac
+import ipaddress
+from flask import Blueprint, jsonify, request, current_app, abort
+
+# Create Blueprint instance named 'ops' (internal operational endpoints)
+ops = Blueprint('ops', __name__)
+
+# name -> zero-argument callable returning a JSON-serializable dict
+_stats_providers = {}
+
+
+def register_stats_provider(name, provider):
+    """Registers a callable whose result is included under `name` in /ops/stats."""
+    _stats_providers[name] = provider
+
+
+@ops.before_request
+def check_ops_token():
+    """Requires OPS_TOKEN in the X-Ops-Token header (or as a Bearer token).
+
+    Without a configured token the endpoints are closed, except to loopback
+    clients (local runs, benchmarks, `kubectl port-forward`) or when
+    OPS_ALLOW_UNAUTHENTICATED is set. Private addresses are not trusted: behind
+    the ingress every request comes from the controller's cluster IP.
+    """
+    token = current_app.config.get('OPS_TOKEN')
+    if not token:
+        if current_app.config.get('OPS_ALLOW_UNAUTHENTICATED', False) or _is_loopback(request.remote_addr):
+            return
+        abort(403)
+    supplied = request.headers.get('X-Ops-Token', '')
+    authorization = request.headers.get('Authorization', '')
+    if not supplied and authorization.startswith('Bearer '):
+        supplied = authorization[len('Bearer '):] # What Prometheus sends for bearer_token scrape configs
+    if not hmac.compare_digest(supplied, token):
+        abort(403)
+
+def _is_loopback(address):
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+
+@ops.route('/stats')
+def stats():
+    """Reports per-worker counters from every registered subsystem."""
+    report = {}
+    for name, provider in _stats_providers.items():
+        try:
+            report[name] = provider()
+        except Exception as e:
+            report[name] = {'error': str(e)}
+    return jsonify(report)
+
+
+@ops.route('/pools')
+def pools():
+    """Live connection pool usage of this worker (database, app Redis, Socket.IO queue)."""
+    from . import pools as connection_pools # Imported here: reads the clients set up by create_app
+    return jsonify(connection_pools.snapshot())
@@ -0,0 +1,156 @@
+# app/page_cache.py
+"""Rendered-page cache with strong ETags for mostly-static pages.
+
+Pages such as the landing and about pages only change with a deploy or with
+who is looking at them, so `@cached` views are rendered once per
+(endpoint, viewer, build) and then served from:
+
+    1. a per-process LRU (PAGE_CACHE_SIZE)
+    2. a shared Redis hash, ``pagecache:<build>:<endpoint>:<viewer>`` (PAGE_CACHE_REDIS_TTL)
+
+The viewer is 'anon' or the user's ID, since logged-in pages show the
+username. The build combines APP_VERSION with the static asset manifest, so a
+deploy never serves pages pointing at old assets. Every response carries a
+strong ETag of its body and `Cache-Control: no-cache`; browsers, crawlers and
+health checks revalidate with If-None-Match and get an empty 304.
+
+Requests with pending flash messages bypass the cache: they render (and
+consume) the messages as usual.
+"""
+import functools
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+
+from . import redis_client
+from . import assets, metrics
+from .ops import register_stats_provider
+
+# key -> {'body', 'etag', 'mimetype'}, least recently used first
+_local = OrderedDict()
+_lock = threading.Lock()
+_counters = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'bypassed': 0, 'not_modified': 0}
+
+
+def build_version():
+    """What a deploy changes: APP_VERSION plus the asset manifest fingerprint."""
+    return f"{os.environ.get('APP_VERSION', 'N/A')}-{assets.fingerprint()}"
+
+def page_key(endpoint, viewer):
+    """Redis key (and local key) of one cached page."""
+    return f"pagecache:{build_version()}:{endpoint}:{viewer}"
+
+def _viewer():
+    return f"user{current_user.id}" if current_user.is_authenticated else 'anon'
+
+def etag_for(body):
+    """Strong ETag value (without quotes) of a rendered body."""
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()[:32]
+
+
+# === Local LRU ===
+
+def _get_local(key):
+    with _lock:
+        entry = _local.get(key)
+        if entry is not None:
+            _local.move_to_end(key)
+        return entry
+
+def _put_local(key, entry):
+    with _lock:
+        _local[key] = entry
+        _local.move_to_end(key)
+        while len(_local) > current_app.config.get('PAGE_CACHE_SIZE', 256):
+            _local.popitem(last=False) # Evict the least recently used page
+
+
+# === Lookups ===
+
+def _lookup(key):
+    """Returns (entry, source) with source 'local', 'redis' or None (not cached)."""
+    entry = _get_local(key)
+    if entry is not None:
+        return entry, 'local'
+    if redis_client and current_app.config.get('PAGE_CACHE_REDIS_TTL', 300) > 0:
+        try:
+            fields = redis_client.hgetall(key)
+            if fields:
+                _put_local(key, fields)
+                return fields, 'redis'
+        except Exception as e:
+            logging.error(f"Redis error reading cached page {key}: {e}")
+    return None, None
+
+def _store(key, entry):
+    _put_local(key, entry)
+    ttl = current_app.config.get('PAGE_CACHE_REDIS_TTL', 300)
+    if redis_client and ttl > 0:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hset(key, mapping=entry)
+            pipe.expire(key, ttl)
+            pipe.execute()
+        except Exception as e:
+            logging.error(f"Redis error caching page {key}: {e}")
+
+def _respond(entry, public):
+    """A response for a cache entry, turned into an empty 304 if the client's ETag matches."""
+    response = make_response(entry['body'])
+    response.mimetype = entry['mimetype']
+    response.set_etag(entry['etag'])
+    response.cache_control.no_cache = True # Always revalidate; a match costs one 304
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.vary.add('Cookie')
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        _counters['not_modified'] += 1
+    return response
+
+
+def cached(view):
+    """Decorator caching a GET view's rendered HTML per viewer and build (see module docstring)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        endpoint = request.endpoint
+        if (not current_app.config.get('PAGE_CACHE_ENABLED', True) or request.method != 'GET'
+                or session.get('_flashes')):
+            _counters['bypassed'] += 1
+            metrics.PAGE_CACHE_REQUESTS.labels(endpoint, 'bypassed').inc()
+            return view(*args, **kwargs)
+
+        public = not current_user.is_authenticated
+        key = page_key(endpoint, _viewer())
+        entry, source = _lookup(key)
+        if entry is not None:
+            _counters[f"{source}_hits"] += 1
+            metrics.PAGE_CACHE_REQUESTS.labels(endpoint, f"{source}_hit").inc()
+            return _respond(entry, public)
+
+        _counters['misses'] += 1
+        metrics.PAGE_CACHE_REQUESTS.labels(endpoint, 'miss').inc()
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.direct_passthrough:
+            return response # Redirects and errors are not cached
+        body = response.get_data(as_text=True)
+        entry = {'body': body, 'etag': etag_for(body), 'mimetype': response.mimetype}
+        _store(key, entry)
+        return _respond(entry, public)
+    return wrapper
+
+
+def stats():
+    """Hit/miss counters for this worker's page cache."""
+    lookups = _counters['local_hits'] + _counters['redis_hits'] + _counters['misses']
+    hits = _counters['local_hits'] + _counters['redis_hits']
+    return dict(_counters, size=len(_local), build=build_version(),
+                hit_ratio=round(hits / lookups, 4) if lookups else 0.0)
+
+register_stats_provider('page_cache', stats)
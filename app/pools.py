@@ -0,0 +1,162 @@
+# app/pools.py
+"""Connection pools for Postgres, the app Redis DB and the Socket.IO queue.
+
+Under eventlet every socket event runs in its own green thread, so hundreds
+of them can want a connection at once. Each worker therefore gets bounded
+pools that make green threads wait their turn rather than open connections
+without limit:
+
+    Postgres   SQLAlchemy QueuePool: DB_POOL_SIZE connections kept open, up to
+               DB_MAX_OVERFLOW more under load, DB_POOL_TIMEOUT seconds of
+               waiting before an error, pre-ping and DB_POOL_RECYCLE against
+               stale connections. With DB_PGBOUNCER=true the app keeps no
+               pool of its own (NullPool) and leaves pooling to PgBouncer.
+    App Redis  redis-py BlockingConnectionPool: at most REDIS_MAX_CONNECTIONS,
+               waiting up to REDIS_POOL_TIMEOUT, with socket timeouts and
+               periodic health checks.
+    Socket.IO  the message queue's own Redis connections (one publisher,
+               one subscriber), with the same timeouts and health checks.
+
+Time spent waiting to check out a connection is recorded in
+chat_pool_wait_seconds{pool=...}, and /ops/pools shows this worker's live
+pool usage.
+"""
+import time
+import redis
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import QueuePool, NullPool
+
+from . import metrics
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (including connecting, for new connections)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            metrics.POOL_TIMEOUTS.labels('database').inc()
+            raise
+        finally:
+            metrics.POOL_WAIT_SECONDS.labels('database').observe(time.perf_counter() - started)
+
+
+class TimedBlockingConnectionPool(redis.BlockingConnectionPool):
+    """BlockingConnectionPool that records checkout waits and tracks connections in use."""
+
+    def reset(self):
+        super().reset() # Also runs after a fork, so the counters start over in each worker
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def get_connection(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except redis.ConnectionError as e:
+            if 'No connection available' in str(e): # Waited REDIS_POOL_TIMEOUT for a free connection
+                metrics.POOL_TIMEOUTS.labels('redis').inc()
+            raise
+        finally:
+            metrics.POOL_WAIT_SECONDS.labels('redis').observe(time.perf_counter() - started)
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        self.in_use = max(0, self.in_use - 1)
+
+
+# === Factories ===
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database (pool settings apply to Postgres only)."""
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if not uri.startswith('postgresql'):
+        return {} # SQLite (benchmarks, tests) keeps Flask-SQLAlchemy's defaults
+    options = {'connect_args': {'connect_timeout': config.get('DB_CONNECT_TIMEOUT', 5)}}
+    if config.get('DB_PGBOUNCER'):
+        # PgBouncer (transaction pooling) owns the pool; a local one would pin server connections
+        options['poolclass'] = NullPool
+        return options
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+    })
+    return options
+
+def _socket_options(config):
+    return {
+        'socket_timeout': config.get('REDIS_SOCKET_TIMEOUT', 10),
+        'socket_connect_timeout': config.get('REDIS_SOCKET_CONNECT_TIMEOUT', 5),
+        'socket_keepalive': True,
+        'health_check_interval': config.get('REDIS_HEALTH_CHECK_INTERVAL', 30),
+    }
+
+def app_redis(url, config):
+    """The app's Redis client, backed by a bounded, instrumented blocking pool.
+
+    Commands go through the circuit breaker in app/resilience.py, so they fail
+    fast while Redis is down instead of each waiting out the connect timeout.
+    """
+    from . import resilience
+    pool = TimedBlockingConnectionPool.from_url(
+        url,
+        max_connections=config.get('REDIS_MAX_CONNECTIONS', 50),
+        timeout=config.get('REDIS_POOL_TIMEOUT', 5),
+        decode_responses=True,
+        **_socket_options(config))
+    return resilience.ResilientRedis(connection_pool=pool)
+
+def queue_redis_options(config):
+    """redis_options for the Socket.IO Redis manager (passed through to Redis.from_url)."""
+    return _socket_options(config)
+
+
+# === Live usage (/ops/pools) ===
+
+def _database_usage(engine):
+    pool = engine.pool
+    usage = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        usage.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(0, pool.overflow()), # Negative while the pool is still filling up
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout(),
+        })
+    return usage
+
+def _redis_usage(pool):
+    usage = {'class': type(pool).__name__, 'max_connections': pool.max_connections}
+    if isinstance(pool, TimedBlockingConnectionPool):
+        usage.update({'in_use': pool.in_use, 'peak_in_use': pool.peak_in_use,
+                      'created': len(pool._connections), 'timeout': pool.timeout})
+    else:
+        usage.update({'in_use': len(getattr(pool, '_in_use_connections', ())),
+                      'idle': len(getattr(pool, '_available_connections', ()))})
+    return usage
+
+def snapshot():
+    """Live usage of this worker's pools."""
+    from . import db, socketio, redis_client # Imported here: set up by create_app
+    report = {}
+    for name, collect in (
+            ('database', lambda: _database_usage(db.engine)),
+            ('redis', lambda: _redis_usage(redis_client.connection_pool) if redis_client else None),
+            ('socketio_queue', lambda: _redis_usage(socketio.server.manager.redis.connection_pool)
+                if getattr(socketio.server.manager, 'redis', None) else None)):
+        try:
+            report[name] = collect()
+        except Exception as e:
+            report[name] = {'error': str(e)}
+    return report
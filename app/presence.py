@@ -0,0 +1,265 @@
+# app/presence.py
+"""Reference-counted, room-scoped presence tracking in Redis.
+
+Every socket is mapped SID -> nickname, and records the rooms it has joined.
+A reverse index keeps nickname -> set of SIDs in step with that map (both are
+written in the same MULTI/EXEC or script), so every open tab of a user is
+found with one SMEMBERS instead of scanning the whole map.
+Per room, each nickname carries a count of its sockets in that room. Only the
+0 -> 1 and 1 -> 0 transitions are visible to other users (as user_joined /
+user_left deltas), so a user with several tabs open joins and leaves once.
+Each transition bumps the room's version number; clients use it to notice a
+missed delta and ask for a full snapshot.
+
+Each worker process is a "node" with a heartbeat key that expires unless
+refreshed, and every SID is also filed under the node that owns it. When a
+worker dies without running its disconnect handlers (OOM kill, node loss),
+its heartbeat lapses and any surviving worker's reaper drops all of that
+node's SIDs in one script call.
+"""
+import os
+import socket
+import time
+import uuid
+
+from . import redis_client
+
+SID_NICKNAME_MAP_KEY = "sid_nickname_map" # Redis Hash mapping session ID to nickname
+PRESENCE_NODES_KEY = "presence:nodes" # Set of node IDs that have (or had) SIDs filed
+
+def room_counts_key(room):
+    """Hash of nickname -> open socket count for a room."""
+    return f"room:{room}:presence:counts"
+
+def room_version_key(room):
+    """Counter bumped on every join/leave transition in a room."""
+    return f"room:{room}:presence:version"
+
+def user_sids_key(nickname):
+    """Set of a user's connected SIDs (the reverse of the SID -> nickname map)."""
+    return f"presence:user:{nickname}:sids"
+
+def sid_rooms_key(sid):
+    """Set of rooms a SID has joined."""
+    return f"presence:sid:{sid}:rooms"
+
+def node_alive_key(node):
+    """Heartbeat key of a node; it exists only while the node is alive."""
+    return f"presence:node:{node}:alive"
+
+def node_sids_key(node):
+    """Set of SIDs owned by a node."""
+    return f"presence:node:{node}:sids"
+
+
+# Leaves one room on behalf of a SID. Must match room_counts_key/room_version_key.
+# Returns the new room version if the nickname's last socket left, else nil.
+_LEAVE_ROOM_FN = """
+local function leave_room(nickname, room)
+    local counts = 'room:' .. room .. ':presence:counts'
+    if redis.call('HINCRBY', counts, nickname, -1) <= 0 then
+        redis.call('HDEL', counts, nickname)
+        return redis.call('INCR', 'room:' .. room .. ':presence:version')
+    end
+    return nil
+end
+"""
+
+# Forgets a SID entirely: leaves all its rooms and removes its mapping (both directions).
+# Must match user_sids_key/sid_rooms_key.
+# Returns {nickname, {room, version, room, version, ...}} for rooms the user left, or nil.
+_DROP_SID_FN = _LEAVE_ROOM_FN + """
+local function drop_sid(sid)
+    local nickname = redis.call('HGET', KEYS[1], sid)
+    local rooms_key = 'presence:sid:' .. sid .. ':rooms'
+    local left = {}
+    if nickname then
+        for _, room in ipairs(redis.call('SMEMBERS', rooms_key)) do
+            local version = leave_room(nickname, room)
+            if version then
+                table.insert(left, room)
+                table.insert(left, version)
+            end
+        end
+        redis.call('HDEL', KEYS[1], sid)
+        redis.call('SREM', 'presence:user:' .. nickname .. ':sids', sid)
+    end
+    redis.call('DEL', rooms_key)
+    if not nickname then
+        return nil
+    end
+    return {nickname, left}
+end
+"""
+
+# KEYS: sid rooms, room counts, room version. ARGV: nickname, room.
+# Returns {joined (0/1), version}.
+_JOIN_LUA = """
+if redis.call('SADD', KEYS[1], ARGV[2]) == 0 then
+    return {0, tonumber(redis.call('GET', KEYS[3]) or 0)} -- Already in the room
+end
+if redis.call('HINCRBY', KEYS[2], ARGV[1], 1) == 1 then
+    return {1, redis.call('INCR', KEYS[3])}
+end
+return {0, tonumber(redis.call('GET', KEYS[3]) or 0)}
+"""
+
+# KEYS: sid rooms, room version. ARGV: nickname, room.
+# Returns {left (0/1), version}, or false if the SID wasn't in the room.
+_LEAVE_LUA = _LEAVE_ROOM_FN + """
+if redis.call('SREM', KEYS[1], ARGV[2]) == 0 then
+    return false
+end
+local version = leave_room(ARGV[1], ARGV[2])
+if version then
+    return {1, version}
+end
+return {0, tonumber(redis.call('GET', KEYS[2]) or 0)}
+"""
+
+# KEYS: sid map, node sids. ARGV: sid.
+_DISCONNECT_LUA = _DROP_SID_FN + """
+redis.call('SREM', KEYS[2], ARGV[1])
+return drop_sid(ARGV[1]) or false
+"""
+
+# Drops every SID of a node whose heartbeat has expired.
+# KEYS: sid map, node alive, node sids, nodes set. ARGV: node.
+# Returns {sids reaped, {nickname, room, version, ...}} for users who left a room,
+# or false if the node is still alive.
+_REAP_NODE_LUA = _DROP_SID_FN + """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return false
+end
+local sids = redis.call('SMEMBERS', KEYS[3])
+local left = {}
+for _, sid in ipairs(sids) do
+    local dropped = drop_sid(sid)
+    if dropped then
+        for i = 1, #dropped[2], 2 do
+            table.insert(left, dropped[1])
+            table.insert(left, dropped[2][i])
+            table.insert(left, dropped[2][i + 1])
+        end
+    end
+end
+redis.call('DEL', KEYS[3])
+redis.call('SREM', KEYS[4], ARGV[1])
+return {#sids, left}
+"""
+
+_join_script = redis_client.register_script(_JOIN_LUA) if redis_client else None
+_leave_script = redis_client.register_script(_LEAVE_LUA) if redis_client else None
+_disconnect_script = redis_client.register_script(_DISCONNECT_LUA) if redis_client else None
+_reap_node_script = redis_client.register_script(_REAP_NODE_LUA) if redis_client else None
+
+# Node identity is per process; recomputed after a fork (e.g. gunicorn --preload)
+_node = {'pid': None, 'id': None}
+
+# Reaper counters for /ops/stats
+reaper_stats = {
+    'runs': 0,
+    'nodes_reaped': 0,
+    'sids_reaped': 0,
+    'users_left': 0,
+    'last_run_at': None,
+    'last_run_ms': None,
+}
+
+
+def node_id():
+    """Returns this worker process's node ID (hostname:pid:random)."""
+    if _node['pid'] != os.getpid():
+        _node['pid'] = os.getpid()
+        _node['id'] = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    return _node['id']
+
+
+def heartbeat(ttl):
+    """Marks this node alive for `ttl` seconds and lists it for reapers."""
+    node = node_id()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.set(node_alive_key(node), int(time.time()), ex=ttl)
+    pipe.sadd(PRESENCE_NODES_KEY, node)
+    pipe.execute()
+
+def retire_node():
+    """Drops this node's heartbeat so the next reaper pass cleans up its SIDs."""
+    redis_client.delete(node_alive_key(node_id()))
+
+def reap_dead_nodes():
+    """Removes the SIDs of every node whose heartbeat expired.
+
+    Returns a list of (nickname, room, version) for users who left a room as
+    a result.
+    """
+    started = time.monotonic()
+    left = []
+    for node in redis_client.smembers(PRESENCE_NODES_KEY):
+        if node == node_id():
+            continue
+        result = _reap_node_script(keys=[SID_NICKNAME_MAP_KEY, node_alive_key(node), node_sids_key(node),
+                                         PRESENCE_NODES_KEY],
+                                   args=[node])
+        if not result:
+            continue # Still alive, or already reaped by another worker
+        sids_reaped, node_left = result
+        triples = [(node_left[i], node_left[i + 1], int(node_left[i + 2])) for i in range(0, len(node_left), 3)]
+        left.extend(triples)
+        reaper_stats['nodes_reaped'] += 1
+        reaper_stats['sids_reaped'] += sids_reaped
+        reaper_stats['users_left'] += len(triples)
+    reaper_stats['runs'] += 1
+    reaper_stats['last_run_at'] = int(time.time())
+    reaper_stats['last_run_ms'] = round((time.monotonic() - started) * 1000, 2)
+    return left
+
+
+def connect(sid, nickname):
+    """Maps a socket to its nickname (and back) and files it under this node (one MULTI/EXEC)."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(SID_NICKNAME_MAP_KEY, sid, nickname)
+    pipe.sadd(user_sids_key(nickname), sid)
+    pipe.sadd(node_sids_key(node_id()), sid)
+    pipe.execute()
+
+def join(sid, nickname, room):
+    """Adds a socket to a room. Returns (joined, version); joined is True on the user's first socket there."""
+    joined, version = _join_script(keys=[sid_rooms_key(sid), room_counts_key(room), room_version_key(room)],
+                                   args=[nickname, room])
+    return bool(joined), int(version)
+
+def leave(sid, nickname, room):
+    """Removes a socket from a room. Returns (left, version), or (False, None) if it wasn't in it."""
+    result = _leave_script(keys=[sid_rooms_key(sid), room_version_key(room)], args=[nickname, room])
+    if not result:
+        return False, None
+    left, version = result
+    return bool(left), int(version)
+
+def disconnect(sid):
+    """Forgets a socket. Returns (nickname, [(room, version), ...] for rooms the user left).
+
+    nickname is None if the SID wasn't mapped.
+    """
+    result = _disconnect_script(keys=[SID_NICKNAME_MAP_KEY, node_sids_key(node_id())], args=[sid])
+    if not result:
+        return None, []
+    nickname, left = result
+    return nickname, [(left[i], int(left[i + 1])) for i in range(0, len(left), 2)]
+
+def snapshot(room):
+    """Returns (sorted nicknames in the room, version) read atomically."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hkeys(room_counts_key(room))
+    pipe.get(room_version_key(room))
+    users, version = pipe.execute()
+    return sorted(users), int(version or 0)
+
+def nickname_for_sid(sid):
+    """Returns the nickname mapped to a SID, or None."""
+    return redis_client.hget(SID_NICKNAME_MAP_KEY, sid)
+
+def sids_for_user(nickname):
+    """Returns the set of a user's connected SIDs, on any worker (empty if offline)."""
+    return redis_client.smembers(user_sids_key(nickname))
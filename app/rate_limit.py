@@ -0,0 +1,106 @@
+# app/rate_limit.py
+"""Token-bucket rate limiting in Redis, shared by every worker.
+
+Each limited action (sending a message, changing color, searching) has one bucket per
+user and, for messages, one per room. A bucket holds up to `burst` tokens
+and refills at `rate` tokens per second; every call costs one token from
+each bucket it touches. All of an action's buckets are checked and charged
+in a single Lua call, so a request is either allowed everywhere or nowhere,
+and clocks come from Redis (TIME) rather than from the workers.
+
+Limits are configured as RATE_LIMIT_* = "burst/rate" strings (see config.py).
+If Redis is unavailable the limiter fails open.
+"""
+import logging
+from flask import current_app
+
+from . import redis_client
+from . import metrics
+
+# Which config entry limits which (action, scope)
+LIMIT_CONFIG = {
+    ('new_message', 'user'): 'RATE_LIMIT_MESSAGE_USER',
+    ('new_message', 'room'): 'RATE_LIMIT_MESSAGE_ROOM',
+    ('set_color', 'user'): 'RATE_LIMIT_COLOR_USER',
+    ('search', 'user'): 'RATE_LIMIT_SEARCH_USER',
+    ('direct_message', 'user'): 'RATE_LIMIT_DM_USER',
+}
+
+def bucket_key(action, scope, subject):
+    """Redis hash holding one bucket: t = tokens left, ts = last update (ms, Redis clock)."""
+    return f"ratelimit:{action}:{scope}:{subject}"
+
+def parse_limit(value):
+    """Parses "burst/rate" (e.g. "10/2": bursts of 10, refilling 2 per second) into (burst, rate)."""
+    burst, _, rate = str(value).partition('/')
+    return float(burst), float(rate or burst)
+
+
+# Checks every bucket, and only if all have `cost` tokens charges them all.
+# KEYS: bucket hashes. ARGV: cost, then burst and rate (tokens/second) for each key.
+# Returns {0, 0} if allowed, else {index of the bucket that is shortest, ms until it has enough}.
+_TOKEN_BUCKET_LUA = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local tokens = {}
+local blocked, wait = 0, 0
+for i, key in ipairs(KEYS) do
+    local burst, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 't', 'ts')
+    local left = tonumber(state[1]) or burst
+    local last = tonumber(state[2]) or now
+    left = math.min(burst, left + math.max(0, now - last) * rate / 1000)
+    tokens[i] = left
+    if left < cost then
+        local needed = math.ceil((cost - left) * 1000 / rate)
+        if needed > wait then
+            blocked, wait = i, needed
+        end
+    end
+end
+if blocked > 0 then
+    return {blocked, wait}
+end
+for i, key in ipairs(KEYS) do
+    local burst, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    redis.call('HSET', key, 't', tostring(tokens[i] - cost), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000) -- Full buckets need no state
+end
+return {0, 0}
+"""
+_token_bucket_script = redis_client.register_script(_TOKEN_BUCKET_LUA) if redis_client else None
+
+
+def check(action, user, room=None):
+    """Charges one `action` to the user's (and room's) buckets.
+
+    Returns (allowed, retry_after_ms, scope) where scope names the bucket
+    that ran dry ('user' or 'room'), or None when allowed.
+    """
+    config = current_app.config
+    if not redis_client or not config.get('RATE_LIMIT_ENABLED', True):
+        return True, 0, None
+    scopes, keys, args = [], [], [1]
+    for scope, subject in (('user', user), ('room', room)):
+        setting = config.get(LIMIT_CONFIG.get((action, scope), ''))
+        if subject is None or not setting:
+            continue
+        burst, rate = parse_limit(setting)
+        scopes.append(scope)
+        keys.append(bucket_key(action, scope, subject))
+        args.extend([burst, rate])
+    if not keys:
+        return True, 0, None
+    try:
+        blocked, wait = _token_bucket_script(keys=keys, args=args)
+    except Exception as e:
+        logging.error(f"Redis error checking rate limit for {action} by {user}: {e}")
+        metrics.RATE_LIMIT_DECISIONS.labels(action, 'error').inc()
+        return True, 0, None # Fail open: a Redis hiccup shouldn't silence the chat
+    if blocked:
+        scope = scopes[int(blocked) - 1]
+        metrics.RATE_LIMIT_DECISIONS.labels(action, f"limited_{scope}").inc()
+        return False, int(wait), scope
+    metrics.RATE_LIMIT_DECISIONS.labels(action, 'allowed').inc()
+    return True, 0, None
@@ -0,0 +1,255 @@
+# app/resilience.py
+"""Riding out Redis outages: a circuit breaker on the app Redis client and degraded-mode buffers.
+
+The app Redis client (pools.app_redis) is a ResilientRedis. Every command and
+pipeline goes through one process-wide CircuitBreaker:
+
+    closed     normal operation. REDIS_BREAKER_FAILURES connection errors
+               or timeouts in a row open the circuit
+    open       calls fail at once with redis.ConnectionError("circuit open")
+               instead of each waiting out connect timeouts and retries. A
+               background probe PINGs Redis with backoff
+               (REDIS_BREAKER_MIN_DELAY doubling up to REDIS_BREAKER_MAX_DELAY)
+    half-open  one call (the probe, or whichever comes first) is let through.
+               Success closes the circuit; failure re-opens it with a longer
+               delay
+
+Callers keep their existing try/except paths. While the circuit is open
+(`degraded()`), the chat keeps working inside each worker:
+
+    - messages that could not be stored go into a bounded ring buffer
+      (DEGRADED_BUFFER_SIZE, oldest dropped first) and joiners are shown the
+      last history snapshot plus the buffered messages
+    - presence changes are remembered per socket (see events.py) and
+      member lists are built from the worker's own sockets
+    - Socket.IO emits skip the Redis message queue and reach this worker's
+      sockets only (metrics.InstrumentedRedisManager), with no wait on the
+      queue's publish retries
+
+When the circuit closes, the on_recovery callbacks run in a background task
+with an app context. They write the buffered messages back in bulk and
+reconcile presence. This module must not import anything that binds
+redis_client at import time: pools imports it before the client exists.
+"""
+import collections
+import logging
+import threading
+import time
+
+import redis
+
+from . import socketio
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Outcomes that say nothing about whether Redis is reachable (e.g. a script error) don't trip the breaker
+FAILURES = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+
+class CircuitBreaker:
+    """Tracks consecutive Redis failures and decides whether calls may go through."""
+
+    def __init__(self, failure_threshold=3, min_delay=0.5, max_delay=15.0):
+        self.failure_threshold = failure_threshold
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = min_delay
+        self.retry_at = 0.0
+        self.opened_at = None
+        self.probe = None # Callable that checks Redis (ResilientRedis.ping), run while open
+        self._probing = False
+        self._lock = threading.Lock()
+        self._listeners = []
+        # Counters for /ops/stats
+        self.trips = 0
+        self.rejected = 0
+        self.recoveries = 0
+        self.last_outage_seconds = None
+
+    def configure(self, config):
+        self.failure_threshold = config.get('REDIS_BREAKER_FAILURES', 3)
+        self.min_delay = config.get('REDIS_BREAKER_MIN_DELAY', 0.5)
+        self.max_delay = config.get('REDIS_BREAKER_MAX_DELAY', 15.0)
+        self.delay = self.min_delay
+
+    def allow(self):
+        """True if a call may go to Redis now (in half-open, only the first caller)."""
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self.retry_at:
+                self.state = HALF_OPEN
+                return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self.state == CLOSED and self.failures == 0:
+            return
+        with self._lock:
+            recovered = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self.delay = self.min_delay
+            if recovered:
+                self.recoveries += 1
+                self.last_outage_seconds = round(time.monotonic() - self.opened_at, 3)
+        if recovered:
+            logging.warning(f"Redis is reachable again after {self.last_outage_seconds}s; leaving degraded mode")
+            for callback in list(self._listeners):
+                socketio.start_background_task(callback)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    self.trips += 1
+                    self.opened_at = time.monotonic()
+                    logging.error(f"Redis unavailable ({error}); circuit open, running in degraded mode")
+                self.state = OPEN
+                self.retry_at = time.monotonic() + self.delay
+                self.delay = min(self.delay * 2, self.max_delay)
+            start_probe = self.state == OPEN and not self._probing and self.probe is not None
+            if start_probe:
+                self._probing = True
+        if start_probe:
+            socketio.start_background_task(self._probe_loop)
+
+    def _probe_loop(self):
+        """Background task: PINGs Redis at each retry time until the circuit closes."""
+        try:
+            while self.state != CLOSED:
+                socketio.sleep(max(0.05, self.retry_at - time.monotonic()))
+                try:
+                    self.probe()
+                except Exception:
+                    pass # Recorded by ResilientRedis; the next retry time has been pushed back
+        finally:
+            self._probing = False
+
+    def on_recovery(self, callback):
+        """Registers a callable run (in a background task) each time the circuit closes again."""
+        self._listeners.append(callback)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'trips': self.trips,
+            'rejected_calls': self.rejected,
+            'recoveries': self.recoveries,
+            'last_outage_seconds': self.last_outage_seconds,
+            'retry_in_seconds': round(max(0.0, self.retry_at - time.monotonic()), 2) if self.state != CLOSED else None,
+        }
+
+breaker = CircuitBreaker()
+
+
+def _guarded(call, *args, **kwargs):
+    """Runs one Redis round trip through the breaker."""
+    if not breaker.allow():
+        raise redis.exceptions.ConnectionError("Redis circuit open (degraded mode)")
+    try:
+        result = call(*args, **kwargs)
+    except FAILURES as e:
+        breaker.record_failure(e)
+        raise
+    except Exception:
+        breaker.record_success() # Redis answered, just not with what the caller wanted
+        raise
+    except BaseException as e:
+        # Cut short (an eventlet Timeout, GreenletExit): unknown outcome, but the half-open trial
+        # slot must be handed back, or the circuit would never close again
+        breaker.record_failure(e)
+        raise
+    breaker.record_success()
+    return result
+
+
+class ResilientPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        return _guarded(super().execute, raise_on_error)
+
+
+class ResilientRedis(redis.Redis):
+    """A Redis client whose commands and pipelines fail fast while the circuit is open."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        breaker.probe = self.ping
+
+    def execute_command(self, *args, **options):
+        return _guarded(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return ResilientPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def degraded():
+    """True while Redis is considered unavailable (circuit open or half-open)."""
+    return breaker.state != CLOSED
+
+
+# === Degraded-mode message buffer ===
+
+# (room, stream fields, ms timestamp) of messages that could not be stored, oldest first
+_messages = collections.deque(maxlen=5000)
+_buffer_stats = {'buffered': 0, 'dropped': 0, 'replayed': 0}
+_app = {'app': None}
+
+
+def init_app(app):
+    """Applies the breaker and buffer settings and keeps the app for recovery callbacks."""
+    global _messages
+    breaker.configure(app.config)
+    size = app.config.get('DEGRADED_BUFFER_SIZE', 5000)
+    if _messages.maxlen != size:
+        _messages = collections.deque(_messages, maxlen=size)
+    _app['app'] = app
+
+def on_recovery(callback):
+    """Registers `callback()` to run inside an app context each time Redis comes back."""
+    def run():
+        app = _app['app']
+        try:
+            if app is None:
+                callback()
+            else:
+                with app.app_context():
+                    callback()
+        except Exception as e:
+            logging.error(f"Error in Redis recovery callback {callback.__name__}: {e}")
+    breaker.on_recovery(run)
+
+def buffer_message(room, fields, ts):
+    """Keeps a message that could not be written to Redis, for replay once it is back."""
+    if len(_messages) == _messages.maxlen:
+        _buffer_stats['dropped'] += 1 # The oldest buffered message falls out
+    _messages.append((room, fields, ts))
+    _buffer_stats['buffered'] += 1
+
+def buffered_messages(room):
+    """(fields, ts) of the buffered messages for one room, oldest first."""
+    return [(fields, ts) for buffered_room, fields, ts in list(_messages) if buffered_room == room]
+
+def take_buffered(limit):
+    """Removes and returns up to `limit` of the oldest buffered messages."""
+    batch = []
+    while _messages and len(batch) < limit:
+        batch.append(_messages.popleft())
+    return batch
+
+def return_buffered(batch):
+    """Puts a batch taken with take_buffered back at the front (its replay failed)."""
+    _messages.extendleft(reversed(batch))
+
+def count_replayed(count):
+    _buffer_stats['replayed'] += count
+
+
+def stats():
+    """Breaker state and degraded-mode buffer counters for this worker."""
+    return dict(breaker.stats(), buffer=dict(_buffer_stats, pending=len(_messages)))
@@ -0,0 +1,50 @@
+# app/rooms.py
+"""Chat room registry.
+
+Rooms are listed in one Redis hash (room name -> creation time), so checking
+whether a room exists is a single O(1) HEXISTS however many rooms there are.
+Every worker also remembers the rooms it has already seen; rooms are never
+deleted, so a positive answer can be cached for the life of the process.
+"""
+import re
+import time
+
+from . import redis_client
+
+DEFAULT_ROOM = "general_chat"
+ROOMS_KEY = "rooms" # Redis Hash mapping room name to creation time (epoch seconds)
+ROOM_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+
+_known_rooms = {DEFAULT_ROOM} # Rooms this worker has already confirmed exist
+
+
+def is_valid_room_name(name):
+    """Room names are 1-32 chars of lowercase letters, digits, '_' and '-'."""
+    return isinstance(name, str) and bool(ROOM_NAME_RE.match(name))
+
+def room_exists(name):
+    """True if the room is registered (or is the default room)."""
+    if name in _known_rooms:
+        return True
+    if redis_client.hexists(ROOMS_KEY, name):
+        _known_rooms.add(name)
+        return True
+    return False
+
+def create_room(name):
+    """Registers a room if it doesn't exist yet. Returns True if it was created."""
+    created = bool(redis_client.hsetnx(ROOMS_KEY, name, int(time.time())))
+    _known_rooms.add(name)
+    return created
+
+def list_rooms(limit=200):
+    """Returns up to `limit` room names: the default room first, then the rest sorted."""
+    names = set()
+    cursor = 0
+    while len(names) < limit: # HSCAN keeps a large registry from blocking Redis
+        cursor, page = redis_client.hscan(ROOMS_KEY, cursor, count=limit)
+        names.update(page.keys())
+        if cursor == 0:
+            break
+    names.discard(DEFAULT_ROOM)
+    return [DEFAULT_ROOM] + sorted(names)[:limit - 1]
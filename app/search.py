@@ -0,0 +1,112 @@
+# app/search.py
+"""Full-text search over the archived chat history (the `messages` table, see app/archive.py).
+
+On Postgres every message row carries a generated `search_vector` column
+(to_tsvector(TEXT_SEARCH_CONFIG, body)) with a GIN index on each monthly
+partition, created by the migration that adds it. Queries use
+websearch_to_tsquery, so users can type `"exact phrase"`, `or` and `-word`
+like in a web search engine.
+
+Filters narrow the search by room, author (nickname) and time range.
+Results come newest first and are paged by keyset: the cursor names the last
+message of a page, `<stream id>:<room>`, and the next page starts strictly
+after it in (created_at, seq, room) order. Going deeper never costs more
+than the first page, unlike OFFSET.
+
+Only archived messages are searchable, so a new message shows up after the
+archiver's next drain (about ARCHIVE_INTERVAL seconds). On SQLite (tests,
+benchmarks) there is no text index and every term becomes a LIKE filter.
+"""
+import datetime
+import time
+from sqlalchemy import func, literal_column, tuple_
+
+from . import db
+from . import metrics
+from .models import Message, EPOCH
+from .archive import parse_stream_id
+
+TEXT_SEARCH_CONFIG = 'english' # Must match the generated column in the migration
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 16 # SQLite fallback only: one LIKE filter per term
+
+
+class SearchError(ValueError):
+    """A search request with invalid parameters (the message is safe to show to the user)."""
+
+
+# === Parameters ===
+
+def parse_time(value):
+    """Parses a time filter: epoch milliseconds (like message 'ts') or ISO 8601 (UTC if no offset)."""
+    if value is None or value == '':
+        return None
+    value = str(value).strip()
+    try:
+        if value.isdigit():
+            return EPOCH + datetime.timedelta(milliseconds=int(value))
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (ValueError, OverflowError):
+        raise SearchError(f"Invalid time: {value!r}. Use epoch milliseconds or ISO 8601.")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+def encode_cursor(message):
+    """Cursor naming a result: '<stream id>:<room>'."""
+    return f"{message['id']}:{message['room']}"
+
+def decode_cursor(cursor):
+    """'<stream id>:<room>' -> (created_at, seq, room)"""
+    stream_id, _, room = str(cursor).partition(':')
+    try:
+        created_at, seq = parse_stream_id(stream_id)
+    except (ValueError, OverflowError):
+        raise SearchError("Invalid cursor.")
+    if not room:
+        raise SearchError("Invalid cursor.")
+    return created_at, seq, room
+
+
+# === Query ===
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _text_filter(text):
+    """WHERE clause matching `text` with the best method the database has."""
+    if db.engine.dialect.name == 'postgresql':
+        return literal_column('search_vector').op('@@')(func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, text))
+    terms = [term.strip('"') for term in text.split()][:MAX_TERMS]
+    return db.and_(*(Message.body.ilike(f"%{_escape_like(term)}%", escape='\\') for term in terms if term))
+
+def search(text, room=None, author=None, since=None, until=None, cursor=None, limit=20):
+    """One page of messages matching `text`, newest first. Returns (messages, next_cursor).
+
+    `since` and `until` are datetimes (inclusive, exclusive); `cursor` is the
+    next_cursor of the previous page. Messages are payload dicts with 'room'.
+    """
+    text = (text or '').strip()
+    if not text:
+        raise SearchError("Enter something to search for.")
+    if len(text) > MAX_QUERY_LENGTH:
+        raise SearchError(f"Search text is limited to {MAX_QUERY_LENGTH} characters.")
+
+    query = db.select(Message).where(_text_filter(text))
+    if room:
+        query = query.where(Message.room == room)
+    if author:
+        query = query.where(Message.nickname == author)
+    if since:
+        query = query.where(Message.created_at >= since)
+    if until:
+        query = query.where(Message.created_at < until)
+    if cursor:
+        created_at, seq, cursor_room = decode_cursor(cursor)
+        query = query.where(tuple_(Message.created_at, Message.seq, Message.room) < tuple_(created_at, seq, cursor_room))
+    query = query.order_by(Message.created_at.desc(), Message.seq.desc(), Message.room.desc()).limit(limit + 1)
+
+    started = time.perf_counter()
+    rows = db.session.scalars(query).all()
+    metrics.SEARCH_SECONDS.observe(time.perf_counter() - started)
+    messages = [dict(row.to_payload(), room=row.room) for row in rows[:limit]]
+    next_cursor = encode_cursor(messages[-1]) if len(rows) > limit else None
+    return messages, next_cursor
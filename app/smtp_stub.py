@@ -0,0 +1,95 @@
+# app/smtp_stub.py
+"""Minimal local SMTP server for testing the email path offline.
+
+Run it with `flask chat smtp-stub` and point the app at it:
+
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false
+
+It speaks just enough SMTP for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET,
+NOOP, QUIT), accepts any login-free session and prints or stores every
+message. Failures can be injected to exercise the queue's retry and
+dead-letter handling: a share of DATA commands answered with a temporary
+451, and recipients at given domains refused with a permanent 550.
+"""
+import random
+import socketserver
+import threading
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """One SMTP session."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        self.reply('220 chat-smtp-stub ready')
+        mail_from, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 chat-smtp-stub')
+            elif verb == 'MAIL':
+                mail_from, recipients = command.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = command.split(':', 1)[1].strip().strip('<>')
+                if recipient.rsplit('@', 1)[-1].lower() in server.reject_domains:
+                    self.reply('550 Mailbox unavailable')
+                else:
+                    recipients.append(recipient)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = self._read_data()
+                if random.random() < server.fail_rate:
+                    self.reply('451 Temporary failure, try again later')
+                else:
+                    server.deliver(mail_from, recipients, data)
+                    self.reply('250 OK queued')
+                mail_from, recipients = None, []
+            elif verb == 'RSET':
+                mail_from, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def _read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                break
+            lines.append(line[1:] if line.startswith(b'..') else line) # Undo dot-stuffing
+        return b''.join(lines).decode(errors='replace')
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """Threaded SMTP stub. Delivered messages go to `on_message` or the `messages` list."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, fail_rate=0.0, reject_domains=(), on_message=None):
+        super().__init__(address, StubSMTPHandler)
+        self.fail_rate = fail_rate
+        self.reject_domains = {domain.lower() for domain in reject_domains}
+        self.on_message = on_message
+        self.messages = [] # (mail_from, recipients, raw message), when no on_message callback
+        self._lock = threading.Lock()
+
+    def deliver(self, mail_from, recipients, data):
+        with self._lock:
+            if self.on_message:
+                self.on_message(mail_from, recipients, data)
+            else:
+                self.messages.append((mail_from, recipients, data))
@@ -0,0 +1,217 @@
+# app/typing_status.py
+"""Typing indicators, coalesced per room and sent at a fixed tick.
+
+Clients send `typing` {room, typing: true|false} when the user starts or
+stops typing (and repeat `true` every few seconds while still typing). A
+keystroke never causes a broadcast. Instead:
+
+    1. the handler drops repeats this worker has already recorded (a start
+       while typing, unless half the TTL has passed; a stop while not typing)
+    2. the rest go to Redis in one Lua call. ``typing:<room>`` maps nickname
+       -> expiry (ms, Redis clock), and the room is added to ``typing:dirty``
+       only if the user's state actually changed
+    3. every TYPING_TICK_MS each worker SPOPs dirty rooms and takes rooms
+       whose earliest expiry has passed (``typing:deadlines``). For each one
+       a Lua call drops expired typists and compares the sorted list with the
+       one last sent (``typing:<room>:sent``). Only a changed list goes out,
+       as one `typing_update` {room, users} to the room
+
+SPOP hands each dirty room to a single worker, and the last-sent comparison
+keeps the other workers from repeating an update on the expiry path. The
+cost is one pipelined poll per worker per tick plus one script call per
+changed room, however fast people type. A user who closes the tab mid-word
+drops off after TYPING_TTL seconds, or at once when their last socket leaves
+the room.
+"""
+import logging
+import threading
+import time
+from flask import current_app
+
+from . import socketio, redis_client
+from . import metrics
+from .ops import register_stats_provider
+
+DIRTY_KEY = "typing:dirty" # Set of rooms whose typists changed since the last tick
+DEADLINES_KEY = "typing:deadlines" # Sorted set: room -> earliest typist expiry (ms)
+MAX_ROOMS_PER_TICK = 200 # Upper bound on rooms one worker flushes per tick
+
+# (room, nickname) -> (typing, monotonic time last sent to Redis); repeats are dropped locally
+_local = {}
+_local_lock = threading.Lock()
+_ticker = {'started': False}
+_counters = {'accepted': 0, 'duplicates': 0, 'updates': 0, 'ticks': 0, 'errors': 0}
+
+
+def room_key(room):
+    return f"typing:{room}"
+
+def sent_key(room):
+    return f"typing:{room}:sent"
+
+
+# Records a start (ARGV[3] = TTL ms) or stop (ARGV[3] = '0') and marks the room dirty if the state changed.
+# KEYS: room hash, deadlines, dirty set. ARGV: room, nickname, TTL ms. Returns 1 if the state changed.
+_SET_LUA = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local ttl = tonumber(ARGV[3])
+if ttl == 0 then
+    if redis.call('HDEL', KEYS[1], ARGV[2]) == 1 then
+        redis.call('SADD', KEYS[3], ARGV[1])
+        return 1
+    end
+    return 0
+end
+local previous = tonumber(redis.call('HGET', KEYS[1], ARGV[2])) or 0
+local expires = now + ttl
+redis.call('HSET', KEYS[1], ARGV[2], expires)
+redis.call('PEXPIRE', KEYS[1], ttl * 2) -- Left-over hashes clean themselves up
+redis.call('ZADD', KEYS[2], 'LT', expires, ARGV[1]) -- Keeps the earliest deadline (adds if missing)
+if previous <= now then
+    redis.call('SADD', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# Drops expired typists and returns the room's sorted list if it differs from the last one sent.
+# KEYS: room hash, deadlines, last-sent key. ARGV: room. Returns {1, nickname...} if changed, else nil.
+_FLUSH_LUA = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local fields = redis.call('HGETALL', KEYS[1])
+local typing, expired, deadline = {}, {}, nil
+for i = 1, #fields, 2 do
+    local expires = tonumber(fields[i + 1])
+    if expires <= now then
+        table.insert(expired, fields[i])
+    else
+        table.insert(typing, fields[i])
+        if not deadline or expires < deadline then
+            deadline = expires
+        end
+    end
+end
+if #expired > 0 then
+    redis.call('HDEL', KEYS[1], unpack(expired))
+end
+if deadline then
+    redis.call('ZADD', KEYS[2], deadline, ARGV[1])
+else
+    redis.call('ZREM', KEYS[2], ARGV[1])
+end
+table.sort(typing)
+local signature = table.concat(typing, ',')
+if (redis.call('GET', KEYS[3]) or '') == signature then
+    return nil
+end
+if signature == '' then
+    redis.call('DEL', KEYS[3])
+else
+    redis.call('SET', KEYS[3], signature)
+end
+table.insert(typing, 1, 1)
+return typing
+"""
+_set_script = redis_client.register_script(_SET_LUA) if redis_client else None
+_flush_script = redis_client.register_script(_FLUSH_LUA) if redis_client else None
+
+
+# === Recording ===
+
+def set_typing(room, nickname, typing):
+    """Records that `nickname` started or stopped typing in `room`. Returns True unless dropped as a repeat."""
+    config = current_app.config
+    if not redis_client or not config.get('TYPING_ENABLED', True):
+        return False
+    ttl = config.get('TYPING_TTL', 6.0)
+    now = time.monotonic()
+    with _local_lock:
+        previous = _local.get((room, nickname))
+        if typing and previous and previous[0] and now - previous[1] < ttl / 2:
+            duplicate = True # Still typing, and the expiry is far off
+        elif not typing and not (previous and previous[0]):
+            duplicate = True # Not typing as far as this worker knows
+        else:
+            duplicate = False
+            if typing:
+                _local[(room, nickname)] = (True, now)
+            else:
+                _local.pop((room, nickname), None)
+    if duplicate:
+        _counters['duplicates'] += 1
+        metrics.TYPING_EVENTS.labels('duplicate').inc()
+        return False
+    try:
+        changed = _set_script(keys=[room_key(room), DEADLINES_KEY, DIRTY_KEY],
+                              args=[room, nickname, int(ttl * 1000) if typing else 0])
+    except Exception as e:
+        logging.error(f"Redis error recording typing state of {nickname} in {room}: {e}")
+        with _local_lock:
+            _local.pop((room, nickname), None) # Let the next event retry
+        return False
+    _counters['accepted'] += 1
+    metrics.TYPING_EVENTS.labels('changed' if changed else 'refreshed').inc()
+    return True
+
+def stop_typing(room, nickname):
+    """Clears a typing indicator (message sent, room left), skipping Redis if it wasn't set here."""
+    return set_typing(room, nickname, False)
+
+
+# === Tick ===
+
+def flush_once(now_ms=None):
+    """Sends one typing_update per room whose typists changed. Returns the number sent."""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.spop(DIRTY_KEY, MAX_ROOMS_PER_TICK)
+    pipe.zrangebyscore(DEADLINES_KEY, '-inf', now_ms, start=0, num=MAX_ROOMS_PER_TICK)
+    dirty, expired = pipe.execute()
+    sent = 0
+    for room in set(dirty or ()) | set(expired or ()):
+        result = _flush_script(keys=[room_key(room), DEADLINES_KEY, sent_key(room)], args=[room])
+        if result:
+            socketio.emit('typing_update', {'room': room, 'users': list(result[1:])}, to=room)
+            sent += 1
+    _counters['updates'] += sent
+    metrics.TYPING_UPDATES.inc(sent)
+    return sent
+
+def _prune_local(ttl):
+    """Forgets local start records older than the TTL (their Redis entries have expired too)."""
+    cutoff = time.monotonic() - ttl
+    with _local_lock:
+        for key in [key for key, (_, sent_at) in _local.items() if sent_at < cutoff]:
+            del _local[key]
+
+def _ticker_loop(app):
+    """Background task: flushes coalesced typing changes every TYPING_TICK_MS."""
+    tick = app.config.get('TYPING_TICK_MS', 500) / 1000
+    ttl = app.config.get('TYPING_TTL', 6.0)
+    while True:
+        socketio.sleep(tick)
+        try:
+            with app.app_context():
+                flush_once()
+            _counters['ticks'] += 1
+            if _counters['ticks'] % 20 == 0:
+                _prune_local(ttl)
+        except Exception as e:
+            _counters['errors'] += 1
+            logging.error(f"Redis error flushing typing updates: {e}")
+
+def start_ticker(app):
+    """Starts this worker's typing tick task, once per process."""
+    if _ticker['started'] or not redis_client or not app.config.get('TYPING_ENABLED', True):
+        return
+    _ticker['started'] = True
+    socketio.start_background_task(_ticker_loop, app)
+
+
+def stats():
+    """Typing event and update counters for this worker."""
+    return dict(_counters, tracked=len(_local))
+
+register_stats_provider('typing', stats)
@@ -0,0 +1,211 @@
+# app/user_cache.py
+"""Cached user profiles for Flask-Login's user loader.
+
+Flask-Login loads the user on every HTTP request and, through Flask-SocketIO,
+on every socket event, so the lookup sits on the chat message hot path. The
+few fields the app reads from `current_user` are cached in two layers:
+
+    1. a per-process LRU with a short TTL (USER_CACHE_SIZE, USER_CACHE_TTL)
+    2. a shared Redis hash, ``user:<id>:profile`` (USER_CACHE_REDIS_TTL)
+
+and only a miss in both reaches the database. Code that changes a cached
+field calls `invalidate(user_id)`, which drops the Redis copy and tells every
+worker over the cluster `user` topic to drop its local copy.
+
+Invalidation also bumps a per-user generation, ``user:<id>:profile:gen``. A
+miss reads the generation together with the Redis copy and writes the row it
+loaded back only if the generation is unchanged, so a fill that raced an
+invalidation cannot put the old profile back for USER_CACHE_REDIS_TTL.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from flask_login import UserMixin
+
+from . import redis_client, db
+from . import cluster
+from .models import User
+from .ops import register_stats_provider
+
+USER_TOPIC = "user" # Cluster topic: {'user_id': id} whose profile just changed
+CACHED_FIELDS = ('username', 'email', 'nickname_color', 'email_confirmed')
+
+# user_id -> (CachedUser, cached_at), least recently used first
+_local = OrderedDict()
+_lock = threading.Lock()
+_counters = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'invalidations': 0, 'remote_invalidations': 0,
+             'stale_fills': 0}
+
+
+class CachedUser(UserMixin):
+    """Read-only stand-in for User carrying just the cached profile fields.
+
+    Load the User model (db.session.get) for anything that writes.
+    """
+
+    def __init__(self, id, username, email, nickname_color, email_confirmed):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.nickname_color = nickname_color
+        self.email_confirmed = email_confirmed
+
+    @classmethod
+    def from_model(cls, user):
+        return cls(user.id, *(getattr(user, field) for field in CACHED_FIELDS))
+
+    @classmethod
+    def from_hash(cls, user_id, fields):
+        return cls(user_id, fields['username'], fields['email'], fields.get('nickname_color') or None,
+                   fields.get('email_confirmed') == '1')
+
+    def to_hash(self):
+        return {
+            'username': self.username,
+            'email': self.email,
+            'nickname_color': self.nickname_color or '',
+            'email_confirmed': '1' if self.email_confirmed else '0',
+        }
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+def profile_key(user_id):
+    """Redis key of a user's cached profile hash."""
+    return f"user:{user_id}:profile"
+
+def generation_key(user_id):
+    """Redis counter bumped by every invalidation of a user's profile."""
+    return f"user:{user_id}:profile:gen"
+
+
+# Writes a profile loaded from the database unless it was invalidated since the miss read the generation.
+# KEYS: profile hash, generation. ARGV: generation seen ('' if none), TTL seconds, field, value, ...
+# Returns 1 if written, 0 if skipped.
+_FILL_LUA = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+_fill_script = redis_client.register_script(_FILL_LUA) if redis_client else None
+
+
+# === Local LRU ===
+
+def _get_local(user_id):
+    with _lock:
+        entry = _local.get(user_id)
+        if entry is None:
+            return None
+        user, cached_at = entry
+        if time.monotonic() - cached_at >= current_app.config.get('USER_CACHE_TTL', 60.0):
+            del _local[user_id]
+            return None
+        _local.move_to_end(user_id)
+        return user
+
+def _put_local(user):
+    with _lock:
+        _local[user.id] = (user, time.monotonic())
+        _local.move_to_end(user.id)
+        while len(_local) > current_app.config.get('USER_CACHE_SIZE', 1024):
+            _local.popitem(last=False) # Evict the least recently used user
+
+def _drop_local(user_id):
+    with _lock:
+        _local.pop(user_id, None)
+
+
+# === Lookups and invalidation ===
+
+def load(user_id):
+    """Returns the CachedUser for an ID (or None if no such user), reading the DB only on a miss."""
+    if not current_app.config.get('USER_CACHE_ENABLED', True):
+        user = db.session.get(User, user_id)
+        return CachedUser.from_model(user) if user else None
+
+    # Invalidations from other workers only arrive while the cluster listener runs
+    cluster.start_listener(current_app._get_current_object())
+
+    user = _get_local(user_id)
+    if user is not None:
+        _counters['local_hits'] += 1
+        return user
+
+    generation = None # Unknown: the fill below is skipped
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hgetall(profile_key(user_id))
+            pipe.get(generation_key(user_id))
+            fields, generation = pipe.execute()
+            generation = generation or ''
+            if fields:
+                _counters['redis_hits'] += 1
+                user = CachedUser.from_hash(user_id, fields)
+                _put_local(user)
+                return user
+        except Exception as e:
+            logging.error(f"Redis error reading cached profile of user {user_id}: {e}")
+
+    _counters['misses'] += 1
+    model = db.session.get(User, user_id)
+    if model is None:
+        return None
+    user = CachedUser.from_model(model)
+    if generation is None:
+        _put_local(user) # Redis unavailable: the local TTL bounds staleness
+        return user
+    try:
+        args = [generation, current_app.config.get('USER_CACHE_REDIS_TTL', 300)]
+        for field, value in user.to_hash().items():
+            args.extend((field, value))
+        if _fill_script(keys=[profile_key(user_id), generation_key(user_id)], args=args):
+            _put_local(user)
+        else:
+            _counters['stale_fills'] += 1 # Invalidated while we read the row: don't cache it anywhere
+    except Exception as e:
+        logging.error(f"Redis error caching profile of user {user_id}: {e}")
+    return user
+
+def invalidate(user_id):
+    """Drops a user's cached profile here, in Redis, and (over pub/sub) on every other worker.
+
+    Call it after committing a change to any of CACHED_FIELDS.
+    """
+    _counters['invalidations'] += 1
+    _drop_local(user_id)
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.delete(profile_key(user_id))
+            pipe.incr(generation_key(user_id))
+            pipe.expire(generation_key(user_id), current_app.config.get('USER_CACHE_REDIS_TTL', 300))
+            cluster.publish(USER_TOPIC, {'user_id': user_id}, pipe=pipe)
+            pipe.execute()
+        except Exception as e:
+            logging.error(f"Redis error invalidating cached profile of user {user_id}: {e}")
+
+def _on_remote_invalidation(payload):
+    """Cluster handler: another worker changed a user, so drop our local copy."""
+    _counters['remote_invalidations'] += 1
+    _drop_local(payload.get('user_id'))
+
+cluster.on(USER_TOPIC, _on_remote_invalidation)
+
+
+def stats():
+    """Hit/miss counters for this worker's user cache."""
+    lookups = _counters['local_hits'] + _counters['redis_hits'] + _counters['misses']
+    hits = _counters['local_hits'] + _counters['redis_hits']
+    return dict(_counters, size=len(_local),
+                hit_ratio=round(hits / lookups, 4) if lookups else 0.0)
+
+register_stats_provider('user_cache', stats)
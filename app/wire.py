@@ -0,0 +1,58 @@
+# app/wire.py
+"""Wire format for Socket.IO frames (CHAT_WIRE_FORMAT in config.py).
+
+    json             default Socket.IO JSON packets; every worker JSON-encodes
+                     each broadcast once for all of its local recipients
+    json-preencoded  chat payloads are encoded to compact JSON once, by the
+                     worker that handles the message; the string then rides the
+                     Redis queue and is copied into every worker's packet as-is
+    msgpack          binary MessagePack packets (python-socketio's MsgPackPacket,
+                     socket.io.msgpack.min.js in the browser): smaller frames and
+                     no JSON escaping, encoded once per worker per broadcast
+
+Clients handle both shapes of a payload: a dict, or a string they JSON.parse.
+"""
+import json
+from flask import current_app
+
+from . import assets
+
+WIRE_FORMATS = ('json', 'json-preencoded', 'msgpack')
+
+# Browser builds of the Socket.IO client matching each server serializer (vendored by build-assets)
+CLIENT_SCRIPTS = {
+    'default': 'vendor/socket.io.min.js',
+    'msgpack': 'vendor/socket.io.msgpack.min.js',
+}
+
+
+def wire_format(config):
+    """The configured wire format, falling back to 'json' for unknown values."""
+    value = str(config.get('CHAT_WIRE_FORMAT') or 'json').lower()
+    return value if value in WIRE_FORMATS else 'json'
+
+def serializer(config):
+    """The python-socketio serializer to pass to socketio.init_app."""
+    return 'msgpack' if wire_format(config) == 'msgpack' else 'default'
+
+def client_script(config):
+    """URL of the Socket.IO client build pages must load to talk to this server.
+
+    The vendored copy when it exists, else the same pinned build from the CDN.
+    """
+    name = CLIENT_SCRIPTS[serializer(config)]
+    if assets.has_asset(name):
+        return assets.asset_url(name)
+    return assets.VENDOR_ASSETS[name]['url']
+
+
+def encode(payload, config=None):
+    """Encodes a broadcast payload once, ready to pass to emit() for any number of recipients.
+
+    Only json-preencoded changes anything: the payload becomes a compact JSON
+    string, so neither the Redis hop nor any worker re-serializes the dict.
+    `config` defaults to the current app's (pass it from background tasks).
+    """
+    if wire_format(config if config is not None else current_app.config) == 'json-preencoded':
+        return json.dumps(payload, separators=(',', ':'))
+    return payload
@@ -0,0 +1,115 @@
+# app/write_behind.py
+"""Write-behind batching for chat message persistence.
+
+Messages are broadcast as soon as they arrive; persisting them to the room
+stream happens behind, in batches. A batch is flushed in one pipelined round
+trip when it reaches `max_batch` messages or `flush_interval` seconds after its
+first message, whichever comes first.
+"""
+import atexit
+import logging
+import threading # Green locks once eventlet.monkey_patch() has run
+
+from . import socketio, redis_client
+from . import message_store, cluster
+
+
+class MessageWriter:
+    """Collects messages for a few milliseconds and writes them in one pipeline."""
+
+    def __init__(self, max_batch=64, flush_interval=0.005, maxlen=message_store.DEFAULT_STREAM_MAXLEN,
+                 on_flush=None, on_failure=None, notify_topic=None):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.maxlen = maxlen
+        self.on_flush = on_flush # Called with the stored (decoded) messages of each batch
+        self.on_failure = on_failure # Called with the (room, fields) of a batch that could not be written
+        self.notify_topic = notify_topic # Cluster topic told which rooms changed, in the same round trip
+        self._pending = [] # (room, fields) tuples, oldest first
+        self._lock = threading.Lock() # Guards _pending and _timer_scheduled
+        self._flush_lock = threading.Lock() # Serializes writes so batches land in order
+        self._timer_scheduled = False
+        # Batch size reporting
+        self.batches = 0
+        self.messages = 0
+        self.failed = 0
+        self.max_batch_seen = 0
+        self.last_batch = 0
+
+    def submit(self, room, nickname, msg, color):
+        """Queues one message for the next batch."""
+        fields = message_store.encode_message(nickname, msg, color)
+        with self._lock:
+            self._pending.append((room, fields))
+            flush_now = len(self._pending) >= self.max_batch
+            if not flush_now and not self._timer_scheduled:
+                self._timer_scheduled = True
+                socketio.start_background_task(self._flush_later)
+        if flush_now:
+            self.flush()
+
+    def _flush_later(self):
+        socketio.sleep(self.flush_interval)
+        with self._lock:
+            self._timer_scheduled = False
+        self.flush()
+
+    def flush(self):
+        """Writes every queued message in one pipelined round trip. Returns the batch size."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                for room, fields in batch:
+                    pipe.xadd(message_store.stream_key(room), fields, maxlen=self.maxlen, approximate=True)
+                message_store.mark_unarchived(pipe, {room for room, _ in batch})
+                if self.notify_topic:
+                    cluster.publish(self.notify_topic, {'rooms': sorted({room for room, _ in batch})}, pipe=pipe)
+                entry_ids = pipe.execute()[:len(batch)]
+            except Exception as e:
+                self.failed += len(batch)
+                logging.error(f"Redis error flushing {len(batch)} queued messages: {e}")
+                if self.on_failure:
+                    self.on_failure(batch)
+                return 0
+
+            self.batches += 1
+            self.messages += len(batch)
+            self.last_batch = len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            logging.debug(f"Flushed message batch of {len(batch)}")
+            if self.on_flush:
+                stored = [(room, message_store.decode_entry(entry_id, fields))
+                          for (room, fields), entry_id in zip(batch, entry_ids)]
+                try:
+                    self.on_flush(stored)
+                except Exception as e:
+                    logging.error(f"Error in message flush callback: {e}")
+            return len(batch)
+
+    def stats(self):
+        """Batching counters for /ops/stats."""
+        return {
+            'batches': self.batches,
+            'messages': self.messages,
+            'failed': self.failed,
+            'pending': len(self._pending),
+            'last_batch_size': self.last_batch,
+            'max_batch_size': self.max_batch_seen,
+            'avg_batch_size': round(self.messages / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+def create_writer(config, on_flush=None, on_failure=None, notify_topic=None):
+    """Builds a MessageWriter from app config and makes sure it drains on shutdown."""
+    writer = MessageWriter(max_batch=config.get('WRITE_BEHIND_MAX_BATCH', 64),
+                           flush_interval=config.get('WRITE_BEHIND_FLUSH_MS', 5) / 1000.0,
+                           maxlen=config.get('MESSAGE_STREAM_MAXLEN', message_store.DEFAULT_STREAM_MAXLEN),
+                           on_flush=on_flush,
+                           on_failure=on_failure,
+                           notify_topic=notify_topic)
+    atexit.register(writer.flush) # Gunicorn workers exit normally on SIGTERM, so this runs
+    return writer
@@ -0,0 +1,250 @@
+# benchmarks/common.py
+"""Shared helpers for the chat benchmarks.
+
+The benchmarks run the real app under gunicorn/eventlet with the `bench`
+config (SQLite database, CSRF off) against a local Redis, and drive it with
+python-socketio clients. See benchmarks/README.md.
+"""
+import json
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+import socketio
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+BENCH_PASSWORD = 'benchpass'
+
+
+# === Server lifecycle ===
+
+def bench_env(redis_host='localhost', redis_port=6379, extra=None):
+    """Environment for app processes started by a benchmark."""
+    env = dict(os.environ)
+    env.update({
+        'FLASK_CONFIG': 'bench',
+        'FLASK_APP': 'run.py',
+        'REDIS_HOST': redis_host,
+        'REDIS_PORT': str(redis_port),
+        'PYTHONUNBUFFERED': '1',
+    })
+    env.update(extra or {})
+    return env
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def seed_users(count, env, prefix='bench'):
+    """Creates `count` confirmed users (bench0001, ...) in the benchmark database."""
+    subprocess.run([sys.executable, '-m', 'flask', 'chat', 'seed-users', '--count', str(count),
+                    '--prefix', prefix, '--password', BENCH_PASSWORD, '--create-tables'],
+                   cwd=REPO_ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    return [f"{prefix}{i:04d}" for i in range(1, count + 1)]
+
+def wait_for_http(url, timeout=30.0):
+    """Polls `url` until it answers; returns seconds waited."""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            requests.get(url, timeout=1)
+            return time.monotonic() - started
+        except requests.RequestException:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout}s")
+
+class Server:
+    """A gunicorn/eventlet app server with `workers` worker processes."""
+
+    def __init__(self, workers, env, port=None):
+        self.workers = workers
+        self.env = env
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def __enter__(self):
+        gunicorn = shutil.which('gunicorn') or 'gunicorn'
+        self.process = subprocess.Popen(
+            [gunicorn, '--worker-class', 'eventlet', '-w', str(self.workers),
+             '--bind', f"127.0.0.1:{self.port}", '--log-level', 'warning', 'run:app'],
+            cwd=REPO_ROOT, env=self.env)
+        wait_for_http(self.url + '/')
+        time.sleep(0.5 * self.workers) # Let every worker finish booting, not just the first
+        return self
+
+    def __exit__(self, *exc):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# === Clients ===
+
+def login(base_url, username, password=BENCH_PASSWORD):
+    """Logs in over HTTP and returns the session cookie header value."""
+    session = requests.Session()
+    response = session.post(f"{base_url}/auth/login", data={'username': username, 'password': password},
+                            allow_redirects=False, timeout=10)
+    if response.status_code != 302 or 'session' not in session.cookies:
+        raise RuntimeError(f"Login failed for {username} (HTTP {response.status_code})")
+    return '; '.join(f"{name}={value}" for name, value in session.cookies.items())
+
+class BenchClient:
+    """A websocket-only Socket.IO client that timestamps every chat and direct message it receives."""
+
+    def __init__(self, base_url, username, serializer='default'):
+        self.base_url = base_url
+        self.username = username
+        self.cookie = login(base_url, username)
+        # Must match the server: 'msgpack' when it runs with CHAT_WIRE_FORMAT=msgpack
+        self.sio = socketio.Client(reconnection=False, serializer=serializer)
+        self.received = {} # message text -> receive time (time.time())
+        self.frames = 0 # chat_message / chat_batch frames received (one per socket write)
+        self.history_at = None # When the first history_batch arrived
+        self.errors = []
+        self._lock = threading.Lock()
+        self.sio.on('chat_message', self._on_chat_message)
+        self.sio.on('direct_message', self._on_chat_message) # Same payload fields (msg, ts, ...)
+        self.sio.on('chat_batch', self._on_chat_batch) # BROADCAST_BATCH_ENABLED
+        self.sio.on('history_batch', self._on_history)
+        self.sio.on('error', lambda data: self.errors.append(data))
+
+    def _on_chat_message(self, data):
+        now = time.time()
+        if isinstance(data, str): # CHAT_WIRE_FORMAT=json-preencoded
+            data = json.loads(data)
+        with self._lock:
+            self.frames += 1
+            self.received[data['msg']] = now
+
+    def _on_chat_batch(self, data):
+        now = time.time()
+        if isinstance(data, str):
+            data = json.loads(data)
+        with self._lock:
+            self.frames += 1
+            for message in data['messages']:
+                self.received[message['msg']] = now
+
+    def _on_history(self, data):
+        if self.history_at is None:
+            self.history_at = time.time()
+
+    def connect(self):
+        """Connects and returns seconds until the history batch arrived."""
+        started = time.time()
+        self.history_at = None
+        self.sio.connect(self.base_url, headers={'Cookie': self.cookie}, transports=['websocket'],
+                         wait_timeout=30)
+        while self.history_at is None and time.time() - started < 30:
+            time.sleep(0.005)
+        return (self.history_at or time.time()) - started
+
+    def join(self, room):
+        self.sio.emit('join_room', {'room': room})
+
+    def send(self, room, text):
+        self.sio.emit('new_message', {'room': room, 'msg': text})
+
+    def send_direct(self, nickname, text):
+        self.sio.emit('direct_message', {'to': nickname, 'msg': text})
+
+    def disconnect(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+
+def client_serializer(wire_format):
+    """The python-socketio client serializer for a server CHAT_WIRE_FORMAT."""
+    return 'msgpack' if wire_format == 'msgpack' else 'default'
+
+def connect_clients(base_url, usernames, parallelism=32, serializer='default'):
+    """Logs in and connects one client per username. Returns (clients, connect latencies)."""
+    clients = [None] * len(usernames)
+    latencies = [None] * len(usernames)
+    next_index = iter(range(len(usernames)))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(next_index, None)
+            if i is None:
+                return
+            client = BenchClient(base_url, usernames[i], serializer=serializer)
+            latencies[i] = client.connect()
+            clients[i] = client
+
+    threads = [threading.Thread(target=worker) for _ in range(min(parallelism, len(usernames)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients, latencies
+
+def fanout_latencies(clients, sent_at, since=None):
+    """Send-to-receive latency samples (seconds) of every message in `sent_at` seen by each client.
+
+    With `since`, only messages sent at or after that time count. Returns (samples, deliveries).
+    """
+    samples = []
+    for client in clients:
+        for text, received_at in list(client.received.items()):
+            sent = sent_at.get(text)
+            if sent is not None and (since is None or sent >= since):
+                samples.append(received_at - sent)
+    return samples, len(samples)
+
+def unique_room(prefix='bench'):
+    """A fresh room name so runs never see each other's history."""
+    return f"{prefix}-{uuid.uuid4().hex[:10]}"
+
+
+# === Reporting ===
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Returns {'p50': ..., ...} in milliseconds for a list of second-valued samples."""
+    if not samples:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        result[f"p{p}"] = round(ordered[index] * 1000, 2)
+    result['mean'] = round(statistics.fmean(ordered) * 1000, 2)
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(name, results):
+    """Writes machine-readable results to benchmarks/results/<name>-<timestamp>.json.
+
+    A `meta` block (benchmark name, git revision, time, host) is added so runs can be compared.
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    meta = {'benchmark': name, 'git_revision': git_revision(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'host': socket.gethostname(), 'python': sys.version.split()[0]}
+    with open(path, 'w') as f:
+        json.dump(dict(results, meta=meta), f, indent=2)
+    return path
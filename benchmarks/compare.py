@@ -0,0 +1,57 @@
+# benchmarks/compare.py
+"""Compares two benchmark result files side by side.
+
+Usage:
+
+    python benchmarks/compare.py benchmarks/results/chat_burst-A.json benchmarks/results/chat_burst-B.json
+
+Every numeric metric present in both files is printed with its relative
+change. Latency metrics (`*_ms`, `*_seconds`) are better when lower,
+throughput (`*_per_sec`, `deliveries`) when higher.
+"""
+import json
+import sys
+
+
+def flatten(value, prefix=''):
+    """Flattens nested dicts/lists into {'results.0.fanout_latency_ms.p99': 12.3, ...}."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+    flat = {}
+    for key, item in items:
+        flat.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+def lower_is_better(metric):
+    return '_ms' in metric or metric.endswith('_seconds') or 'failures' in metric
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    with open(sys.argv[1]) as f:
+        before = json.load(f)
+    with open(sys.argv[2]) as f:
+        after = json.load(f)
+    for label, data in (('before', before), ('after', after)):
+        meta = data.get('meta', {})
+        print(f"{label:<7} {meta.get('benchmark')} @ {meta.get('git_revision')} ({meta.get('time')})")
+
+    old, new = flatten(before.get('results', [])), flatten(after.get('results', []))
+    print(f"\n{'metric':<48} {'before':>12} {'after':>12} {'change':>9}")
+    for metric in sorted(old.keys() & new.keys()):
+        a, b = old[metric], new[metric]
+        if a in (None, 0):
+            change = ''
+        else:
+            delta = (b - a) / abs(a) * 100
+            better = delta < 0 if lower_is_better(metric) else delta > 0
+            change = f"{delta:+.1f}%" + (' +' if better and abs(delta) >= 5 else ' -' if abs(delta) >= 5 else '')
+        print(f"results.{metric:<40} {a:>12} {b:>12} {change:>9}")
+
+
+if __name__ == '__main__':
+    main()
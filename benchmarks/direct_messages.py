@@ -0,0 +1,148 @@
+# benchmarks/direct_messages.py
+"""Direct message delivery latency vs. the number of users online.
+
+Starts gunicorn/eventlet with `--workers` workers and connects two clients, a
+sender and a recipient with `--tabs` open tabs. For each online population in
+`--online` (default 0, 1000, 10000, 100000) it first fills the presence maps
+in Redis with that many synthetic sockets, then has the sender send
+`--messages` direct messages and records, per message, when each recipient
+tab got it.
+
+Alongside the end-to-end latency it times, directly against Redis, the two
+ways of finding the recipient's sockets at that population:
+
+    reverse_index   SMEMBERS presence:user:<nickname>:sids (what the app does)
+    map_scan        HGETALL sid_nickname_map and filter (the only option before)
+
+Delivery latency and the reverse-index lookup should stay flat as the
+population grows; the scan grows with it. The synthetic sockets are removed
+again at the end.
+
+Usage (from the repo root, with Redis on localhost:6379):
+
+    python benchmarks/direct_messages.py --online 0 1000 10000 100000 --messages 200
+"""
+import argparse
+import os
+import sys
+import time
+
+import redis
+
+sys.path.insert(0, os.path.dirname(__file__))
+import common  # noqa: E402
+
+SID_NICKNAME_MAP_KEY = "sid_nickname_map" # Must match app/presence.py
+FILLER_PREFIX = "dmfill"
+
+
+def user_sids_key(nickname):
+    return f"presence:user:{nickname}:sids" # Must match app/presence.py
+
+def fill_online(client, current, target, batch=5000):
+    """Adds synthetic sockets (one per synthetic user) until `target` are online. Returns the new count."""
+    for start in range(current, target, batch):
+        pipe = client.pipeline(transaction=False)
+        for i in range(start, min(target, start + batch)):
+            sid, nickname = f"{FILLER_PREFIX}-sid-{i}", f"{FILLER_PREFIX}{i:06d}"
+            pipe.hset(SID_NICKNAME_MAP_KEY, sid, nickname)
+            pipe.sadd(user_sids_key(nickname), sid)
+        pipe.execute()
+    return max(current, target)
+
+def clear_online(client, count, batch=5000):
+    """Removes the synthetic sockets added by fill_online."""
+    for start in range(0, count, batch):
+        pipe = client.pipeline(transaction=False)
+        for i in range(start, min(count, start + batch)):
+            pipe.hdel(SID_NICKNAME_MAP_KEY, f"{FILLER_PREFIX}-sid-{i}")
+            pipe.delete(user_sids_key(f"{FILLER_PREFIX}{i:06d}"))
+        pipe.execute()
+
+def time_lookups(client, nickname, samples):
+    """Latency samples (seconds) of both ways of finding a user's sockets."""
+    index, scan = [], []
+    for _ in range(samples):
+        started = time.perf_counter()
+        client.smembers(user_sids_key(nickname))
+        index.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        [sid for sid, name in client.hgetall(SID_NICKNAME_MAP_KEY).items() if name == nickname]
+        scan.append(time.perf_counter() - started)
+    return index, scan
+
+def send_batch(sender, recipients, nickname, args, label):
+    """Sends args.messages direct messages and returns (latency samples, deliveries expected)."""
+    sent_at = {}
+    for n in range(args.messages):
+        text = f"{label}:{n}"
+        sent_at[text] = time.time()
+        sender.send_direct(nickname, text)
+        time.sleep(args.interval)
+    deadline = time.time() + args.drain_timeout
+    while time.time() < deadline:
+        if all(len([t for t in tab.received if t in sent_at]) >= len(sent_at) for tab in recipients):
+            break
+        time.sleep(0.05)
+    latencies, _ = common.fanout_latencies(recipients, sent_at)
+    return latencies, len(sent_at) * len(recipients)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--online', type=int, nargs='+', default=[0, 1000, 10000, 100000],
+                        help='Synthetic online populations to measure at')
+    parser.add_argument('--messages', type=int, default=200, help='Direct messages sent per population')
+    parser.add_argument('--interval', type=float, default=0.01, help='Seconds between messages')
+    parser.add_argument('--tabs', type=int, default=2, help='Sockets the recipient has open')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--lookup-samples', type=int, default=20, help='Timed lookups per population and method')
+    parser.add_argument('--drain-timeout', type=float, default=15.0)
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    args = parser.parse_args()
+
+    env = common.bench_env(args.redis_host, args.redis_port,
+                           extra={'RATE_LIMIT_DM_USER': '1000000/1000000'}) # Measure delivery, not the limiter
+    sender_name, recipient_name = common.seed_users(2, env, prefix='dmbench')
+    app_redis = redis.Redis(host=args.redis_host, port=args.redis_port, db=1, decode_responses=True)
+    online = 0
+    results = []
+    try:
+        with common.Server(args.workers, env) as server:
+            sender = common.BenchClient(server.url, sender_name)
+            sender.connect()
+            recipients = []
+            for _ in range(args.tabs):
+                tab = common.BenchClient(server.url, recipient_name)
+                tab.connect()
+                recipients.append(tab)
+            for population in sorted(args.online):
+                online = fill_online(app_redis, online, population)
+                index, scan = time_lookups(app_redis, recipient_name, args.lookup_samples)
+                latencies, expected = send_batch(sender, recipients, recipient_name, args, f"online{population}")
+                result = {
+                    'online': population,
+                    'deliveries': len(latencies),
+                    'deliveries_expected': expected,
+                    'delivery_latency_ms': common.percentiles(latencies),
+                    'reverse_index_lookup_ms': common.percentiles(index),
+                    'map_scan_lookup_ms': common.percentiles(scan),
+                }
+                results.append(result)
+                print(f"online={population:<7} delivered={len(latencies)}/{expected} "
+                      f"latency p50={result['delivery_latency_ms']['p50']}ms "
+                      f"p99={result['delivery_latency_ms']['p99']}ms | "
+                      f"lookup index p50={result['reverse_index_lookup_ms']['p50']}ms "
+                      f"scan p50={result['map_scan_lookup_ms']['p50']}ms")
+            for client in [sender] + recipients:
+                client.disconnect()
+    finally:
+        clear_online(app_redis, online)
+
+    path = common.write_results('direct_messages', {'args': vars(args), 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
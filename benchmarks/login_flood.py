@@ -0,0 +1,115 @@
+# benchmarks/login_flood.py
+"""Chat latency during a login flood, with password hashing inline vs. offloaded.
+
+Starts a single eventlet worker, connects `--clients` chat clients to one room
+and has one of them send a message every `--interval` seconds. Halfway through
+the run, `--flooders` threads start logging in over HTTP as fast as they can,
+so PBKDF2 verification competes with the chat. Fan-out latency is reported
+separately for the quiet and the flooded phase, once with
+PASSWORD_HASH_OFFLOAD=false (hashing on the hub) and once with it on.
+
+Usage (from the repo root, with Redis on localhost:6379):
+
+    python benchmarks/login_flood.py --clients 20 --flooders 8 --duration 20
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(__file__))
+import common  # noqa: E402
+
+
+def flood(base_url, username, stop, counts):
+    while not stop.is_set():
+        started = time.time()
+        try:
+            response = requests.post(f"{base_url}/auth/login",
+                                     data={'username': username, 'password': common.BENCH_PASSWORD},
+                                     allow_redirects=False, timeout=30)
+            key = 'ok' if response.status_code == 302 else f"http_{response.status_code}"
+        except requests.RequestException:
+            key = 'error'
+        counts.setdefault(key, 0)
+        counts[key] += 1
+        counts.setdefault('latencies', []).append(time.time() - started)
+
+def run_once(offload, usernames, args):
+    env = common.bench_env(args.redis_host, args.redis_port,
+                           extra={'PASSWORD_HASH_OFFLOAD': 'true' if offload else 'false'})
+    with common.Server(1, env) as server:
+        clients, _ = common.connect_clients(server.url, usernames[:args.clients])
+        room = common.unique_room('flood')
+        for client in clients:
+            client.join(room)
+        time.sleep(1.0)
+
+        sender = clients[0]
+        sent_at = {}
+        stop = threading.Event()
+        counts = {}
+        flooders = [threading.Thread(target=flood, args=(server.url, usernames[-1], stop, counts))
+                    for _ in range(args.flooders)]
+        flood_started = None
+        started = time.time()
+        n = 0
+        while time.time() - started < args.duration:
+            if flood_started is None and time.time() - started >= args.duration / 2:
+                flood_started = time.time()
+                for thread in flooders:
+                    thread.start()
+            text = f"ping:{n}"
+            sent_at[text] = time.time()
+            sender.send(room, text)
+            n += 1
+            time.sleep(args.interval)
+        stop.set()
+        for thread in flooders:
+            thread.join()
+        time.sleep(1.0) # Let the last messages arrive
+
+        receivers = clients[1:]
+        flooded, _ = common.fanout_latencies(receivers, sent_at, since=flood_started)
+        quiet, _ = common.fanout_latencies(receivers, {text: sent for text, sent in sent_at.items()
+                                                       if sent < flood_started})
+        for client in clients:
+            client.disconnect()
+
+    return {
+        'password_hash_offload': offload,
+        'quiet_fanout_latency_ms': common.percentiles(quiet),
+        'flooded_fanout_latency_ms': common.percentiles(flooded),
+        'logins': {key: value for key, value in counts.items() if key != 'latencies'},
+        'login_latency_ms': common.percentiles(counts.get('latencies', [])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--flooders', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds; the flood covers the second half')
+    parser.add_argument('--interval', type=float, default=0.05, help='Seconds between chat messages')
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    args = parser.parse_args()
+
+    usernames = common.seed_users(args.clients + 1, common.bench_env(args.redis_host, args.redis_port))
+    results = []
+    for offload in (False, True):
+        result = run_once(offload, usernames, args)
+        results.append(result)
+        quiet, flooded = result['quiet_fanout_latency_ms'], result['flooded_fanout_latency_ms']
+        print(f"offload={str(offload):<5} quiet p50/p99={quiet['p50']}/{quiet['p99']}ms "
+              f"flooded p50/p99={flooded['p50']}/{flooded['p99']}ms logins={result['logins']}")
+
+    path = common.write_results('login_flood', {'args': vars(args), 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/scale_out.py
+"""Scale-out benchmark: message throughput and fan-out latency vs. worker count.
+
+For each worker count (default 1, 2, 4, 8) this starts gunicorn/eventlet with
+that many workers, connects `--clients` websocket-only clients (spread across
+workers by the kernel's accept balancing), puts them all in one fresh room and
+has `--senders` of them send `--messages` messages each. Every message carries
+its send time, so each receiving client yields one fan-out latency sample.
+
+Usage (from the repo root, with Redis on localhost:6379):
+
+    pip install -r requirements.txt -r benchmarks/requirements.txt
+    python benchmarks/scale_out.py --workers 1 2 4 8
+
+Results are printed and written to benchmarks/results/scale_out-<timestamp>.json.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+import common  # noqa: E402
+
+
+def run_once(workers, usernames, args, env):
+    with common.Server(workers, env) as server:
+        clients, connect_latencies = common.connect_clients(server.url, usernames)
+        room = common.unique_room()
+        for client in clients:
+            client.join(room)
+        time.sleep(1.0) # Let every join land before anyone sends
+
+        senders = clients[:args.senders]
+        sent_at = {} # message text -> send time
+        lock = threading.Lock()
+
+        def send_all(client, index):
+            for n in range(args.messages):
+                text = f"{index}:{n}"
+                with lock:
+                    sent_at[text] = time.time()
+                client.send(room, text)
+                if args.interval:
+                    time.sleep(args.interval)
+
+        started = time.time()
+        threads = [threading.Thread(target=send_all, args=(client, i)) for i, client in enumerate(senders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Wait until every client has every message, or the drain timeout passes
+        expected = len(sent_at)
+        deadline = time.time() + args.drain_timeout
+        while time.time() < deadline:
+            if all(len(client.received) >= expected for client in clients):
+                break
+            time.sleep(0.05)
+        finished = max((max(client.received.values(), default=started) for client in clients), default=started)
+
+        latencies, delivered = common.fanout_latencies(clients, sent_at)
+        elapsed = max(finished - started, 1e-9)
+        for client in clients:
+            client.disconnect()
+
+    return {
+        'workers': workers,
+        'clients': len(clients),
+        'messages_sent': expected,
+        'deliveries_expected': expected * len(clients),
+        'deliveries': delivered,
+        'messages_per_sec': round(expected / elapsed, 1),
+        'deliveries_per_sec': round(delivered / elapsed, 1),
+        'fanout_latency_ms': common.percentiles(latencies),
+        'connect_to_history_ms': common.percentiles(connect_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--senders', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=100, help='Messages per sender')
+    parser.add_argument('--interval', type=float, default=0.0, help='Seconds between messages per sender')
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    args = parser.parse_args()
+
+    env = common.bench_env(args.redis_host, args.redis_port)
+    usernames = common.seed_users(args.clients, env)
+    results = []
+    for workers in args.workers:
+        result = run_once(workers, usernames, args, env)
+        results.append(result)
+        latency = result['fanout_latency_ms']
+        print(f"workers={workers:<2} msgs/s={result['messages_per_sec']:<8} "
+              f"deliveries={result['deliveries']}/{result['deliveries_expected']} "
+              f"fan-out p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms")
+
+    path = common.write_results('scale_out', {'args': vars(args), 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+# benchmarks/scenarios.py
+"""Named load scenarios for the chat hot paths in app/events.py.
+
+Every scenario starts the app (gunicorn/eventlet running create_app with the
+`bench` config) against a local Redis, seeds `--clients` confirmed users and
+drives that many Socket.IO clients through connect -> history_batch ->
+new_message -> disconnect:
+
+    chat_burst       all clients connected to one room, `--senders` of them send
+                     `--messages` each as fast as they can
+    reconnect_storm  all clients drop and reconnect at once, `--rounds` times,
+                     while one client keeps sending probe messages
+    idle_heavy       many connected clients, few of them active, sending at a
+                     steady low rate (`--interval`)
+
+Each run reports connect latency (connect until history_batch arrives),
+messages/sec and end-to-end fan-out latency (p50/p95/p99), and writes JSON to
+benchmarks/results/<scenario>-<timestamp>.json. Compare two runs with
+benchmarks/compare.py.
+
+Usage (from the repo root, with Redis on localhost:6379):
+
+    python benchmarks/scenarios.py chat_burst --clients 200 --workers 2
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/scenarios.py idle_heavy
+    python benchmarks/scenarios.py chat_burst --wire-format msgpack
+    python benchmarks/scenarios.py chat_burst --broadcast-batch-ms 30
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+import common  # noqa: E402
+
+
+class Probe:
+    """Sends numbered messages from one client and remembers when each was sent."""
+
+    def __init__(self, client, room, prefix='probe'):
+        self.client = client
+        self.room = room
+        self.prefix = prefix
+        self.sent_at = {}
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def send(self):
+        with self._lock:
+            text = f"{self.prefix}:{self._count}"
+            self._count += 1
+            self.sent_at[text] = time.time()
+        self.client.send(self.room, text)
+
+    def run(self, interval, stop):
+        """Sends every `interval` seconds until `stop` is set."""
+        while not stop.is_set():
+            self.send()
+            time.sleep(interval)
+
+
+def wait_for_delivery(clients, expected, timeout):
+    """Waits until every client has `expected` messages (or `timeout`). Returns when the last one arrived."""
+    deadline = time.time() + timeout
+    while time.time() < deadline and not all(len(client.received) >= expected for client in clients):
+        time.sleep(0.05)
+    return max((max(client.received.values(), default=0) for client in clients), default=0)
+
+def join_all(clients, room):
+    for client in clients:
+        client.join(room)
+    time.sleep(1.0) # Let every join land before anyone sends
+
+def disconnect_all(clients):
+    started = time.time()
+    for client in clients:
+        client.disconnect()
+    return time.time() - started
+
+
+# === Scenarios ===
+
+def chat_burst(server, usernames, args):
+    clients, connect_latencies = common.connect_clients(
+        server.url, usernames, serializer=common.client_serializer(args.wire_format))
+    room = common.unique_room('burst')
+    join_all(clients, room)
+
+    probes = [Probe(client, room, prefix=f"s{i}") for i, client in enumerate(clients[:args.senders])]
+
+    def send_all(probe):
+        for _ in range(args.messages):
+            probe.send()
+
+    started = time.time()
+    threads = [threading.Thread(target=send_all, args=(probe,)) for probe in probes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sent_at = {text: sent for probe in probes for text, sent in probe.sent_at.items()}
+    finished = wait_for_delivery(clients, len(sent_at), args.drain_timeout)
+    latencies, deliveries = common.fanout_latencies(clients, sent_at)
+    # Every frame to the room crosses the Redis queue once and is written once per socket
+    frames = sum(client.frames for client in clients) / max(len(clients), 1)
+    disconnect_seconds = disconnect_all(clients)
+
+    elapsed = max(finished - started, 1e-9)
+    return {
+        'messages_sent': len(sent_at),
+        'deliveries': deliveries,
+        'deliveries_expected': len(sent_at) * len(clients),
+        'messages_per_sec': round(len(sent_at) / elapsed, 1),
+        'frames_per_message': round(frames / max(len(sent_at), 1), 3),
+        'fanout_latency_ms': common.percentiles(latencies),
+        'connect_latency_ms': common.percentiles(connect_latencies),
+        'disconnect_all_seconds': round(disconnect_seconds, 3),
+    }
+
+def reconnect_storm(server, usernames, args):
+    clients, initial_connects = common.connect_clients(
+        server.url, usernames, serializer=common.client_serializer(args.wire_format))
+    room = common.unique_room('storm')
+    join_all(clients, room)
+    probe = Probe(clients[0], room)
+    stop = threading.Event()
+    prober = threading.Thread(target=probe.run, args=(args.interval, stop))
+    prober.start()
+
+    storm_clients = clients[1:]
+    reconnect_latencies = []
+    failures = 0
+    for _ in range(args.rounds):
+        disconnect_all(storm_clients)
+        latencies = [None] * len(storm_clients)
+
+        def reconnect(i):
+            try:
+                latencies[i] = storm_clients[i].connect()
+                storm_clients[i].join(room)
+            except Exception:
+                pass
+
+        threads = [threading.Thread(target=reconnect, args=(i,)) for i in range(len(storm_clients))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        failures += sum(1 for latency in latencies if latency is None)
+        reconnect_latencies.extend(latency for latency in latencies if latency is not None)
+        time.sleep(args.settle)
+
+    stop.set()
+    prober.join()
+    time.sleep(1.0)
+    # Clients miss probes sent while they were offline, so deliveries stay below probes x clients
+    latencies, deliveries = common.fanout_latencies(storm_clients, probe.sent_at)
+    disconnect_all(clients)
+    return {
+        'rounds': args.rounds,
+        'reconnects': len(reconnect_latencies),
+        'reconnect_failures': failures,
+        'connect_latency_ms': common.percentiles(initial_connects),
+        'reconnect_latency_ms': common.percentiles(reconnect_latencies),
+        'probe_messages': len(probe.sent_at),
+        'probe_deliveries': deliveries,
+        'fanout_latency_ms': common.percentiles(latencies),
+    }
+
+def idle_heavy(server, usernames, args):
+    clients, connect_latencies = common.connect_clients(
+        server.url, usernames, serializer=common.client_serializer(args.wire_format))
+    room = common.unique_room('idle')
+    join_all(clients, room)
+    stop = threading.Event()
+    probes = [Probe(client, room, prefix=f"a{i}") for i, client in enumerate(clients[:args.senders])]
+    threads = [threading.Thread(target=probe.run, args=(args.interval, stop)) for probe in probes]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    sent_at = {text: sent for probe in probes for text, sent in probe.sent_at.items()}
+    wait_for_delivery(clients, len(sent_at), args.drain_timeout)
+    latencies, deliveries = common.fanout_latencies(clients, sent_at)
+    disconnect_all(clients)
+    return {
+        'active_clients': len(probes),
+        'idle_clients': len(clients) - len(probes),
+        'messages_sent': len(sent_at),
+        'deliveries': deliveries,
+        'deliveries_expected': len(sent_at) * len(clients),
+        'messages_per_sec': round(len(sent_at) / max(args.duration, 1e-9), 1),
+        'fanout_latency_ms': common.percentiles(latencies),
+        'connect_latency_ms': common.percentiles(connect_latencies),
+        'elapsed_seconds': round(time.time() - started, 2),
+    }
+
+SCENARIOS = {
+    'chat_burst': chat_burst,
+    'reconnect_storm': reconnect_storm,
+    'idle_heavy': idle_heavy,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1, help='Gunicorn eventlet workers')
+    parser.add_argument('--senders', type=int, default=10, help='Active clients (chat_burst, idle_heavy)')
+    parser.add_argument('--messages', type=int, default=100, help='Messages per sender (chat_burst)')
+    parser.add_argument('--rounds', type=int, default=3, help='Reconnect rounds (reconnect_storm)')
+    parser.add_argument('--settle', type=float, default=2.0, help='Seconds between reconnect rounds')
+    parser.add_argument('--interval', type=float, default=0.5, help='Seconds between messages per active client')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of steady traffic (idle_heavy)')
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--wire-format', choices=('json', 'json-preencoded', 'msgpack'), default='json',
+                        help='CHAT_WIRE_FORMAT the server runs with')
+    parser.add_argument('--broadcast-batch-ms', type=float, default=0,
+                        help='Run with BROADCAST_BATCH_ENABLED and this window (0: off)')
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    args = parser.parse_args()
+
+    extra = {'CHAT_WIRE_FORMAT': args.wire_format}
+    if args.broadcast_batch_ms:
+        extra.update(BROADCAST_BATCH_ENABLED='true', BROADCAST_BATCH_WINDOW_MS=str(args.broadcast_batch_ms))
+    env = common.bench_env(args.redis_host, args.redis_port, extra=extra)
+    usernames = common.seed_users(args.clients, env)
+    with common.Server(args.workers, env) as server:
+        result = SCENARIOS[args.scenario](server, usernames, args)
+
+    for key, value in result.items():
+        print(f"{key:<24} {value}")
+    path = common.write_results(args.scenario, {'args': vars(args), 'results': [result]})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
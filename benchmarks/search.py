@@ -0,0 +1,161 @@
+# benchmarks/search.py
+"""Message search latency on a synthetic archive (app/search.py).
+
+Fills the `messages` table of the bench database with `--messages` synthetic
+messages spread over `--rooms` rooms, `--authors` authors and the last
+`--days` days, with words drawn from a Zipf-like vocabulary so there are both
+very common and very rare terms. It then times `--queries` searches of each
+kind, in-process (no server or Redis needed):
+
+    common_word   one word found in a large share of messages
+    rare_word     one word found in a handful of messages
+    two_words     two mid-frequency words (AND)
+    author        a common word by one author
+    room          a common word in one room
+    last_7_days   a common word in the last week
+    page_5        the 5th page of a common word, following next_cursor
+
+Seeding happens once; later runs reuse the rows unless `--reseed` is given.
+On Postgres (BENCH_DATABASE_URL=postgresql://...) create the schema first
+with `FLASK_CONFIG=bench flask db upgrade`, so the table is partitioned and
+has the GIN text index. On the default SQLite database the search falls
+back to LIKE scans, which shows what the index saves.
+
+Usage (from the repo root):
+
+    python benchmarks/search.py --messages 1000000 --queries 50
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+import common  # noqa: E402
+sys.path.insert(0, common.REPO_ROOT)
+
+COMMON_WORDS = ('hello', 'thanks', 'deploy', 'build', 'lunch', 'meeting', 'coffee', 'release', 'review', 'weekend',
+                'server', 'ticket', 'docker', 'python', 'question', 'morning', 'music', 'game', 'weather', 'update')
+VOCABULARY_SIZE = 20000 # Synthetic words wNNNNN, drawn with Zipf-like frequencies
+
+
+def make_vocabulary():
+    """Word list and cumulative weights: the first words are common, the tail is rare."""
+    words = list(COMMON_WORDS) + [f"w{i:05d}" for i in range(VOCABULARY_SIZE)]
+    weights, total = [], 0.0
+    for rank in range(len(words)):
+        total += 1.0 / (rank + 1)
+        weights.append(total)
+    return words, weights
+
+def seed(app, args):
+    """Inserts args.messages synthetic messages in batches of args.batch."""
+    from app import archive
+    from app.models import EPOCH
+    rng = random.Random(42)
+    words, weights = make_vocabulary()
+    now_ms = int(time.time() * 1000)
+    span_ms = args.days * 86400 * 1000
+    started = time.time()
+    with app.app_context():
+        for offset in range(0, args.messages, args.batch):
+            rows = []
+            for i in range(offset, min(args.messages, offset + args.batch)):
+                created_ms = now_ms - span_ms + i * span_ms // args.messages # Increasing, like stream IDs
+                rows.append({
+                    'room': f"room-{rng.randrange(args.rooms):03d}",
+                    'created_at': EPOCH + datetime.timedelta(milliseconds=created_ms),
+                    'seq': i % 4,
+                    'nickname': f"bench{rng.randrange(args.authors):04d}",
+                    'color': '#3a7bd5',
+                    'body': ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(4, 16))),
+                })
+            archive.write_rows(rows)
+            print(f"\rSeeded {offset + len(rows)}/{args.messages} messages", end='', flush=True)
+    print(f"\nSeeding took {time.time() - started:.1f}s")
+
+def prepare(app, args):
+    """Creates the table on SQLite and seeds it unless it already holds enough rows."""
+    from app import db
+    from app.models import Message
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            columns = {column['name'] for column in db.inspect(db.engine).get_columns('messages')}
+            if 'search_vector' not in columns:
+                sys.exit("messages.search_vector is missing: run `FLASK_CONFIG=bench flask db upgrade` first.")
+        else:
+            db.create_all()
+        if args.reseed:
+            db.session.execute(db.delete(Message))
+            db.session.commit()
+        existing = db.session.scalar(db.select(db.func.count()).select_from(Message))
+    if existing < args.messages:
+        if existing:
+            sys.exit(f"The table holds {existing} messages; use --reseed to start over with {args.messages}.")
+        seed(app, args)
+    return dialect
+
+def query_kinds():
+    """name -> keyword arguments for search.search (minus the page cursor)."""
+    from app import search
+    week_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=7)
+    return {
+        'common_word': {'text': COMMON_WORDS[0]},
+        'rare_word': {'text': f"w{VOCABULARY_SIZE - 7:05d}"},
+        'two_words': {'text': f"{COMMON_WORDS[8]} {COMMON_WORDS[12]}"},
+        'author': {'text': COMMON_WORDS[1], 'author': 'bench0007'},
+        'room': {'text': COMMON_WORDS[2], 'room': 'room-003'},
+        'last_7_days': {'text': COMMON_WORDS[3], 'since': week_ago},
+        'page_5': {'text': COMMON_WORDS[0], 'pages': 5},
+    }, search
+
+def measure(app, args):
+    kinds, search = query_kinds()
+    results = {}
+    with app.app_context():
+        for name, params in kinds.items():
+            params = dict(params)
+            pages = params.pop('pages', 1)
+            samples, hits = [], 0
+            for _ in range(args.queries):
+                cursor = None
+                for _ in range(pages):
+                    started = time.perf_counter()
+                    messages, cursor = search.search(cursor=cursor, limit=args.limit, **params)
+                    elapsed = time.perf_counter() - started
+                    if cursor is None:
+                        break
+                samples.append(elapsed) # Latency of the last page fetched
+                hits = len(messages)
+            results[name] = dict(common.percentiles(samples), results_on_page=hits)
+            print(f"{name:<12} p50={results[name]['p50']}ms p95={results[name]['p95']}ms "
+                  f"p99={results[name]['p99']}ms ({hits} results)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000000, help='Size of the synthetic corpus')
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--authors', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=365, help='Time span the messages are spread over')
+    parser.add_argument('--batch', type=int, default=10000, help='Rows per INSERT while seeding')
+    parser.add_argument('--queries', type=int, default=50, help='Searches timed per query kind')
+    parser.add_argument('--limit', type=int, default=20, help='Results per page')
+    parser.add_argument('--reseed', action='store_true', help='Delete existing messages and seed again')
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app('bench')
+    dialect = prepare(app, args)
+    results = measure(app, args)
+
+    path = common.write_results('search', {'args': vars(args), 'dialect': dialect, 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
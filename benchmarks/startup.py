@@ -0,0 +1,130 @@
+# benchmarks/startup.py
+"""Start-up time: importing the app, and gunicorn launch until /healthz and /readyz pass.
+
+Two measurements, each repeated `--runs` times:
+
+    import        a fresh interpreter running `import run` (eventlet patching,
+                  create_app and every module it loads); with --importtime-top
+                  the slowest imports made by run.py and the app package,
+                  from `python -X importtime`, are listed as well
+    boot          gunicorn with `--workers` eventlet workers, from launch until
+                  /healthz answers (the worker is serving) and until /readyz
+                  returns 200 (Redis and the database reachable)
+
+`--redis-down` points the app at a closed port instead of a local Redis. That
+shows the boot no longer blocks on it: /healthz still answers straight away
+while /readyz keeps returning 503.
+
+Usage (from the repo root, with Redis on localhost:6379):
+
+    python benchmarks/startup.py --runs 5 --workers 2
+    python benchmarks/startup.py --runs 3 --redis-down
+"""
+import argparse
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(__file__))
+import common  # noqa: E402
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import run; print(time.perf_counter() - t)"
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S.*)$')
+
+
+def time_import(env):
+    """Seconds a fresh interpreter spends on `import run`."""
+    result = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=common.REPO_ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(env, top, depth=2):
+    """The `top` slowest imports (cumulative ms) made by run.py (depth 1) and the modules it loads (depth 2)."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import run'], cwd=common.REPO_ROOT,
+                            env=env, capture_output=True, text=True, check=True)
+    totals = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match and 1 <= len(match.group(3)) // 2 <= depth: # importtime indents two spaces per level
+            totals.append((int(match.group(2)) / 1000, match.group(4)))
+    return [{'module': name, 'cumulative_ms': round(ms, 1)} for ms, name in sorted(totals, reverse=True)[:top]]
+
+def time_boot(env, workers, timeout):
+    """Launches gunicorn and returns seconds until /healthz and /readyz first return 200 (None if never)."""
+    port = common.free_port()
+    url = f"http://127.0.0.1:{port}"
+    gunicorn = shutil.which('gunicorn') or 'gunicorn'
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [gunicorn, '--worker-class', 'eventlet', '-w', str(workers), '--bind', f"127.0.0.1:{port}",
+         '--log-level', 'warning', 'run:app'],
+        cwd=common.REPO_ROOT, env=env)
+    reached = {'healthz': None, 'readyz': None}
+    last_status = None
+    try:
+        while time.monotonic() - started < timeout and None in reached.values():
+            for path in [name for name, at in reached.items() if at is None]:
+                try:
+                    response = requests.get(f"{url}/{path}", timeout=2)
+                except requests.RequestException:
+                    continue
+                if path == 'readyz':
+                    last_status = response.status_code
+                if response.status_code == 200:
+                    reached[path] = round(time.monotonic() - started, 3)
+            time.sleep(0.02)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return dict(reached, readyz_last_status=last_status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for /readyz per boot')
+    parser.add_argument('--importtime-top', type=int, default=10, help='Slowest imports to list (0: skip)')
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    parser.add_argument('--redis-down', action='store_true', help='Point the app at a closed port instead')
+    args = parser.parse_args()
+
+    redis_port = common.free_port() if args.redis_down else args.redis_port
+    env = common.bench_env(args.redis_host, redis_port)
+
+    imports = [time_import(env) for _ in range(args.runs)]
+    print(f"import run: {common.percentiles(imports)}")
+    boots = []
+    for run in range(args.runs):
+        boot = time_boot(env, args.workers, args.timeout)
+        boots.append(boot)
+        print(f"boot {run + 1}: healthz={boot['healthz']}s readyz={boot['readyz']}s "
+              f"(last /readyz status {boot['readyz_last_status']})")
+
+    results = {
+        'import_ms': common.percentiles(imports),
+        'healthz_ms': common.percentiles([b['healthz'] for b in boots if b['healthz'] is not None]),
+        'readyz_ms': common.percentiles([b['readyz'] for b in boots if b['readyz'] is not None]),
+        'boots': boots,
+    }
+    if args.importtime_top:
+        results['slowest_imports'] = slowest_imports(env, args.importtime_top)
+        for entry in results['slowest_imports']:
+            print(f"  {entry['cumulative_ms']:>8.1f}ms  {entry['module']}")
+
+    path = common.write_results('startup', {'args': vars(args), 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/wire_format.py
+"""Wire format benchmark: bytes per frame and CPU per broadcast for each CHAT_WIRE_FORMAT.
+
+Runs in-process, without Redis or a server: it replays the exact work
+python-socketio does for one `emit('chat_message', ..., to=room)` on a
+Redis-queued deployment with `--workers` workers and `--recipients` sockets
+in the room:
+
+    1. the sending worker prepares the payload (app/wire.py: a dict, or for
+       json-preencoded a compact JSON string) and publishes the emit to the
+       Redis queue as JSON
+    2. every other worker decodes that queue message
+    3. every worker encodes one Socket.IO packet (JSON or MessagePack) and one
+       Engine.IO frame, and writes that same frame to each local recipient
+
+Reported per format: frame bytes, bytes on the wire per broadcast (frame size
+x recipients), bytes on the Redis queue per broadcast, and CPU microseconds
+per broadcast summed over all workers (socket writes excluded).
+
+Usage:
+
+    python benchmarks/wire_format.py --workers 4 --recipients 500 --msg-bytes 120
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from engineio import packet as eio_packet
+from socketio import packet as sio_packet
+from socketio.msgpack_packet import MsgPackPacket
+
+sys.path.insert(0, os.path.dirname(__file__))
+import common  # noqa: E402
+
+FORMATS = ('json', 'json-preencoded', 'msgpack')
+
+
+def sample_message(msg_bytes):
+    """A chat_message payload shaped like the ones handle_new_message broadcasts."""
+    return {
+        'id': '1718000000000-0',
+        'ts': 1718000000.123,
+        'nickname': 'bench0001',
+        'msg': ('Lorem ipsum dolor sit amet, "consectetur" adipiscing elit. ' * 8)[:msg_bytes],
+        'color': '#3a7bd5',
+        'room': 'general_chat',
+    }
+
+def broadcast(wire, message, workers):
+    """One broadcast as python-socketio performs it. Returns (frame bytes, Redis bytes)."""
+    payload = json.dumps(message, separators=(',', ':')) if wire == 'json-preencoded' else message
+    data = [payload]
+    sio_packet.Packet.data_is_binary(data)
+    queued = json.dumps({'method': 'emit', 'event': 'chat_message', 'data': data, 'binary': False,
+                         'namespace': '/', 'room': message['room'], 'skip_sid': None,
+                         'callback': None, 'host_id': 'bench'})
+    packet_class = MsgPackPacket if wire == 'msgpack' else sio_packet.Packet
+    frame = None
+    for worker in range(workers):
+        envelope = json.loads(queued) if worker else {'data': data} # The sender handles its own emit directly
+        pkt = packet_class(sio_packet.EVENT, namespace='/', data=['chat_message'] + envelope['data'])
+        frame = eio_packet.Packet(eio_packet.MESSAGE, pkt.encode()).encode()
+    return len(frame), len(queued)
+
+def measure(wire, message, workers, recipients, iterations):
+    started = time.process_time()
+    for _ in range(iterations):
+        frame_bytes, queue_bytes = broadcast(wire, message, workers)
+    cpu = (time.process_time() - started) / iterations
+    return {
+        'wire_format': wire,
+        'frame_bytes': frame_bytes,
+        'wire_bytes_per_broadcast': frame_bytes * recipients,
+        'redis_bytes_per_broadcast': queue_bytes,
+        'cpu_us_per_broadcast': round(cpu * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='Workers sharing the Redis queue')
+    parser.add_argument('--recipients', type=int, default=500, help='Sockets in the room')
+    parser.add_argument('--msg-bytes', type=int, default=120, help='Length of the message text')
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    args = parser.parse_args()
+
+    message = sample_message(args.msg_bytes)
+    results = []
+    for wire in args.formats:
+        result = measure(wire, message, args.workers, args.recipients, args.iterations)
+        results.append(result)
+        print(f"{wire:<16} frame={result['frame_bytes']}B wire={result['wire_bytes_per_broadcast']}B "
+              f"redis={result['redis_bytes_per_broadcast']}B cpu={result['cpu_us_per_broadcast']}us/broadcast")
+
+    path = common.write_results('wire_format', {'args': vars(args), 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
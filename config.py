@@ -18,6 +18,120 @@ class Config:
     REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
     REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0" # For SocketIO queue
     REDIS_APP_DB_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/1" # For App data (e.g., online users)
+    # App Redis pool (app/pools.py): green threads wait up to REDIS_POOL_TIMEOUT for one of MAX_CONNECTIONS.
+    # REDIS_SOCKET_TIMEOUT must exceed blocking reads such as the mail queue's BRPOP (MAIL_QUEUE_POLL_INTERVAL).
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5.0))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 10.0))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 5.0))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30)) # Seconds idle before a PING
+    # Redis outages (app/resilience.py): the circuit opens after REDIS_BREAKER_FAILURES failures in a row and is
+    # probed after REDIS_BREAKER_MIN_DELAY seconds, doubling up to REDIS_BREAKER_MAX_DELAY. Meanwhile up to
+    # DEGRADED_BUFFER_SIZE unstored messages are kept in memory and written back once Redis is reachable
+    REDIS_BREAKER_FAILURES = int(os.environ.get('REDIS_BREAKER_FAILURES', 3))
+    REDIS_BREAKER_MIN_DELAY = float(os.environ.get('REDIS_BREAKER_MIN_DELAY', 0.5))
+    REDIS_BREAKER_MAX_DELAY = float(os.environ.get('REDIS_BREAKER_MAX_DELAY', 15.0))
+    DEGRADED_BUFFER_SIZE = int(os.environ.get('DEGRADED_BUFFER_SIZE', 5000))
+
+    # Socket.IO transport: websocket-only lets several workers/pods serve clients without sticky sessions
+    SOCKETIO_WEBSOCKET_ONLY = os.environ.get('SOCKETIO_WEBSOCKET_ONLY', 'true').lower() in ['true', 'on', '1']
+
+    # Socket.IO wire format (app/wire.py): 'json', 'json-preencoded' (chat payloads JSON-encoded once, at the
+    # sending worker) or 'msgpack' (binary MessagePack packets; pages load the matching client build)
+    CHAT_WIRE_FORMAT = os.environ.get('CHAT_WIRE_FORMAT', 'json').lower()
+
+    # Seconds browsers may cache fingerprinted /assets/ files (app/assets.py); they are never revalidated
+    ASSET_CACHE_MAX_AGE = int(os.environ.get('ASSET_CACHE_MAX_AGE', 31536000))
+
+    # Probes (app/health.py): /readyz checks Redis and the database, each within HEALTH_CHECK_TIMEOUT
+    # seconds, and reuses the result for READINESS_CACHE_SECONDS. STARTUP_WARMUP connects in the
+    # background at boot, retrying until both answer.
+    HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', 2.0))
+    READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', 2.0))
+    STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'true').lower() in ['true', 'on', '1']
+
+    # Messages pushed to a client joining a room; older ones are fetched over HTTP in pages of HISTORY_PAGE_SIZE
+    HISTORY_TAIL_SIZE = int(os.environ.get('HISTORY_TAIL_SIZE', 20))
+    HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+    # Full history pages never change: seconds browsers/ingress may keep them (app/api.py).
+    # PUBLIC lets shared caches store them; only enable it if the ingress checks the login itself.
+    HISTORY_PAGE_MAX_AGE = int(os.environ.get('HISTORY_PAGE_MAX_AGE', 31536000))
+    HISTORY_PAGES_PUBLIC = os.environ.get('HISTORY_PAGES_PUBLIC', 'false').lower() in ['true', 'on', '1']
+
+    # Chat history snapshot: max seconds a worker reuses its cached history before re-reading Redis.
+    # Other workers' writes invalidate it over pub/sub right away; the age cap is only a safety net.
+    HISTORY_SNAPSHOT_MAX_AGE = float(os.environ.get('HISTORY_SNAPSHOT_MAX_AGE', 30.0))
+    # Max number of rooms whose history snapshot a worker keeps in memory (least recently used evicted)
+    HISTORY_SNAPSHOT_ROOMS = int(os.environ.get('HISTORY_SNAPSHOT_ROOMS', 256))
+    # Approximate number of messages kept per room stream (older ones are trimmed by XADD MAXLEN ~)
+    MESSAGE_STREAM_MAXLEN = int(os.environ.get('MESSAGE_STREAM_MAXLEN', 10000))
+
+    # User profile cache used by Flask-Login's user loader (app/user_cache.py)
+    USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024)) # Users kept per worker (LRU)
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60.0)) # Seconds a worker trusts its local copy
+    USER_CACHE_REDIS_TTL = int(os.environ.get('USER_CACHE_REDIS_TTL', 300)) # Seconds the shared Redis copy lives
+
+    # Rendered-page cache for the landing and about pages (app/page_cache.py)
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 256)) # Pages kept per worker (LRU)
+    PAGE_CACHE_REDIS_TTL = int(os.environ.get('PAGE_CACHE_REDIS_TTL', 300)) # Seconds the shared copy lives (0: local only)
+
+    # Password hashing pool: PBKDF2 runs in this many native threads, with at most QUEUE_LIMIT requests waiting
+    PASSWORD_HASH_OFFLOAD = os.environ.get('PASSWORD_HASH_OFFLOAD', 'true').lower() in ['true', 'on', '1']
+    PASSWORD_HASH_THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', 2))
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', 32))
+
+    # Rate limits as "burst/rate": up to `burst` actions at once, refilling `rate` per second (app/rate_limit.py)
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RATE_LIMIT_MESSAGE_USER = os.environ.get('RATE_LIMIT_MESSAGE_USER', '10/2') # Messages per user
+    RATE_LIMIT_MESSAGE_ROOM = os.environ.get('RATE_LIMIT_MESSAGE_ROOM', '200/50') # Messages per room, all users
+    RATE_LIMIT_COLOR_USER = os.environ.get('RATE_LIMIT_COLOR_USER', '5/0.1') # Color changes per user
+    RATE_LIMIT_SEARCH_USER = os.environ.get('RATE_LIMIT_SEARCH_USER', '10/1') # /search requests per user
+    RATE_LIMIT_DM_USER = os.environ.get('RATE_LIMIT_DM_USER', '10/2') # Direct messages per user
+
+    # Write-behind message persistence: flush when a batch reaches MAX_BATCH messages or FLUSH_MS after its first
+    WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'true').lower() in ['true', 'on', '1']
+    WRITE_BEHIND_MAX_BATCH = int(os.environ.get('WRITE_BEHIND_MAX_BATCH', 64))
+    WRITE_BEHIND_FLUSH_MS = float(os.environ.get('WRITE_BEHIND_FLUSH_MS', 5))
+
+    # Postgres message archive (app/archive.py): the lease holder copies up to BATCH_SIZE messages per
+    # INTERVAL seconds (back to back while there is a backlog) and keeps monthly partitions MONTHS_AHEAD ahead
+    ARCHIVE_ENABLED = os.environ.get('ARCHIVE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 2000))
+    ARCHIVE_ROOMS_PER_BATCH = int(os.environ.get('ARCHIVE_ROOMS_PER_BATCH', 200))
+    ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 1.0))
+    ARCHIVE_LEASE_TTL = int(os.environ.get('ARCHIVE_LEASE_TTL', 30))
+    ARCHIVE_PARTITION_MONTHS_AHEAD = int(os.environ.get('ARCHIVE_PARTITION_MONTHS_AHEAD', 3))
+
+    # Message search API (/search, app/search.py)
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 20)) # Results per page unless ?limit= asks for fewer/more
+    SEARCH_PAGE_MAX = int(os.environ.get('SEARCH_PAGE_MAX', 50))
+
+    # Broadcast micro-batching (app/broadcast.py): messages to a room within BROADCAST_BATCH_WINDOW_MS of its
+    # last broadcast go out together as one chat_batch frame (at most BROADCAST_BATCH_MAX per frame)
+    BROADCAST_BATCH_ENABLED = os.environ.get('BROADCAST_BATCH_ENABLED', 'false').lower() in ['true', 'on', '1']
+    BROADCAST_BATCH_WINDOW_MS = float(os.environ.get('BROADCAST_BATCH_WINDOW_MS', 30))
+    BROADCAST_BATCH_MAX = int(os.environ.get('BROADCAST_BATCH_MAX', 50))
+
+    # Direct messages (app/direct_messages.py): approximate cap on each conversation's stream
+    DM_HISTORY_MAXLEN = int(os.environ.get('DM_HISTORY_MAXLEN', 1000))
+
+    # Typing indicators (app/typing_status.py): changes are sent as one typing_update per room every
+    # TYPING_TICK_MS; a typist not refreshed within TYPING_TTL seconds drops off
+    TYPING_ENABLED = os.environ.get('TYPING_ENABLED', 'true').lower() in ['true', 'on', '1']
+    TYPING_TICK_MS = int(os.environ.get('TYPING_TICK_MS', 500))
+    TYPING_TTL = float(os.environ.get('TYPING_TTL', 6.0))
+
+    # Presence self-healing: worker heartbeat TTL/refresh and how often dead workers' SIDs are reaped (seconds)
+    PRESENCE_NODE_TTL = int(os.environ.get('PRESENCE_NODE_TTL', 30))
+    PRESENCE_HEARTBEAT_INTERVAL = float(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL', 10))
+    PRESENCE_REAPER_INTERVAL = float(os.environ.get('PRESENCE_REAPER_INTERVAL', 30))
+
+    # Shared secret for /ops/* and /metrics (sent as X-Ops-Token or a Bearer token). Unset means only
+    # loopback clients get in, unless OPS_ALLOW_UNAUTHENTICATED opens them to everyone
+    OPS_TOKEN = os.environ.get('OPS_TOKEN')
+    OPS_ALLOW_UNAUTHENTICATED = os.environ.get('OPS_ALLOW_UNAUTHENTICATED', 'false').lower() in ['true', 'on', '1']
 
     # Database Config (can be overridden)
     DB_USER = os.environ.get('DB_USER', 'postgres')
@@ -26,6 +140,15 @@ class Config:
     DB_NAME = os.environ.get('DB_NAME', 'chat_db')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
+    # Postgres pool per worker (app/pools.py): SIZE kept open, up to MAX_OVERFLOW more, TIMEOUT seconds of waiting
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10.0))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800)) # Seconds before a connection is replaced
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1']
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 5))
+    # Behind PgBouncer in transaction mode: keep no local pool and let PgBouncer do the pooling
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() in ['true', 'on', '1']
     
     # --- NEW: Flask-Mail Configuration for SendGrid ---
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.sendgrid.net')
@@ -34,12 +157,26 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME', 'apikey') # SendGrid uses 'apikey' literally
     MAIL_PASSWORD = os.environ.get('SENDGRID_API_KEY') # Use a specific env var name
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@yourdomain.com') # IMPORTANT: Use an email address from a domain you configure/verify in SendGrid
+    # Outbound email queue (app/mail_queue.py): emails are sent by a background task, not in the request
+    MAIL_QUEUE_ENABLED = os.environ.get('MAIL_QUEUE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    MAIL_QUEUE_BATCH_SIZE = int(os.environ.get('MAIL_QUEUE_BATCH_SIZE', 20)) # Emails sent per SMTP connection
+    MAIL_QUEUE_POLL_INTERVAL = float(os.environ.get('MAIL_QUEUE_POLL_INTERVAL', 5)) # Seconds between retry checks when idle
+    MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 5)) # Then the email is dead-lettered
+    MAIL_RETRY_BASE_DELAY = float(os.environ.get('MAIL_RETRY_BASE_DELAY', 30)) # Seconds; doubles on every attempt
 
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
     LOGGING_LEVEL = logging.DEBUG
 
+class BenchmarkConfig(Config):
+    """Configuration for the local benchmarks in benchmarks/ (SQLite, no CSRF on the login form)."""
+    DEBUG = False
+    LOGGING_LEVEL = logging.WARNING
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL') or \
+        f"sqlite:///{os.path.join(basedir, 'bench.db')}"
+
 class ProductionConfig(Config):
     """Production configuration."""
     DEBUG = False
@@ -50,6 +187,7 @@ class ProductionConfig(Config):
 config_by_name = dict(
     dev=DevelopmentConfig,
     prod=ProductionConfig,
+    bench=BenchmarkConfig,
     default=DevelopmentConfig
 )
 
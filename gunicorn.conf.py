@@ -0,0 +1,10 @@
+# gunicorn.conf.py
+# Gunicorn loads this file automatically from the working directory.
+import os
+
+
+def child_exit(server, worker):
+    """Drops an exited worker's live gauges from the shared Prometheus files (see app/metrics.py)."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,61 @@
+"""Add messages archive table
+
+Revision ID: b7d41c9e2a50
+Revises: 631e91cddb3a
+Create Date: 2026-10-17 12:00:00
+
+"""
+import datetime
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41c9e2a50' # Make sure this matches your filename
+down_revision = '631e91cddb3a' # Make sure this matches the previous revision
+branch_labels = None
+depends_on = None
+
+
+def _month_start(day, months_ahead=0):
+    month = day.month - 1 + months_ahead
+    return datetime.date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Range-partitioned by month; the archiver (app/archive.py) keeps future partitions created
+        op.execute("""
+            CREATE TABLE messages (
+                room VARCHAR(32) NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                seq INTEGER NOT NULL,
+                nickname VARCHAR(80) NOT NULL,
+                color VARCHAR(7) NOT NULL,
+                body TEXT NOT NULL,
+                archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                PRIMARY KEY (room, created_at, seq)
+            ) PARTITION BY RANGE (created_at)
+        """)
+        # Catches rows outside the monthly partitions (e.g. legacy messages migrated with 1970 stream IDs)
+        op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+        today = datetime.date.today()
+        for offset in range(2): # This month and the next
+            start, end = _month_start(today, offset), _month_start(today, offset + 1)
+            op.execute(f"CREATE TABLE messages_p{start:%Y_%m} PARTITION OF messages "
+                       f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+    else:
+        op.create_table('messages',
+            sa.Column('room', sa.String(length=32), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('seq', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('nickname', sa.String(length=80), nullable=False),
+            sa.Column('color', sa.String(length=7), nullable=False),
+            sa.Column('body', sa.Text(), nullable=False),
+            sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+            sa.PrimaryKeyConstraint('room', 'created_at', 'seq')
+        )
+
+
+def downgrade():
+    # Dropping the parent also drops all of its partitions
+    op.drop_table('messages')
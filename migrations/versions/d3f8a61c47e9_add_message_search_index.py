@@ -0,0 +1,33 @@
+"""Add full-text search index to messages
+
+Revision ID: d3f8a61c47e9
+Revises: b7d41c9e2a50
+Create Date: 2026-10-17 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8a61c47e9' # Make sure this matches your filename
+down_revision = 'b7d41c9e2a50' # Make sure this matches the previous revision
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Author filter of the search API (app/search.py); on Postgres also created on every partition
+    op.create_index('ix_messages_nickname_created_at', 'messages', ['nickname', 'created_at'])
+    if op.get_bind().dialect.name != 'postgresql':
+        return # No text index outside Postgres: search falls back to LIKE
+    # Text search config 'english' must match TEXT_SEARCH_CONFIG in app/search.py
+    op.execute("ALTER TABLE messages ADD COLUMN search_vector tsvector "
+               "GENERATED ALWAYS AS (to_tsvector('english', body)) STORED")
+    op.execute("CREATE INDEX ix_messages_search_vector ON messages USING GIN (search_vector)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_messages_search_vector")
+        op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
+    op.drop_index('ix_messages_nickname_created_at', table_name='messages')